@@ -32,7 +32,7 @@ class Model(object):
     """
     def __init__(self, policy, env, nsteps,
             ent_coef=0.01, vf_coef=0.5, max_grad_norm=0.5, lr=7e-4,
-            alpha=0.99, epsilon=1e-5, total_timesteps=int(80e6), lrschedule='linear'):
+            alpha=0.99, epsilon=1e-5, total_timesteps=int(80e6), lrschedule='linear', double_buffer=False):
 
         sess = tf_util.get_session()
         nenvs = env.num_envs
@@ -40,8 +40,8 @@ class Model(object):
 
 
         with tf.variable_scope('a2c_model', reuse=tf.AUTO_REUSE):
-            # step_model is used for sampling
-            step_model = policy(nenvs, 1, sess)
+            # step_model is used for sampling, on half of the envs at a time with double_buffer
+            step_model = policy(None if double_buffer else nenvs, 1, sess)
 
             # train_model is used to train our network
             train_model = policy(nbatch, nsteps, sess)
@@ -132,6 +132,7 @@ def learn(
     gamma=0.99,
     log_interval=100,
     load_path=None,
+    double_buffer=False,
     **network_kwargs):
 
     '''
@@ -176,6 +177,9 @@ def learn(
 
     log_interval:       int, specifies how frequently the logs are printed out (default: 100)
 
+    double_buffer:      bool, compute the actions of one half of the envs while the other half steps (default: False).
+                        Needs an AsyncSubprocVecEnv and a feed-forward policy
+
     **network_kwargs:   keyword arguments to the policy / network builder. See baselines.common/policies.py/build_policy and arguments to a particular type of network
                         For instance, 'mlp' network architecture has arguments num_hidden and num_layers.
 
@@ -191,12 +195,13 @@ def learn(
 
     # Instantiate the model object (that creates step_model and train_model)
     model = Model(policy=policy, env=env, nsteps=nsteps, ent_coef=ent_coef, vf_coef=vf_coef,
-        max_grad_norm=max_grad_norm, lr=lr, alpha=alpha, epsilon=epsilon, total_timesteps=total_timesteps, lrschedule=lrschedule)
+        max_grad_norm=max_grad_norm, lr=lr, alpha=alpha, epsilon=epsilon, total_timesteps=total_timesteps, lrschedule=lrschedule,
+        double_buffer=double_buffer)
     if load_path is not None:
         model.load(load_path)
 
     # Instantiate the runner object
-    runner = Runner(env, model, nsteps=nsteps, gamma=gamma)
+    runner = Runner(env, model, nsteps=nsteps, gamma=gamma, double_buffer=double_buffer)
     epinfobuf = deque(maxlen=100)
 
     # Calculate the batch_size
@@ -1,6 +1,6 @@
 import numpy as np
-from baselines.a2c.utils import discount_with_dones
-from baselines.common.runners import AbstractEnvRunner
+from baselines.common.math_util import discounted_returns
+from baselines.common.runners import AbstractEnvRunner, RolloutStorage
 
 class Runner(AbstractEnvRunner):
     """
@@ -12,65 +12,54 @@ class Runner(AbstractEnvRunner):
     run():
     - Make a mini batch of experiences
     """
-    def __init__(self, env, model, nsteps=5, gamma=0.99):
-        super().__init__(env=env, model=model, nsteps=nsteps)
+    def __init__(self, env, model, nsteps=5, gamma=0.99, double_buffer=False):
+        super().__init__(env=env, model=model, nsteps=nsteps, double_buffer=double_buffer)
         self.gamma = gamma
         self.batch_action_shape = [x if x is not None else -1 for x in model.train_model.action.shape.as_list()]
         self.ob_dtype = model.train_model.X.dtype.as_numpy_dtype
+        # masks are the dones before each step, dones the ones after it
+        self.storage = RolloutStorage(self.nenv, nsteps, {
+            'obs': (env.observation_space.shape, self.ob_dtype),
+            'rewards': ((), np.float32),
+            'actions': (self.batch_action_shape[1:], model.train_model.action.dtype.name),
+            'values': ((), np.float32),
+            'masks': ((), bool),
+            'dones': ((), bool),
+        })
 
     def run(self):
-        # We initialize the lists that will contain the mb of experiences
-        mb_obs, mb_rewards, mb_actions, mb_values, mb_dones = [],[],[],[],[]
+        # The mb of experiences are written in place in the storage
+        storage = self.storage
         mb_states = self.states
-        epinfos = []
-        for n in range(self.nsteps):
-            # Given observations, take action and value (V(s))
-            # We already have self.obs because Runner superclass run self.obs[:] = env.reset() on init
-            actions, values, states, _ = self.model.step(self.obs, S=self.states, M=self.dones)
+        if self.double_buffer:
+            epinfos = self._rollout_double_buffered(storage, masks='masks', dones='dones')
+        else:
+            epinfos = []
+            for n in range(self.nsteps):
+                # Given observations, take action and value (V(s))
+                # We already have self.obs because Runner superclass run self.obs[:] = env.reset() on init
+                actions, values, states, _ = self.model.step(self.obs, S=self.states, M=self.dones)
 
-            # Append the experiences
-            mb_obs.append(np.copy(self.obs))
-            mb_actions.append(actions)
-            mb_values.append(values)
-            mb_dones.append(self.dones)
+                # Store the experiences
+                storage.put(n, obs=self.obs, actions=actions, values=values, masks=self.dones)
 
-            # Take actions in env and look the results
-            obs, rewards, dones, infos = self.env.step(actions)
-            for info in infos:
-                maybeepinfo = info.get('episode')
-                if maybeepinfo: epinfos.append(maybeepinfo)
-            self.states = states
-            self.dones = dones
-            self.obs = obs
-            mb_rewards.append(rewards)
-        mb_dones.append(self.dones)
-
-        # Batch of steps to batch of rollouts
-        mb_obs = np.asarray(mb_obs, dtype=self.ob_dtype).swapaxes(1, 0).reshape(self.batch_ob_shape)
-        mb_rewards = np.asarray(mb_rewards, dtype=np.float32).swapaxes(1, 0)
-        mb_actions = np.asarray(mb_actions, dtype=self.model.train_model.action.dtype.name).swapaxes(1, 0)
-        mb_values = np.asarray(mb_values, dtype=np.float32).swapaxes(1, 0)
-        mb_dones = np.asarray(mb_dones, dtype=np.bool).swapaxes(1, 0)
-        mb_masks = mb_dones[:, :-1]
-        mb_dones = mb_dones[:, 1:]
+                # Take actions in env and look the results
+                obs, rewards, dones, infos = self.env.step(actions)
+                for info in infos:
+                    maybeepinfo = info.get('episode')
+                    if maybeepinfo: epinfos.append(maybeepinfo)
+                self.states = states
+                self.dones = dones
+                self.obs = obs
+                storage.put(n, rewards=rewards, dones=dones)
 
+        mb_rewards, mb_dones = storage.rewards, storage.dones
 
         if self.gamma > 0.0:
-            # Discount/bootstrap off value fn
-            last_values = self.model.value(self.obs, S=self.states, M=self.dones).tolist()
-            for n, (rewards, dones, value) in enumerate(zip(mb_rewards, mb_dones, last_values)):
-                rewards = rewards.tolist()
-                dones = dones.tolist()
-                if dones[-1] == 0:
-                    rewards = discount_with_dones(rewards+[value], dones+[0], self.gamma)[:-1]
-                else:
-                    rewards = discount_with_dones(rewards, dones, self.gamma)
-
-                mb_rewards[n] = rewards
-
-        mb_actions = mb_actions.reshape(self.batch_action_shape)
+            # Discount/bootstrap off value fn, all envs at once and in place
+            last_values = self.model.value(self.obs, S=self.states, M=self.dones)
+            discounted_returns(mb_rewards, mb_dones, self.gamma, last_values=last_values, out=mb_rewards)
 
-        mb_rewards = mb_rewards.flatten()
-        mb_values = mb_values.flatten()
-        mb_masks = mb_masks.flatten()
-        return mb_obs, mb_states, mb_rewards, mb_masks, mb_actions, mb_values, epinfos
+        mb_obs = storage.flat('obs')
+        mb_actions = storage.flat('actions').reshape(self.batch_action_shape)
+        return mb_obs, mb_states, storage.flat('rewards'), storage.flat('masks'), mb_actions, storage.flat('values'), epinfos
@@ -1,4 +1,5 @@
 import numpy as np
+from baselines.common.buffer_io import save_arrays, load_arrays
 
 class Buffer(object):
     # gets obs, actions, rewards, mu's, (states, masks), dones
@@ -67,6 +68,23 @@ class Buffer(object):
         self.next_idx = (self.next_idx + 1) % self.size
         self.num_in_buffer = min(self.size, self.num_in_buffer + 1)
 
+    def save(self, path, compress=False):
+        # see baselines.common.buffer_io
+        names = ['enc_obs', 'actions', 'rewards', 'mus', 'dones', 'masks']
+        arrays = [] if self.enc_obs is None else [(name, getattr(self, name)[:self.num_in_buffer]) for name in names]
+        meta = {'size': self.size, 'next_idx': self.next_idx, 'num_in_buffer': self.num_in_buffer}
+        save_arrays(path, arrays, meta, compress=compress)
+
+    def load(self, path):
+        def allocate(name, shape, dtype):
+            setattr(self, name, np.empty([self.size] + list(shape[1:]), dtype=dtype))
+            return getattr(self, name)[:shape[0]]
+
+        meta, _ = load_arrays(path, allocate)
+        assert meta['size'] == self.size, "the buffer was saved with a different size"
+        self.next_idx = meta['next_idx']
+        self.num_in_buffer = meta['num_in_buffer']
+
     def take(self, x, idx, envx):
         nenv = self.nenv
         out = np.empty([nenv] + list(x.shape[2:]), dtype=x.dtype)
@@ -154,3 +172,33 @@ def test_stack_obs():
     stacked_obs_test = _stack_obs(enc_obs, dones, nsteps=nsteps)
 
     np.testing.assert_allclose(stacked_obs_ref, stacked_obs_test)
+
+def test_buffer_save_load(tmpdir):
+    from types import SimpleNamespace
+
+    nenv, nsteps, nstack, nact = 2, 3, 4, 5
+    env = SimpleNamespace(num_envs=nenv, nstack=nstack,
+                          observation_space=SimpleNamespace(shape=(2, 2, nstack), dtype=np.dtype(np.uint8)),
+                          action_space=SimpleNamespace(dtype=np.dtype(np.int32)))
+    buffer = Buffer(env, nsteps, size=4 * nsteps)
+    # more rollouts than fit, so that the ring buffer wraps around
+    for i in range(6):
+        buffer.put(np.random.randint(0, 256, size=(nenv, nsteps + nstack, 2, 2, 1)).astype(np.uint8),
+                   np.random.randint(0, nact, size=(nenv, nsteps)),
+                   np.random.randn(nenv, nsteps),
+                   np.random.random((nenv, nsteps, nact)),
+                   np.random.random((nenv, nsteps)) < 0.3,
+                   np.random.random((nenv, nsteps)) < 0.3)
+
+    path = str(tmpdir.join('buffer'))
+    buffer.save(path, compress=True)
+    expected = buffer.get()
+    restored = Buffer(env, nsteps, size=4 * nsteps)
+    restored.load(path)
+
+    assert (restored.next_idx, restored.num_in_buffer) == (buffer.next_idx, buffer.num_in_buffer)
+    for name in ['enc_obs', 'actions', 'rewards', 'mus', 'dones', 'masks']:
+        np.testing.assert_array_equal(getattr(buffer, name), getattr(restored, name))
+    # the random state of the sampler is restored as well
+    for expected_arr, arr in zip(expected, restored.get()):
+        np.testing.assert_array_equal(expected_arr, arr)
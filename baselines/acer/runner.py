@@ -1,5 +1,5 @@
 import numpy as np
-from baselines.common.runners import AbstractEnvRunner
+from baselines.common.runners import AbstractEnvRunner, RolloutStorage, space_spec
 from baselines.common.vec_env.vec_frame_stack import VecFrameStack
 from gym import spaces
 
@@ -21,41 +21,39 @@ class Runner(AbstractEnvRunner):
         self.ac_dtype = env.action_space.dtype
         self.nstack = self.env.nstack
         self.nc = self.batch_ob_shape[-1] // self.nstack
+        # enc_obs holds the nstack frames before the first step, then the new frame of each step;
+        # obs and dones also hold their values after the last step
+        ob_shape = env.observation_space.shape
+        self.storage = RolloutStorage(nenv, nsteps, {
+            'enc_obs': (ob_shape[:-1] + (self.nc,), self.obs_dtype, nsteps + self.nstack),
+            'obs': (ob_shape, self.obs_dtype, nsteps + 1),
+            'actions': space_spec(env.action_space),
+            'mus': ((self.nact,), np.float32),
+            'rewards': ((), np.float32),
+            'dones': ((), bool, nsteps + 1),
+        })
 
 
     def run(self):
-        # enc_obs = np.split(self.obs, self.nstack, axis=3)  # so now list of obs steps
-        enc_obs = np.split(self.env.stackedobs, self.env.nstack, axis=-1)
-        mb_obs, mb_actions, mb_mus, mb_dones, mb_rewards = [], [], [], [], []
-        for _ in range(self.nsteps):
+        storage = self.storage
+        for i, frame in enumerate(np.split(self.env.stackedobs, self.nstack, axis=-1)):
+            storage.put(i, enc_obs=frame)
+        for t in range(self.nsteps):
             actions, mus, states = self.model._step(self.obs, S=self.states, M=self.dones)
-            mb_obs.append(np.copy(self.obs))
-            mb_actions.append(actions)
-            mb_mus.append(mus)
-            mb_dones.append(self.dones)
+            storage.put(t, obs=self.obs, actions=actions, mus=mus, dones=self.dones)
             obs, rewards, dones, _ = self.env.step(actions)
             # states information for statefull models like LSTM
             self.states = states
             self.dones = dones
             self.obs = obs
-            mb_rewards.append(rewards)
-            enc_obs.append(obs[..., -self.nc:])
-        mb_obs.append(np.copy(self.obs))
-        mb_dones.append(self.dones)
+            storage.put(t, rewards=rewards)
+            storage.put(self.nstack + t, enc_obs=obs[..., -self.nc:])
+        storage.put(self.nsteps, obs=self.obs, dones=self.dones)
 
-        enc_obs = np.asarray(enc_obs, dtype=self.obs_dtype).swapaxes(1, 0)
-        mb_obs = np.asarray(mb_obs, dtype=self.obs_dtype).swapaxes(1, 0)
-        mb_actions = np.asarray(mb_actions, dtype=self.ac_dtype).swapaxes(1, 0)
-        mb_rewards = np.asarray(mb_rewards, dtype=np.float32).swapaxes(1, 0)
-        mb_mus = np.asarray(mb_mus, dtype=np.float32).swapaxes(1, 0)
-
-        mb_dones = np.asarray(mb_dones, dtype=np.bool).swapaxes(1, 0)
-
-        mb_masks = mb_dones # Used for statefull models like LSTM's to mask state when done
-        mb_dones = mb_dones[:, 1:] # Used for calculating returns. The dones array is now aligned with rewards
+        mb_masks = storage.dones # Used for statefull models like LSTM's to mask state when done
+        mb_dones = storage.dones[:, 1:] # Used for calculating returns. The dones array is now aligned with rewards
 
         # shapes are now [nenv, nsteps, []]
-        # When pulling from buffer, arrays will now be reshaped in place, preventing a deep copy.
-
-        return enc_obs, mb_obs, mb_actions, mb_rewards, mb_mus, mb_dones, mb_masks
+        # The arrays are views of the storage, which the next call to run overwrites.
 
+        return storage.enc_obs, storage.obs, storage.actions, storage.rewards, storage.mus, mb_dones, mb_masks
@@ -7,19 +7,26 @@ from glob import glob
 import csv
 import os.path as osp
 import json
+import weakref
 import numpy as np
 
 class Monitor(Wrapper):
     EXT = "monitor.csv"
     f = None
 
-    def __init__(self, env, filename, allow_early_resets=False, reset_keywords=(), info_keywords=()):
+    def __init__(self, env, filename, allow_early_resets=False, reset_keywords=(), info_keywords=(),
+                 flush_rows=1, flush_secs=10.):
+        """
+        Every episode is written to filename as it ends. Larger flush_rows buffer
+        the rows, see ResultsWriter.
+        """
         Wrapper.__init__(self, env=env)
         self.tstart = time.time()
         if filename:
             self.results_writer = ResultsWriter(filename,
                 header={"t_start": time.time(), 'env_id' : env.spec and env.spec.id},
-                extra_keys=reset_keywords + info_keywords
+                extra_keys=reset_keywords + info_keywords,
+                flush_rows=flush_rows, flush_secs=flush_secs
             )
         else:
             self.results_writer = None
@@ -79,8 +86,9 @@ class Monitor(Wrapper):
         self.total_steps += 1
 
     def close(self):
-        if self.f is not None:
-            self.f.close()
+        if self.results_writer is not None:
+            self.results_writer.close()
+        return self.env.close()
 
     def get_total_steps(self):
         return self.total_steps
@@ -99,7 +107,18 @@ class LoadMonitorResultsError(Exception):
 
 
 class ResultsWriter(object):
-    def __init__(self, filename, header='', extra_keys=()):
+    def __init__(self, filename, header='', extra_keys=(), flush_rows=1, flush_secs=10.):
+        """
+        By default every row is written as soon as it comes. With flush_rows > 1, the
+        rows are buffered and written to the file once flush_rows of them are
+        buffered, or when a row comes flush_secs seconds or more after the last write.
+        The remaining rows are written by close, or when the writer is garbage
+        collected or the interpreter exits.
+
+        A process killed before any of these (e.g. a vec env worker, killed with its
+        parent) loses its buffered rows: fewer than flush_rows episodes, which all
+        ended less than flush_secs after the last write.
+        """
         self.extra_keys = extra_keys
         assert filename is not None
         if not filename.endswith(Monitor.EXT):
@@ -114,11 +133,36 @@ class ResultsWriter(object):
         self.logger = csv.DictWriter(self.f, fieldnames=('r', 'l', 't')+tuple(extra_keys))
         self.logger.writeheader()
         self.f.flush()
+        self.flush_rows = flush_rows
+        self.flush_secs = flush_secs
+        self.rows = []
+        self.last_flush = time.time()
+        self._close = weakref.finalize(self, ResultsWriter._write_rows, self.f, self.logger, self.rows, True)
 
     def write_row(self, epinfo):
-        if self.logger:
-            self.logger.writerow(epinfo)
-            self.f.flush()
+        self.write_rows([epinfo])
+
+    def write_rows(self, epinfos):
+        self.rows.extend(epinfos)
+        if len(self.rows) >= self.flush_rows or time.time() - self.last_flush >= self.flush_secs:
+            self.flush()
+
+    def flush(self):
+        ResultsWriter._write_rows(self.f, self.logger, self.rows)
+        self.last_flush = time.time()
+
+    def close(self):
+        self._close()
+
+    @staticmethod
+    def _write_rows(f, logger, rows, close=False):
+        # a static method, so that the finalizer does not keep the writer alive
+        if rows:
+            logger.writerows(rows)
+            del rows[:]
+        f.flush()
+        if close:
+            f.close()
 
 
 def get_monitor_files(dir):
@@ -173,6 +217,7 @@ def test_monitor():
         _, _, done, _ = menv.step(0)
         if done:
             menv.reset()
+    menv.close()
 
     f = open(mon_file, 'rt')
 
@@ -186,3 +231,25 @@ def test_monitor():
     assert set(last_logline.keys()) == {'l', 't', 'r'}, "Incorrect keys in monitor logline"
     f.close()
     os.remove(mon_file)
+
+def test_results_writer_flush(tmpdir):
+    mon_file = str(tmpdir.join('test.monitor.csv'))
+
+    def num_rows_on_disk():
+        with open(mon_file, 'rt') as f:
+            return len(f.readlines()) - 2  # json header and csv header
+
+    writer = ResultsWriter(mon_file, header={'t_start': 0}, flush_rows=3, flush_secs=3600.)
+    writer.write_rows([{'r': 1, 'l': 1, 't': 0}] * 2)
+    assert num_rows_on_disk() == 0
+    writer.write_row({'r': 1, 'l': 1, 't': 0})
+    assert num_rows_on_disk() == 3
+    writer.write_row({'r': 1, 'l': 1, 't': 0})
+    writer.close()
+    assert num_rows_on_disk() == 4
+
+    # rows are written at once if flush_secs have passed since the last write
+    writer = ResultsWriter(mon_file, header={'t_start': 0}, flush_rows=100, flush_secs=0.)
+    writer.write_row({'r': 1, 'l': 1, 't': 0})
+    assert num_rows_on_disk() == 1
+    writer.close()
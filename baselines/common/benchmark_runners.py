@@ -0,0 +1,49 @@
+"""
+Benchmark the double-buffered rollout of the on-policy runners against the sequential one.
+
+The envs spend step_ms milliseconds of CPU time per step in their subprocesses, and the
+policy a matrix product per observation in the main process, so that the double-buffered
+runner can overlap the two.
+"""
+import argparse
+import time
+
+
+def benchmark(runner, num_rollouts):
+    runner.run()  # warm up
+    tstart = time.perf_counter()
+    for _ in range(num_rollouts):
+        runner.run()
+    return (time.perf_counter() - tstart) / num_rollouts
+
+
+def main():
+    from baselines.common.tests.runner_util import CountingEnv, LinearModel
+    from baselines.common.vec_env import SubprocVecEnv, AsyncSubprocVecEnv
+    from baselines.ppo2.runner import Runner
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--num-envs', type=int, default=8)
+    parser.add_argument('--nsteps', type=int, default=128)
+    parser.add_argument('--num-rollouts', type=int, default=5)
+    parser.add_argument('--step-ms', type=float, default=1.)
+    parser.add_argument('--ob-size', type=int, default=512)
+    parser.add_argument('--hidden-size', type=int, default=2048)
+    args = parser.parse_args()
+
+    env_fns = [lambda seed=seed: CountingEnv(seed, args.ob_size, args.step_ms) for seed in range(args.num_envs)]
+    model = LinearModel(args.ob_size, args.hidden_size)
+    for name, make_venv, double_buffer in [('sequential', SubprocVecEnv, False),
+                                           ('double-buffered', AsyncSubprocVecEnv, True)]:
+        venv = make_venv(env_fns)
+        try:
+            runner = Runner(env=venv, model=model, nsteps=args.nsteps, gamma=0.99, lam=0.95, double_buffer=double_buffer)
+            rollout_time = benchmark(runner, args.num_rollouts)
+        finally:
+            venv.close()
+        print('{:>16}: {:8.1f} ms/rollout, {:8.0f} steps/s'.format(
+            name, 1e3 * rollout_time, args.num_envs * args.nsteps / rollout_time))
+
+
+if __name__ == '__main__':
+    main()
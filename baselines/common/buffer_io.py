@@ -0,0 +1,118 @@
+"""
+Binary snapshots of replay buffers.
+
+A snapshot file starts with a magic string, the length of a json header
+and the header itself, which holds the metadata of the buffer (cursor,
+size, ...), the state of the random number generators and the name, shape
+and dtype of every array. The raw bytes of the arrays follow in the order
+of the header. Arrays are written and read a chunk at a time, so saving
+and loading do not need memory beyond the buffer itself. Compressed
+snapshots are gzip files with the same content.
+"""
+import gzip
+import json
+import os
+import random
+
+import numpy as np
+
+MAGIC = b'BLBUFFER'
+CHUNK_BYTES = 1 << 26
+
+
+def save_arrays(path, arrays, meta, compress=False):
+    """Write a snapshot to path.
+
+    Parameters
+    ----------
+    path: str
+        file to write to. The snapshot is written to a temporary file first
+        and then renamed, so an interrupted save never leaves a partial file.
+    arrays: [(str, np.array)]
+        named arrays to save. Anything with shape, dtype and numpy slicing
+        of the first axis can be used in place of an array.
+    meta: dict
+        json-serializable metadata of the buffer
+    compress: bool
+        whether to gzip the snapshot
+    """
+    header = {
+        'meta': meta,
+        'rng': {'numpy': _numpy_rng_state(), 'random': random.getstate()},
+        'arrays': [(name, list(array.shape), np.dtype(array.dtype).str) for name, array in arrays],
+    }
+    header = json.dumps(header).encode()
+    tmp_path = path + '.tmp'
+    with (gzip.open(tmp_path, 'wb', compresslevel=1) if compress else open(tmp_path, 'wb')) as f:
+        f.write(MAGIC)
+        f.write(np.int64(len(header)).tobytes())
+        f.write(header)
+        for _, array in arrays:
+            for start, end in _chunks(array.shape, array.dtype):
+                f.write(np.ascontiguousarray(array[start:end], dtype=array.dtype).data)
+    os.replace(tmp_path, path)
+
+
+def load_arrays(path, allocate=None, restore_rng=True):
+    """Read a snapshot written by save_arrays.
+
+    Parameters
+    ----------
+    path: str
+        file to read from, compressed or not.
+    allocate: (str, tuple, np.dtype) -> np.array
+        function returning the array to read the array with the given name,
+        shape and dtype into, e.g. a view of the storage of the buffer.
+        Defaults to allocating new arrays.
+    restore_rng: bool
+        whether to restore the state of the numpy and python random number
+        generators at the time of saving.
+
+    Returns
+    -------
+    meta: dict
+        metadata of the buffer
+    arrays: dict
+        arrays read, by name
+    """
+    allocate = allocate or (lambda name, shape, dtype: np.empty(shape, dtype=dtype))
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    with (gzip.open(path, 'rb') if compressed else open(path, 'rb')) as f:
+        assert f.read(len(MAGIC)) == MAGIC, '{} is not a buffer snapshot'.format(path)
+        header_len = int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+        header = json.loads(f.read(header_len).decode())
+        arrays = {}
+        for name, shape, dtype in header['arrays']:
+            array = allocate(name, tuple(shape), np.dtype(dtype))
+            assert array.shape == tuple(shape) and array.dtype == np.dtype(dtype)
+            for start, end in _chunks(array.shape, array.dtype):
+                chunk = array[start:end]
+                assert chunk.flags.c_contiguous
+                view = chunk.reshape(-1).view(np.uint8)
+                assert f.readinto(view) == view.nbytes, '{} is truncated'.format(path)
+            arrays[name] = array
+    if restore_rng:
+        state = header['rng']['numpy']
+        np.random.set_state((state[0], np.array(state[1], dtype=np.uint32)) + tuple(state[2:]))
+        random.setstate(_to_tuples(header['rng']['random']))
+    return header['meta'], arrays
+
+
+def _chunks(shape, dtype):
+    if len(shape) == 0:
+        yield None, None
+        return
+    row_bytes = max(1, int(np.prod(shape[1:], dtype=np.int64)) * np.dtype(dtype).itemsize)
+    rows = max(1, CHUNK_BYTES // row_bytes)
+    for start in range(0, shape[0], rows):
+        yield start, min(start + rows, shape[0])
+
+
+def _numpy_rng_state():
+    state = np.random.get_state()
+    return [state[0], state[1].tolist()] + list(state[2:])
+
+
+def _to_tuples(x):
+    return tuple(_to_tuples(y) for y in x) if isinstance(x, list) else x
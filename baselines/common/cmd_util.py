@@ -16,6 +16,9 @@ from baselines.common import set_global_seeds
 from baselines.common.atari_wrappers import make_atari, wrap_deepmind
 from baselines.common.vec_env.subproc_vec_env import SubprocVecEnv
 from baselines.common.vec_env.dummy_vec_env import DummyVecEnv
+from baselines.common.vec_env.util import cpu_layout
+from baselines.common.vec_env.vec_env import pin_process
+from baselines.common.mpi_util import get_local_rank_size
 from baselines.common import retro_wrappers
 
 def make_vec_env(env_id, env_type, num_env, seed,
@@ -23,9 +26,23 @@ def make_vec_env(env_id, env_type, num_env, seed,
                  start_index=0,
                  reward_scale=1.0,
                  flatten_dict_observations=True,
-                 gamestate=None):
+                 gamestate=None,
+                 num_workers=None,
+                 pin_workers=False,
+                 worker_threads=None,
+                 context='spawn',
+                 max_restarts=0,
+                 step_timeout=None):
     """
     Create a wrapped, monitored SubprocVecEnv for Atari and MuJoCo.
+    num_workers is the number of subprocesses running the envs (default: one per env).
+    If pin_workers, the CPUs of the machine are split between the MPI ranks on it, and the share
+    of this rank between its subprocesses and itself (see vec_env.util.cpu_layout).
+    worker_threads caps the BLAS/OpenMP threads of the subprocesses.
+    context is the multiprocessing context of the subprocesses; 'forkserver' forks them from a server
+    that has already imported this module and the env wrappers, which speeds up starting many envs.
+    A subprocess that crashes, or takes more than step_timeout seconds to answer, is restarted up to
+    max_restarts times, its envs returning done=True (see SubprocVecEnv).
     """
     wrapper_kwargs = wrapper_kwargs or {}
     mpi_rank = MPI.COMM_WORLD.Get_rank() if MPI else 0
@@ -47,7 +64,14 @@ def make_vec_env(env_id, env_type, num_env, seed,
 
     set_global_seeds(seed)
     if num_env > 1:
-        return SubprocVecEnv([make_thunk(i + start_index) for i in range(num_env)])
+        cpu_sets = None
+        if pin_workers:
+            local_rank, local_size = get_local_rank_size(MPI.COMM_WORLD) if MPI else (0, 1)
+            learner_cpus, cpu_sets = cpu_layout(num_workers or num_env, local_rank, local_size)
+            pin_process(0, learner_cpus)
+        return SubprocVecEnv([make_thunk(i + start_index) for i in range(num_env)], num_workers=num_workers,
+                             cpu_sets=cpu_sets, worker_threads=worker_threads, context=context, preload=[__name__],
+                             max_restarts=max_restarts, step_timeout=step_timeout)
     else:
         return DummyVecEnv([make_thunk(start_index)])
 
@@ -145,6 +169,12 @@ def common_arg_parser():
     parser.add_argument('--network', help='network type (mlp, cnn, lstm, cnn_lstm, conv_only)', default=None)
     parser.add_argument('--gamestate', help='game state to load (so far only used in retro games)', default=None)
     parser.add_argument('--num_env', help='Number of environment copies being run in parallel. When not specified, set to number of cpus for Atari, and to 1 for Mujoco', default=None, type=int)
+    parser.add_argument('--num_env_workers', help='Number of subprocesses running the environment copies. Default: one per environment', default=None, type=int)
+    parser.add_argument('--pin_env_workers', help='Pin the environment subprocesses and this process to separate CPUs', default=False, action='store_true')
+    parser.add_argument('--env_worker_threads', help='Maximum number of BLAS/OpenMP threads in each environment subprocess', default=None, type=int)
+    parser.add_argument('--max_env_restarts', help='Number of times crashed environment subprocesses are restarted', default=0, type=int)
+    parser.add_argument('--env_step_timeout', help='Seconds after which a hung environment subprocess is restarted', default=None, type=float)
+    parser.add_argument('--env_context', help='How to start the environment subprocesses: spawn (default), forkserver or fork', default='spawn', type=str)
     parser.add_argument('--reward_scale', help='Reward scale factor. Default: 1.0', default=1.0, type=float)
     parser.add_argument('--save_path', help='Path to save trained model to', default=None, type=str)
     parser.add_argument('--save_video_interval', help='Save video every x steps (0 = disabled)', default=0, type=int)
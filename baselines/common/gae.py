@@ -0,0 +1,93 @@
+import numpy as np
+from baselines.common.math_util import reverse_scan
+
+
+def gae(rewards, values, news, last_values, last_news, gamma, lam, advs=None, returns=None,
+        truncated=None, truncated_values=None, block_size='auto'):
+    """
+    Generalized advantage estimation, vectorized over all the axes but the first.
+
+    inputs
+    ------
+    rewards, values: arrays of shape (T, ...), time first: the rewards and value
+        estimates of T steps, e.g. of shape (nsteps, nenv) for a vectorized env.
+    news: array of shape (T, ...), whether step t is the first of an episode.
+    last_values, last_news: arrays of shape (...), the value estimate after the last
+        step and whether a new episode starts there.
+    gamma, lam: discount and GAE lambda.
+    advs, returns: optional arrays of shape (T, ...), possibly views (e.g. transposes of
+        env-major arrays), the advantages and returns are written into.
+    truncated, truncated_values: optional arrays of shape (T, ...). Where truncated[t],
+        the episode was cut after step t (e.g. by a time limit) rather than ended, and
+        the value truncated_values[t] of its last observation is bootstrapped from.
+    block_size: if not None, the reverse scan runs within blocks of block_size steps,
+        all the blocks at once, then across the blocks (see math_util.reverse_scan),
+        which is faster than one step at a time for long rollouts.
+
+    outputs
+    -------
+    advs, returns: arrays of shape (T, ...), the advantages with GAE(lambda) and the
+        TD(lambda) returns advs + values.
+    """
+    rewards = np.asarray(rewards)
+    values = np.asarray(values)
+    dtype = np.result_type(rewards.dtype, values.dtype, np.float32)
+    if advs is None:
+        advs = np.empty(rewards.shape, dtype)
+    if returns is None:
+        returns = np.empty(rewards.shape, dtype)
+
+    nonterminals = np.empty(rewards.shape, dtype)
+    np.subtract(1, news[1:], out=nonterminals[:-1], casting='unsafe')
+    # e.g. a policy's value of shape (1,) for a single env
+    nonterminals[-1] = 1 - np.reshape(last_news, rewards.shape[1:])
+    nextvalues = np.empty(rewards.shape, dtype)
+    nextvalues[:-1] = values[1:]
+    nextvalues[-1] = np.reshape(last_values, rewards.shape[1:])
+
+    # the TD errors of all steps at once
+    deltas = rewards + gamma * nextvalues * nonterminals - values
+    if truncated is not None:
+        deltas += gamma * np.where(truncated, truncated_values, 0)
+    decays = gamma * lam * nonterminals
+
+    # advs[t] = deltas[t] + decays[t] * advs[t + 1]
+    reverse_scan(deltas, decays, out=advs, block_size=block_size)
+    np.add(advs, values, out=returns)
+    return advs, returns
+
+
+def benchmark_gae(nsteps=2048, nenvs=64, block_size=45, n_trials=10):
+    import time
+    rewards = np.random.randn(nsteps, nenvs).astype(np.float32)
+    values = np.random.randn(nsteps, nenvs).astype(np.float32)
+    news = np.random.random((nsteps, nenvs)) < 0.01
+    last_values = np.random.randn(nenvs).astype(np.float32)
+    last_news = np.zeros(nenvs, dtype=bool)
+
+    def per_env_loop():
+        # the former add_vtarg_and_adv, run on every env
+        for env in range(nenvs):
+            new = np.append(news[:, env], last_news[env])
+            vpred = np.append(values[:, env], last_values[env])
+            gaelam = np.empty(nsteps, 'float32')
+            lastgaelam = 0
+            for t in reversed(range(nsteps)):
+                nonterminal = 1 - new[t + 1]
+                delta = rewards[t, env] + 0.99 * vpred[t + 1] * nonterminal - vpred[t]
+                gaelam[t] = lastgaelam = delta + 0.99 * 0.95 * nonterminal * lastgaelam
+
+    timings = [('per-env loop', per_env_loop),
+               ('vectorized over envs',
+                lambda: gae(rewards, values, news, last_values, last_news, 0.99, 0.95, block_size=None)),
+               ('blocks of {} steps'.format(block_size),
+                lambda: gae(rewards, values, news, last_values, last_news, 0.99, 0.95, block_size=block_size))]
+    for name, fn in timings:
+        tstart = time.time()
+        for _ in range(n_trials):
+            fn()
+        print('{:>24}: {:8.2f} ms ({} steps, {} envs)'.format(name, 1e3 * (time.time() - tstart) / n_trials, nsteps, nenvs))
+
+
+if __name__ == '__main__':
+    benchmark_gae()
@@ -1,6 +1,9 @@
 import numpy as np
 import scipy.signal
 
+# scans shorter than this run one step at a time by default, see reverse_scan
+_MIN_BLOCKED_STEPS = 64
+
 
 def discount(x, gamma):
     """
@@ -20,7 +23,91 @@ def discount(x, gamma):
 
     """
     assert x.ndim >= 1
-    return scipy.signal.lfilter([1],[1,-gamma],x[::-1], axis=0)[::-1]
+    return np.moveaxis(discounted_returns(np.moveaxis(x, 0, -1), None, gamma), -1, 0)
+
+def discounted_returns(rewards, dones, gamma, last_values=None, out=None):
+    """
+    computes the discounted returns of a batch of trajectories at once, time along the last axis.
+
+    inputs
+    ------
+    rewards: ndarray of shape (..., T), e.g. (nenvs, nsteps)
+    dones: ndarray of shape (..., T), whether the episode ended with step t, or None if none did
+    gamma: float
+    last_values: optional ndarray of shape (...,), the values to bootstrap from after step T-1
+        in the trajectories whose episode did not end with it
+    out: optional ndarray of shape (..., T) the returns are written into
+
+    outputs
+    -------
+    y: ndarray of shape (..., T), satisfying
+
+        y[..., t] = rewards[..., t] + gamma * (1 - dones[..., t]) * y[..., t+1],
+                where y[..., T] = last_values (or 0)
+
+    """
+    rewards = np.asarray(rewards)
+    if out is None:
+        out = np.empty(rewards.shape, np.result_type(rewards.dtype, np.float32))
+    # time first, as views
+    rewards_t, out_t = np.moveaxis(rewards, -1, 0), np.moveaxis(out, -1, 0)
+    deltas = rewards_t.astype(out.dtype)
+    if dones is None:
+        if last_values is not None:
+            deltas[-1] += gamma * np.asarray(last_values)
+        # a linear filter with a constant coefficient, which scipy runs in C
+        out_t[...] = scipy.signal.lfilter([1], [1, -gamma], deltas[::-1], axis=0)[::-1]
+        return out
+    decays = gamma * (1 - np.moveaxis(np.asarray(dones, out.dtype), -1, 0))
+    if last_values is not None:
+        deltas[-1] += decays[-1] * np.asarray(last_values)
+    reverse_scan(deltas, decays, out=out_t)
+    return out
+
+def reverse_scan(deltas, decays, out=None, block_size='auto'):
+    """
+    solves y[t] = deltas[t] + decays[t] * y[t+1] with y[T] = 0, vectorized over all the axes but the first.
+
+    With block_size=None, the scan goes one step at a time. Otherwise it runs within
+    blocks of block_size steps, all the blocks at once, then across the blocks: a first
+    reverse scan gives the solution as if every block were the last one, and the product
+    of the decays from each step to the end of its block; a second one, over the blocks,
+    carries the solution at the start of each block to the previous one. This takes
+    block_size + T / block_size interpreter steps instead of T. 'auto' uses blocks of
+    about sqrt(T) steps when T is at least _MIN_BLOCKED_STEPS.
+    """
+    T = len(deltas)
+    if out is None:
+        out = np.empty(deltas.shape, deltas.dtype)
+    if block_size == 'auto':
+        block_size = int(np.sqrt(T)) if T >= _MIN_BLOCKED_STEPS else None
+    if block_size is None:
+        last = 0
+        for t in reversed(range(T)):
+            out[t] = last = deltas[t] + decays[t] * last
+        return out
+
+    nblocks = -(-T // block_size)
+    # padding with zero deltas and decays ends the last block the way y[T] = 0 does
+    padding = np.zeros((nblocks * block_size - T,) + deltas.shape[1:], deltas.dtype)
+    blocks_shape = (nblocks, block_size) + deltas.shape[1:]
+    deltas = np.concatenate([deltas, padding]).reshape(blocks_shape)
+    decays = np.concatenate([decays, padding]).reshape(blocks_shape)
+
+    local = np.empty(blocks_shape, deltas.dtype)
+    decay_to_end = np.empty(blocks_shape, deltas.dtype)
+    last, lastdecay = 0, 1
+    for i in reversed(range(block_size)):
+        local[:, i] = last = deltas[:, i] + decays[:, i] * last
+        decay_to_end[:, i] = lastdecay = decays[:, i] * lastdecay
+
+    # the solution at the start of the next block, for every block
+    next_starts = np.zeros((nblocks,) + deltas.shape[2:], deltas.dtype)
+    for b in reversed(range(nblocks - 1)):
+        next_starts[b] = local[b + 1, 0] + decay_to_end[b + 1, 0] * next_starts[b + 1]
+    local += decay_to_end * next_starts[:, None]
+    out[...] = local.reshape((-1,) + deltas.shape[2:])[:T]
+    return out
 
 def explained_variance(ypred,y):
     """
@@ -65,11 +152,12 @@ def discount_with_boundaries(X, New, gamma):
     X: 2d array of floats, time x features
     New: 2d array of bools, indicating when a new episode has started
     """
+    X = np.asarray(X)
+    # the episode ends with step t when a new one starts at t+1
+    dones = np.zeros(X.shape, dtype=bool)
+    dones[:-1] = np.asarray(New)[1:]
     Y = np.zeros_like(X)
-    T = X.shape[0]
-    Y[T-1] = X[T-1]
-    for t in range(T-2, -1, -1):
-        Y[t] = X[t] + gamma * Y[t+1] * (1 - New[t+1])
+    discounted_returns(np.moveaxis(X, 0, -1), np.moveaxis(dones, 0, -1), gamma, out=np.moveaxis(Y, 0, -1))
     return Y
 
 def test_discount_with_boundaries():
@@ -83,3 +171,27 @@ def test_discount_with_boundaries():
         3,
         4
     ])
+
+def test_discounted_returns():
+    gamma = 0.9
+    rewards = np.array([[1.0, 2.0, 3.0], [1.0, 2.0, 3.0]], 'float32')
+    dones = np.array([[0, 1, 0], [0, 0, 1]], bool)
+    y = discounted_returns(rewards, dones, gamma, last_values=np.array([10.0, 10.0]))
+    assert np.allclose(y, [
+        [1 + gamma * 2, 2, 3 + gamma * 10],
+        [1 + gamma * 2 + gamma**2 * 3, 2 + gamma * 3, 3]
+    ])
+    # the blocked scan of long trajectories, and the linear filter without dones,
+    # against a step by step loop
+    rewards = np.random.randn(3, 200)
+    dones = np.random.random((3, 200)) < 0.05
+    last_values = np.random.randn(3)
+    for d in [dones, None]:
+        y = discounted_returns(rewards, d, gamma, last_values=last_values)
+        for i in range(len(rewards)):
+            expected = []
+            ret = last_values[i]
+            for reward, done in zip(rewards[i, ::-1], np.zeros(200) if d is None else d[i, ::-1]):
+                ret = reward + gamma * ret * (1. - done)
+                expected.append(ret)
+            assert np.allclose(y[i], expected[::-1])
@@ -0,0 +1,115 @@
+import queue
+import threading
+
+
+class PrefetchSampler(object):
+    def __init__(self, buffer, batch_size, num_batches=2):
+        """Sample batches from a replay buffer in a background thread.
+
+        While the learner runs the previous batch through the graph (sess.run
+        releases the GIL, and so does numpy when copying the sampled arrays),
+        the next batches are sampled and encoded by a background thread and
+        handed over through a queue holding up to `num_batches` batches.
+
+        Works with the replay buffers of deepq, ddpg and her: calls to
+        `sample` with `batch_size` are served from the queue, every other
+        method of the buffer is forwarded to it while holding `self.lock`, so
+        that the buffer never changes while a batch is being sampled.
+
+        Parameters
+        ----------
+        buffer: object
+            replay buffer with a sample(batch_size, **kwargs) method
+        batch_size: int
+            size of the prefetched batches. Calls to sample with another
+            batch size sample synchronously.
+        num_batches: int
+            maximum number of batches sampled ahead of time
+        """
+        self.buffer = buffer
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=num_batches)
+        self._thread = None
+        self._closing = False
+        self._sample_kwargs = {}
+        self._num_added = 0
+        self._batch_num_added = 0
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def __getattr__(self, name):
+        attr = getattr(self.buffer, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self.lock:
+                return attr(*args, **kwargs)
+        return locked
+
+    def add(self, *args, **kwargs):
+        with self.lock:
+            self.buffer.add(*args, **kwargs)
+            self._num_added += 1
+
+    def sample(self, batch_size, **kwargs):
+        """Returns the oldest prefetched batch.
+
+        The batches are sampled ahead of time, so `kwargs` (e.g. beta for
+        PrioritizedReplayBuffer) only apply to the batches sampled after this
+        call, and the returned batch was sampled with the kwargs of an
+        earlier call.
+        """
+        if batch_size != self.batch_size:
+            with self.lock:
+                return self.buffer.sample(batch_size, **kwargs)
+        self._sample_kwargs = kwargs
+        if self._thread is None:
+            self._closing = False
+            self._thread = threading.Thread(target=self._prefetch, daemon=True)
+            self._thread.start()
+        batch, num_added = self._queue.get()
+        if isinstance(batch, Exception):
+            self._thread.join()
+            self._thread = None
+            raise batch
+        self._batch_num_added = num_added
+        return batch
+
+    def update_priorities(self, idxes, priorities):
+        """Update the priorities of the transitions in the last batch returned by sample.
+
+        Transitions added since that batch was sampled may have overwritten
+        some of the sampled ones, which the buffer is told about so that it
+        does not give their priorities to the new transitions.
+        """
+        with self.lock:
+            self.buffer.update_priorities(idxes, priorities, num_added=self._num_added - self._batch_num_added)
+
+    def close(self):
+        """Stop the background thread. It is restarted by the next call to sample."""
+        if self._thread is None:
+            return
+        self._closing = True
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+        self._thread = None
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def _prefetch(self):
+        while not self._closing:
+            try:
+                with self.lock:
+                    batch = self.buffer.sample(self.batch_size, **self._sample_kwargs)
+                    num_added = self._num_added
+            except Exception as e:
+                self._queue.put((e, None))
+                return
+            self._queue.put((batch, num_added))
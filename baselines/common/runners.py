@@ -1,8 +1,60 @@
 import numpy as np
 from abc import ABC, abstractmethod
+from baselines.common.vec_env.async_vec_env import AsyncSubprocVecEnv
+
+
+class RolloutStorage(object):
+    """
+    Arrays preallocated once to hold the rollouts of a runner, written in place step by step.
+
+    specs maps the name of each array to the (shape, dtype) of one entry, or to
+    (shape, dtype, nsteps) for arrays with another number of steps (e.g. nsteps + 1
+    to also hold the last observation). The arrays are attributes of the storage.
+
+    In the default env-major layout the arrays have shape (nenv, nsteps, ...), so that
+    flat() returns the (nenv * nsteps, ...) batches the trainers expect as views, without
+    the transpose copy of sf01. With time_major=True they have shape (nsteps, nenv, ...).
+    The arrays are overwritten by the next rollout, so views of them must not be kept.
+    """
+    def __init__(self, nenv, nsteps, specs, time_major=False):
+        self.nenv = nenv
+        self.nsteps = nsteps
+        self.time_major = time_major
+        self.names = list(specs)
+        for name, spec in specs.items():
+            shape, dtype = spec[:2]
+            length = spec[2] if len(spec) > 2 else nsteps
+            leading = (length, nenv) if time_major else (nenv, length)
+            setattr(self, name, np.zeros(leading + tuple(shape), dtype=dtype))
+
+    def put(self, t, env_ids=None, **values):
+        """
+        Write the entries of step t (an int, or an array with one step per env)
+        of the envs env_ids (all of them by default).
+        """
+        env_ids = slice(None) if env_ids is None else env_ids
+        index = (t, env_ids) if self.time_major else (env_ids, t)
+        for name, value in values.items():
+            getattr(self, name)[index] = value
+
+    def env_major(self, name):
+        """The array name with shape (nenv, nsteps, ...), a view in both layouts."""
+        arr = getattr(self, name)
+        return arr.swapaxes(0, 1) if self.time_major else arr
+
+    def flat(self, name):
+        """The array name with shape (nenv * nsteps, ...), env after env. A view in the env-major layout."""
+        arr = self.env_major(name)
+        return arr.reshape((-1,) + arr.shape[2:])
+
+
+def space_spec(space):
+    """The (shape, dtype) of one entry of the space, for RolloutStorage specs."""
+    return tuple(space.shape or ()), space.dtype
+
 
 class AbstractEnvRunner(ABC):
-    def __init__(self, *, env, model, nsteps):
+    def __init__(self, *, env, model, nsteps, double_buffer=False):
         self.env = env
         self.model = model
         self.nenv = nenv = env.num_envs if hasattr(env, 'num_envs') else 1
@@ -45,6 +97,104 @@ class AbstractEnvRunner(ABC):
         self.nsteps = nsteps
         self.states = model.initial_state
         self.dones = [False for _ in range(nenv)]
+        # with an AsyncSubprocVecEnv, envs are stepped as soon as they are ready, see _rollout_async
+        self.async_env = isinstance(env, AsyncSubprocVecEnv)
+        # with double_buffer, the policy acts for one half of the envs while the other half steps
+        self.double_buffer = double_buffer
+        if double_buffer:
+            assert self.async_env, 'double_buffer needs an AsyncSubprocVecEnv'
+            half = nenv // 2
+            assert nenv % 2 == 0 and env.worker_of_env[half - 1] != env.worker_of_env[half], \
+                'double_buffer needs two halves of envs stepped by different workers'
+
+    def _rollout_async(self, storage):
+        """
+        Collect nsteps transitions from every env of an AsyncSubprocVecEnv.
+
+        Every time env.recv returns a batch of envs, the policy is run on
+        that batch only and the envs are sent their next actions right away,
+        so that slow envs do not stall the others. The results are scattered
+        into the per-env trajectories of storage (a RolloutStorage with obs,
+        rewards, actions, values, neglogpacs and dones), with the same layout
+        as the synchronous rollout. Envs that have collected nsteps
+        transitions wait for the others.
+
+        Returns epinfos
+        """
+        assert self.states is None, 'recurrent policies need all envs to step together'
+        nsteps, nenv = self.nsteps, self.nenv
+        self.dones = np.asarray(self.dones, dtype=bool)
+        epinfos = []
+        step_counts = np.zeros(nenv, dtype=np.int64)
+        num_stepping = 0
+        env_ids = np.arange(nenv)
+        while True:
+            if len(env_ids):
+                actions, values, _, neglogpacs = self.model.step(self.obs[env_ids], S=None, M=self.dones[env_ids])
+                storage.put(step_counts[env_ids], env_ids, obs=self.obs[env_ids], actions=actions, values=values,
+                            neglogpacs=neglogpacs, dones=self.dones[env_ids])
+                step_counts[env_ids] += 1
+                self.env.send(actions, env_ids)
+                num_stepping += len(env_ids)
+            if num_stepping == 0:
+                break
+            obs, rewards, dones, infos, env_ids = self.env.recv(min(self.env.batch_size, num_stepping))
+            num_stepping -= len(env_ids)
+            storage.put(step_counts[env_ids] - 1, env_ids, rewards=rewards)
+            self.obs[env_ids] = obs
+            self.dones[env_ids] = dones
+            for info in infos:
+                maybeepinfo = info.get('episode')
+                if maybeepinfo: epinfos.append(maybeepinfo)
+            env_ids = env_ids[step_counts[env_ids] < nsteps]
+        return epinfos
+
+    def _rollout_double_buffered(self, storage, masks='dones', dones=None):
+        """
+        Collect nsteps transitions from every env of an AsyncSubprocVecEnv,
+        stepping its two halves in turn.
+
+        The policy computes the actions of one half while the other half is
+        stepping in its subprocesses, so that inference and simulation overlap.
+        Every env takes the same steps as in the synchronous rollout, and the
+        results are written to the same places of storage (a RolloutStorage
+        with obs, rewards, actions and values, and neglogpacs if it has them).
+        The dones before each step are written to the array masks, and the
+        ones after it to the array dones if it is given.
+
+        Returns epinfos
+        """
+        assert self.states is None, 'recurrent policies need all envs to step together'
+        nsteps, nenv = self.nsteps, self.nenv
+        self.dones = np.asarray(self.dones, dtype=bool)
+        epinfos = []
+        env_ids = np.arange(nenv)
+        halves = [slice(0, nenv // 2), slice(nenv // 2, nenv)]
+
+        def act(t, half):
+            actions, values, _, neglogpacs = self.model.step(self.obs[half], S=None, M=self.dones[half])
+            storage.put(t, half, obs=self.obs[half], actions=actions, values=values, **{masks: self.dones[half]})
+            if 'neglogpacs' in storage.names:
+                storage.put(t, half, neglogpacs=neglogpacs)
+            self.env.send(actions, env_ids[half])
+
+        for half in halves:
+            act(0, half)
+        for t in range(nsteps):
+            for half in halves:
+                obs, rewards, half_dones, infos, _ = self.env.recv(env_ids=env_ids[half])
+                storage.put(t, half, rewards=rewards)
+                if dones is not None:
+                    storage.put(t, half, **{dones: half_dones})
+                self.obs[half] = obs
+                self.dones[half] = half_dones
+                for info in infos:
+                    maybeepinfo = info.get('episode')
+                    if maybeepinfo: epinfos.append(maybeepinfo)
+                # the other half steps meanwhile
+                if t + 1 < nsteps:
+                    act(t + 1, half)
+        return epinfos
 
     @abstractmethod
     def run(self):
@@ -1,23 +1,49 @@
-import tensorflow as tf
 import numpy as np
-from baselines.common.tf_util import get_session
 
 class RunningMeanStd(object):
     # https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
-    def __init__(self, epsilon=1e-4, shape=()):
-        self.mean = np.zeros(shape, 'float64')
-        self.var = np.ones(shape, 'float64')
+    def __init__(self, epsilon=1e-4, shape=(), dtype='float64'):
+        """
+        The statistics are computed in dtype. In float32, a batch is reduced
+        at half the cost of float64, and the rounding errors of the running
+        mean are compensated (Kahan summation) so that it does not drift once
+        the count is large.
+        """
+        self.mean = np.zeros(shape, dtype)
+        self.var = np.ones(shape, dtype)
         self.count = epsilon
+        self._mean_error = np.zeros(shape, dtype)
 
     def update(self, x):
-        batch_mean = np.mean(x, axis=0)
-        batch_var = np.var(x, axis=0)
+        batch_mean = np.mean(x, axis=0, dtype=self.mean.dtype)
+        batch_var = np.var(x, axis=0, dtype=self.mean.dtype)
         batch_count = x.shape[0]
         self.update_from_moments(batch_mean, batch_var, batch_count)
 
     def update_from_moments(self, batch_mean, batch_var, batch_count):
-        self.mean, self.var, self.count = update_mean_var_count_from_moments(
-            self.mean, self.var, self.count, batch_mean, batch_var, batch_count)
+        if self.mean.dtype == np.float64:
+            self.mean, self.var, self.count = update_mean_var_count_from_moments(
+                self.mean, self.var, self.count, batch_mean, batch_var, batch_count)
+            return
+        dtype = self.mean.dtype
+        delta = np.asarray(batch_mean, dtype) - self.mean
+        tot_count = self.count + batch_count
+        # the weights are python floats, so that the arrays stay in dtype and var * count cannot overflow
+        batch_weight = batch_count / tot_count
+        increment = delta * dtype.type(batch_weight) - self._mean_error
+        new_mean = self.mean + increment
+        self._mean_error = (new_mean - self.mean) - increment
+        self.var = (self.var * dtype.type(self.count / tot_count) + np.asarray(batch_var, dtype) * dtype.type(batch_weight)
+                    + np.square(delta) * dtype.type(self.count * batch_count / tot_count ** 2))
+        self.mean = new_mean
+        self.count = tot_count
+
+    def set_moments(self, mean, var, count):
+        """Replace the statistics, e.g. by saved ones."""
+        self.mean = np.array(mean, dtype=self.mean.dtype)
+        self.var = np.array(var, dtype=self.var.dtype)
+        self.count = float(count)
+        self._mean_error = np.zeros_like(self.mean)
 
 def update_mean_var_count_from_moments(mean, var, count, batch_mean, batch_var, batch_count):
     delta = batch_mean - mean
@@ -40,6 +66,9 @@ class TfRunningMeanStd(object):
     Benefit of this implementation is that it can be saved / loaded together with the tensorflow model
     '''
     def __init__(self, epsilon=1e-4, shape=(), scope=''):
+        # imported here so that the numpy RunningMeanStd (e.g. in VecNormalize) does not load tensorflow
+        import tensorflow as tf
+        from baselines.common.tf_util import get_session
         sess = get_session()
 
         self._new_mean = tf.placeholder(shape=shape, dtype=tf.float64)
@@ -99,6 +128,15 @@ def test_runningmeanstd():
 
         np.testing.assert_allclose(ms1, ms2)
 
+def test_runningmeanstd_float32():
+    x = np.random.randn(1000, 2) * 3 + 100
+    rms = RunningMeanStd(epsilon=0.0, shape=(2,), dtype='float32')
+    for batch in np.split(x, 100):
+        rms.update(batch)
+    assert rms.mean.dtype == np.float32 and rms.var.dtype == np.float32
+    np.testing.assert_allclose(rms.mean, x.mean(axis=0), rtol=1e-5)
+    np.testing.assert_allclose(rms.var, x.var(axis=0), rtol=1e-3)
+
 def test_tf_runningmeanstd():
     for (x1, x2, x3) in [
         (np.random.randn(3), np.random.randn(4), np.random.randn(5)),
@@ -119,6 +157,7 @@ def test_tf_runningmeanstd():
 
 def profile_tf_runningmeanstd():
     import time
+    import tensorflow as tf
     from baselines.common import tf_util
 
     tf_util.get_session( config=tf.ConfigProto(
@@ -1,8 +1,10 @@
 import operator
 
+import numpy as np
+
 
 class SegmentTree(object):
-    def __init__(self, capacity, operation, neutral_element):
+    def __init__(self, capacity, operation, neutral_element, batch_operation=None):
         """Build a Segment Tree data structure.
 
         https://en.wikipedia.org/wiki/Segment_tree
@@ -16,6 +18,10 @@ class SegmentTree(object):
                `reduce` operation which reduces `operation` over
                a contiguous subsequence of items in the array.
 
+        The tree is stored in a numpy array, node i having children 2 * i
+        and 2 * i + 1, and items can be read and written in batches by
+        indexing with arrays.
+
         Paramters
         ---------
         capacity: int
@@ -27,26 +33,16 @@ class SegmentTree(object):
         neutral_element: obj
             neutral element for the operation above. eg. float('-inf')
             for max and 0 for sum.
+        batch_operation: lambda np.array, np.array -> np.array
+            elementwise version of `operation` used for batched updates
+            (eg. np.maximum for max). Defaults to `operation`.
         """
         assert capacity > 0 and capacity & (capacity - 1) == 0, "capacity must be positive and a power of 2."
         self._capacity = capacity
-        self._value = [neutral_element for _ in range(2 * capacity)]
+        self._value = np.full(2 * capacity, neutral_element, dtype=np.float64)
         self._operation = operation
-
-    def _reduce_helper(self, start, end, node, node_start, node_end):
-        if start == node_start and end == node_end:
-            return self._value[node]
-        mid = (node_start + node_end) // 2
-        if end <= mid:
-            return self._reduce_helper(start, end, 2 * node, node_start, mid)
-        else:
-            if mid + 1 <= start:
-                return self._reduce_helper(start, end, 2 * node + 1, mid + 1, node_end)
-            else:
-                return self._operation(
-                    self._reduce_helper(start, mid, 2 * node, node_start, mid),
-                    self._reduce_helper(mid + 1, end, 2 * node + 1, mid + 1, node_end)
-                )
+        self._batch_operation = batch_operation or operation
+        self._neutral_element = neutral_element
 
     def reduce(self, start=0, end=None):
         """Returns result of applying `self.operation`
@@ -70,10 +66,25 @@ class SegmentTree(object):
             end = self._capacity
         if end < 0:
             end += self._capacity
-        end -= 1
-        return self._reduce_helper(start, end, 1, 0, self._capacity - 1)
+        # walk up from the leaves, collecting the nodes covering [start, end)
+        result = self._neutral_element
+        start += self._capacity
+        end += self._capacity
+        while start < end:
+            if start & 1:
+                result = self._operation(result, self._value[start])
+                start += 1
+            if end & 1:
+                end -= 1
+                result = self._operation(result, self._value[end])
+            start //= 2
+            end //= 2
+        return result
 
     def __setitem__(self, idx, val):
+        if np.ndim(idx) > 0:
+            self._set_batch(idx, val)
+            return
         # index of the leaf
         idx += self._capacity
         self._value[idx] = val
@@ -85,9 +96,24 @@ class SegmentTree(object):
             )
             idx //= 2
 
+    def _set_batch(self, idxes, vals):
+        # leaves are all at the same depth, so their ancestors can be
+        # recomputed one level at a time
+        nodes = np.asarray(idxes) + self._capacity
+        if nodes.size == 0:
+            return
+        self._value[nodes] = vals
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self._value[nodes] = self._batch_operation(
+                self._value[2 * nodes],
+                self._value[2 * nodes + 1]
+            )
+            nodes = np.unique(nodes // 2)
+
     def __getitem__(self, idx):
-        assert 0 <= idx < self._capacity
-        return self._value[self._capacity + idx]
+        assert np.all(0 <= idx) and np.all(idx < self._capacity)
+        return self._value[self._capacity + np.asarray(idx)]
 
 
 class SumSegmentTree(SegmentTree):
@@ -112,14 +138,18 @@ class SumSegmentTree(SegmentTree):
 
         Parameters
         ----------
-        perfixsum: float
-            upperbound on the sum of array prefix
+        perfixsum: float or np.array
+            upperbound on the sum of array prefix. When given an array,
+            all of its entries are searched for at once, descending the
+            tree one level at a time.
 
         Returns
         -------
-        idx: int
+        idx: int or np.array
             highest index satisfying the prefixsum constraint
         """
+        if np.ndim(prefixsum) > 0:
+            return self._find_prefixsum_idx_batch(np.asarray(prefixsum, dtype=np.float64))
         assert 0 <= prefixsum <= self.sum() + 1e-5
         idx = 1
         while idx < self._capacity:  # while non-leaf
@@ -130,12 +160,24 @@ class SumSegmentTree(SegmentTree):
                 idx = 2 * idx + 1
         return idx - self._capacity
 
+    def _find_prefixsum_idx_batch(self, prefixsum):
+        assert np.all(0 <= prefixsum) and np.all(prefixsum <= self.sum() + 1e-5)
+        # all searches are at the same depth, so they descend the tree together
+        idx = np.ones(prefixsum.shape, dtype=np.int64)
+        while idx.size > 0 and idx.flat[0] < self._capacity:  # while non-leaf
+            left_value = self._value[2 * idx]
+            go_right = left_value <= prefixsum
+            prefixsum = np.where(go_right, prefixsum - left_value, prefixsum)
+            idx = 2 * idx + go_right
+        return idx - self._capacity
+
 
 class MinSegmentTree(SegmentTree):
     def __init__(self, capacity):
         super(MinSegmentTree, self).__init__(
             capacity=capacity,
             operation=min,
+            batch_operation=np.minimum,
             neutral_element=float('inf')
         )
 
@@ -0,0 +1,49 @@
+import time
+
+import gym
+import numpy as np
+
+
+class CountingEnv(gym.Env):
+    """
+    A deterministic env that spins for step_ms milliseconds per step. The observation
+    holds the step of the episode, the reward is the action plus that step, and the
+    episodes of the env with the given seed last seed + 2 steps.
+    """
+    def __init__(self, seed=0, ob_size=16, step_ms=0.):
+        self.observation_space = gym.spaces.Box(low=0, high=np.inf, shape=(ob_size,), dtype=np.float32)
+        self.action_space = gym.spaces.Discrete(2)
+        self.episode_length = seed + 2
+        self.step_ms = step_ms
+        self.t = 0
+
+    def reset(self):
+        self.t = 0
+        return np.full(self.observation_space.shape, self.t, np.float32)
+
+    def step(self, action):
+        deadline = time.perf_counter() + self.step_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+        reward = float(action + self.t)
+        self.t += 1
+        done = self.t >= self.episode_length
+        info = {'episode': {'r': reward, 'l': self.t}} if done else {}
+        return np.full(self.observation_space.shape, self.t, np.float32), reward, done, info
+
+
+class LinearModel(object):
+    """A deterministic feed-forward policy with the step and value methods of the runners' models."""
+    def __init__(self, ob_size=16, hidden_size=16):
+        rng = np.random.RandomState(0)
+        self.w = rng.randn(ob_size, hidden_size).astype(np.float32) / np.sqrt(ob_size)
+        self.initial_state = None
+
+    def step(self, obs, S=None, M=None):
+        hidden = np.tanh(obs @ self.w)
+        values = hidden.mean(axis=1)
+        actions = (values > 0).astype(np.int64)
+        return actions, values, None, np.zeros(len(obs), np.float32)
+
+    def value(self, obs, S=None, M=None):
+        return self.step(obs)[1]
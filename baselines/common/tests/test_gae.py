@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from baselines.common.gae import gae
+
+
+def gae_loop(rewards, values, news, last_values, last_news, gamma, lam):
+    # the former per-timestep loop of ppo2.runner.Runner
+    advs = np.zeros_like(rewards)
+    lastgaelam = 0
+    for t in reversed(range(len(rewards))):
+        if t == len(rewards) - 1:
+            nextnonterminal = 1.0 - last_news
+            nextvalues = last_values
+        else:
+            nextnonterminal = 1.0 - news[t+1]
+            nextvalues = values[t+1]
+        delta = rewards[t] + gamma * nextvalues * nextnonterminal - values[t]
+        advs[t] = lastgaelam = delta + gamma * lam * nextnonterminal * lastgaelam
+    return advs
+
+
+@pytest.mark.parametrize('block_size', (None, 'auto', 1, 7, 100, 1000))
+def test_gae(block_size):
+    nsteps, nenvs = 100, 5
+    rewards = np.random.randn(nsteps, nenvs).astype(np.float32)
+    values = np.random.randn(nsteps, nenvs).astype(np.float32)
+    news = np.random.random((nsteps, nenvs)) < 0.1
+    last_values = np.random.randn(nenvs).astype(np.float32)
+    last_news = np.array([False, True, False, False, True])
+    expected = gae_loop(rewards, values, news, last_values, last_news, 0.99, 0.95)
+
+    # written in place into the transposes of env-major arrays
+    advs, returns = np.zeros((nenvs, nsteps), np.float32), np.zeros((nenvs, nsteps), np.float32)
+    gae(rewards, values, news, last_values, last_news, 0.99, 0.95, advs=advs.T, returns=returns.T,
+        block_size=block_size)
+    np.testing.assert_allclose(advs.T, expected, atol=1e-5)
+    np.testing.assert_allclose(returns.T, expected + values, atol=1e-5)
+
+
+def test_gae_truncated():
+    rewards = np.ones(4, np.float32)
+    values = np.zeros(4, np.float32)
+    news = np.array([0, 0, 1, 0])
+    # the episode was cut by a time limit after step 1, with a last observation worth 10
+    truncated = np.array([False, True, False, False])
+    advs, _ = gae(rewards, values, news, 0., 0, 0.5, 1., truncated=truncated, truncated_values=np.full(4, 10.))
+    np.testing.assert_allclose(advs, [1 + 0.5 * (1 + 0.5 * 10), 1 + 0.5 * 10, 1.5, 1])
@@ -0,0 +1,36 @@
+import numpy as np
+
+from baselines.common.prefetch import PrefetchSampler
+from baselines.ddpg.memory import Memory
+
+
+def test_prefetch_sampler():
+    memory = Memory(limit=100, action_shape=(2,), observation_shape=(3,))
+    sampler = PrefetchSampler(memory, batch_size=8, num_batches=3)
+    for i in range(50):
+        sampler.append(np.full(3, i), np.zeros(2), float(i), np.full(3, i + 1), False)
+    assert sampler.nb_entries == 50
+
+    for _ in range(10):
+        batch = sampler.sample(batch_size=8)
+        assert batch['obs0'].shape == (8, 3)
+        np.testing.assert_array_equal(batch['obs0'][:, 0], batch['rewards'][:, 0])
+        # appending while batches are sampled in the background
+        sampler.append(np.zeros(3), np.zeros(2), 0., np.ones(3), False)
+
+    assert sampler.sample(batch_size=4)['obs0'].shape == (4, 3)
+    sampler.close()
+    assert sampler.sample(batch_size=8)['obs0'].shape == (8, 3)
+    sampler.close()
+
+
+def test_prefetch_sampler_error():
+    memory = Memory(limit=100, action_shape=(2,), observation_shape=(3,))
+    sampler = PrefetchSampler(memory, batch_size=8)
+    try:
+        # sampling from an empty memory fails in the background thread
+        sampler.sample(batch_size=8)
+    except ValueError:
+        pass
+    else:
+        assert False, 'sample should raise the error of the background thread'
@@ -0,0 +1,87 @@
+import numpy as np
+
+from baselines.common.runners import RolloutStorage
+
+
+def test_rollout_storage():
+    nenv, nsteps = 3, 4
+    rollouts = {}
+    for time_major in (False, True):
+        storage = RolloutStorage(nenv, nsteps, {'obs': ((2,), np.uint8), 'rewards': ((), np.float32),
+                                                'dones': ((), bool, nsteps + 1)}, time_major=time_major)
+        for t in range(nsteps):
+            storage.put(t, obs=np.full((nenv, 2), t), rewards=np.arange(nenv) + 10 * t, dones=np.zeros(nenv))
+        # per-env steps, as written by an asynchronous rollout
+        storage.put(np.array([nsteps, nsteps]), np.array([0, 2]), dones=np.ones(2))
+        assert storage.env_major('dones').shape == (nenv, nsteps + 1)
+        np.testing.assert_array_equal(storage.env_major('dones')[:, -1], [True, False, True])
+        rollouts[time_major] = storage.flat('obs'), storage.flat('rewards')
+        assert rollouts[time_major][0].shape == (nenv * nsteps, 2)
+        assert rollouts[time_major][0].dtype == np.uint8
+
+    env_major_obs, env_major_rewards = rollouts[False]
+    # the env-major batches are views, in the order of ppo2's former sf01
+    assert env_major_obs.base is not None
+    np.testing.assert_array_equal(env_major_rewards, [0, 10, 20, 30, 1, 11, 21, 31, 2, 12, 22, 32])
+    for expected, arr in zip(rollouts[True], rollouts[False]):
+        np.testing.assert_array_equal(expected, arr)
+
+
+def test_double_buffered_rollout():
+    """
+    Test that the double-buffered ppo2 rollout gives the same
+    batches and episodes as the sequential one.
+    """
+    from baselines.common.tests.runner_util import CountingEnv, LinearModel
+    from baselines.common.vec_env import DummyVecEnv, AsyncSubprocVecEnv
+    from baselines.ppo2.runner import Runner
+
+    nenv, nsteps = 4, 5
+    env_fns = [lambda seed=seed: CountingEnv(seed) for seed in range(nenv)]
+    model = LinearModel()
+    expected_runner = Runner(env=DummyVecEnv(env_fns), model=model, nsteps=nsteps, gamma=0.99, lam=0.95)
+    venv = AsyncSubprocVecEnv(env_fns)
+    try:
+        runner = Runner(env=venv, model=model, nsteps=nsteps, gamma=0.99, lam=0.95, double_buffer=True)
+        for _ in range(2):
+            expected, rollout = expected_runner.run(), runner.run()
+            for expected_arr, arr in zip(expected[:6], rollout[:6]):
+                np.testing.assert_allclose(expected_arr, arr)
+            assert expected[7] == rollout[7]
+    finally:
+        venv.close()
+
+
+def test_async_rollout():
+    """
+    Test that the ppo2 rollout with an AsyncSubprocVecEnv runs the policy
+    on partial batches and gives the same batches as the sequential one.
+    """
+    from baselines.common.tests.runner_util import CountingEnv, LinearModel
+    from baselines.common.vec_env import DummyVecEnv, AsyncSubprocVecEnv
+    from baselines.ppo2.runner import Runner
+
+    class PartialBatchModel(LinearModel):
+        batch_sizes = set()
+
+        def step(self, obs, S=None, M=None):
+            # all the envs start a rollout together, then step in batches
+            assert (0 < len(obs) <= batch_size or len(obs) == nenv) and obs.shape[1:] == (16,)
+            assert M is None or len(M) == len(obs)
+            self.batch_sizes.add(len(obs))
+            return LinearModel.step(self, obs, S, M)
+
+    nenv, nsteps, batch_size = 4, 5, 2
+    env_fns = [lambda seed=seed: CountingEnv(seed) for seed in range(nenv)]
+    expected_runner = Runner(env=DummyVecEnv(env_fns), model=LinearModel(), nsteps=nsteps, gamma=0.99, lam=0.95)
+    venv = AsyncSubprocVecEnv(env_fns, batch_size=batch_size)
+    try:
+        runner = Runner(env=venv, model=PartialBatchModel(), nsteps=nsteps, gamma=0.99, lam=0.95)
+        for _ in range(2):
+            expected, rollout = expected_runner.run(), runner.run()
+            for expected_arr, arr in zip(expected[:6], rollout[:6]):
+                np.testing.assert_allclose(expected_arr, arr)
+            assert sorted(ep['l'] for ep in expected[7]) == sorted(ep['l'] for ep in rollout[7])
+        assert batch_size in runner.model.batch_sizes
+    finally:
+        venv.close()
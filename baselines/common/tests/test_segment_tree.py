@@ -95,9 +95,43 @@ def test_max_interval_tree():
     assert np.isclose(tree.min(3, 4), 3.0)
 
 
+def test_batch_set_and_prefixsum_idx():
+    tree = SumSegmentTree(8)
+    reference = SumSegmentTree(8)
+
+    idxes = np.array([5, 0, 3, 5, 7])
+    values = np.array([2.0, 0.5, 1.0, 3.0, 0.25])
+    tree[idxes] = values
+    for idx, value in zip(idxes, values):
+        reference[idx] = value
+
+    assert np.isclose(tree.sum(), 4.75)
+    assert np.allclose(tree[np.arange(8)], reference[np.arange(8)])
+    for start, end in [(0, 8), (1, 5), (3, 4), (4, -1)]:
+        assert np.isclose(tree.sum(start, end), reference.sum(start, end))
+
+    prefixsums = np.array([0.0, 0.49, 0.51, 1.5, 1.51, 4.5, 4.75])
+    assert np.all(tree.find_prefixsum_idx(prefixsums) == [0, 0, 3, 5, 5, 7, 7])
+    assert all(tree.find_prefixsum_idx(p) == reference.find_prefixsum_idx(p) for p in prefixsums)
+
+
+def test_batch_set_min_tree():
+    tree = MinSegmentTree(4)
+
+    tree[np.array([0, 2, 3])] = np.array([1.0, 0.5, 3.0])
+    assert np.isclose(tree.min(), 0.5)
+    assert np.isclose(tree.min(3, 4), 3.0)
+
+    tree[np.array([2, 0])] = np.array([4.0, 2.0])
+    assert np.isclose(tree.min(), 2.0)
+    assert np.isclose(tree.min(2, 4), 3.0)
+
+
 if __name__ == '__main__':
     test_tree_set()
     test_tree_set_overlap()
     test_prefixsum_idx()
     test_prefixsum_idx2()
     test_max_interval_tree()
+    test_batch_set_and_prefixsum_idx()
+    test_batch_set_min_tree()
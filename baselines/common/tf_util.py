@@ -58,7 +58,9 @@ def get_session(config=None):
 def make_session(config=None, num_cpu=None, make_default=False, graph=None):
     """Returns a session that will use <num_cpu> CPU's only"""
     if num_cpu is None:
-        num_cpu = int(os.getenv('RCALL_NUM_CPU', multiprocessing.cpu_count()))
+        # the process may be pinned to some of the CPUs, e.g. by cmd_util.make_vec_env(pin_workers=True)
+        available_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else multiprocessing.cpu_count()
+        num_cpu = int(os.getenv('RCALL_NUM_CPU', available_cpus))
     if config is None:
         config = tf.ConfigProto(
             allow_soft_placement=True,
@@ -0,0 +1,128 @@
+"""
+A subprocess VecEnv that steps any subset of its environments
+and returns the first ones to finish.
+"""
+
+from collections import deque
+from multiprocessing.connection import wait
+
+import numpy as np
+from .subproc_vec_env import SubprocVecEnv, _flatten_obs, _PIPE_ERRORS
+
+
+class AsyncSubprocVecEnv(SubprocVecEnv):
+    """
+    SubprocVecEnv with an asynchronous, partial-batch interface in the
+    style of EnvPool: send() gives actions to some of the environments,
+    recv() waits for the first batch_size environments to finish stepping
+    and returns their results along with their ids, so that they can be
+    sent new actions right away while slow environments keep running.
+
+    The synchronous VecEnv interface (reset, step_async, step_wait) can
+    be used while no asynchronous step is pending.
+    """
+    def __init__(self, env_fns, batch_size=None, spaces=None, context='spawn', num_workers=None, cpu_sets=None,
+                 worker_threads=None, preload=None, max_restarts=0, step_timeout=None):
+        """
+        Arguments:
+
+        env_fns: iterable of callables - functions that create environments to run in subprocesses
+        batch_size: default number of environments returned by recv (default: all of them)
+        num_workers: number of subprocesses, see SubprocVecEnv. A worker runs a step once it has the
+                     actions of all its environments, so send() should give whole groups at once.
+        cpu_sets, worker_threads, context, preload: see SubprocVecEnv
+        max_restarts, step_timeout: see SubprocVecEnv. recv returns done=True for the environments of a
+                                    worker that has been restarted while stepping.
+        """
+        SubprocVecEnv.__init__(self, env_fns, spaces=spaces, context=context, num_workers=num_workers,
+                               cpu_sets=cpu_sets, worker_threads=worker_threads, preload=preload,
+                               max_restarts=max_restarts, step_timeout=step_timeout)
+        self.batch_size = batch_size or self.num_envs
+        self.worker_of_env = np.repeat(np.arange(len(self.slices)), [s.stop - s.start for s in self.slices])
+        self._actions = [[None] * (s.stop - s.start) for s in self.slices]
+        self._pending = {}  # worker index -> command sent to it
+        self._ready = deque()  # (env id, (ob, reward, done, info)) received but not yet returned
+
+    def async_reset(self):
+        """
+        Reset all the environments. The observations are returned by recv,
+        with zero rewards and done=False.
+        """
+        self._assert_not_closed()
+        assert not self._pending and not self._ready, 'Trying to reset while environments are stepping'
+        for worker in range(len(self.slices)):
+            self._send(worker, ('reset', None))
+            self._pending[worker] = 'reset'
+
+    def send(self, actions, env_ids):
+        """
+        Tell the environments env_ids to take a step with the given actions.
+        """
+        self._assert_not_closed()
+        for action, env_id in zip(actions, env_ids):
+            worker = self.worker_of_env[env_id]
+            assert worker not in self._pending, 'Environment {} is already stepping'.format(env_id)
+            group = self._actions[worker]
+            group[env_id - self.slices[worker].start] = action
+            if all(a is not None for a in group):
+                self._send(worker, ('step', list(group)))
+                self._pending[worker] = 'step'
+                group[:] = [None] * len(group)
+
+    def recv(self, batch_size=None, env_ids=None):
+        """
+        Wait for the first batch_size environments to finish their step,
+        or, if env_ids is given, for the environments env_ids.
+
+        Returns (obs, rews, dones, infos, env_ids), where env_ids holds the
+        ids of the environments the other arrays are about.
+        """
+        self._assert_not_closed()
+        if env_ids is not None:
+            wanted = set(env_ids)
+            stepping = set(np.flatnonzero(np.isin(self.worker_of_env, list(self._pending))))
+            assert wanted <= stepping | {env_id for env_id, _ in self._ready}, 'Not all environments are stepping'
+            while not wanted <= {env_id for env_id, _ in self._ready}:
+                self._recv_pending()
+            ready = dict(self._ready)
+            self._ready = deque(item for item in self._ready if item[0] not in wanted)
+            env_ids, results = list(env_ids), [ready[env_id] for env_id in env_ids]
+        else:
+            batch_size = batch_size or self.batch_size
+            num_pending = sum(self.slices[worker].stop - self.slices[worker].start for worker in self._pending)
+            assert batch_size <= len(self._ready) + num_pending, 'Not enough environments are stepping'
+            while len(self._ready) < batch_size:
+                self._recv_pending()
+            env_ids, results = zip(*[self._ready.popleft() for _ in range(batch_size)])
+        obs, rews, dones, infos = zip(*results)
+        return _flatten_obs(obs), np.stack(rews), np.stack(dones), infos, np.array(env_ids)
+
+    def _recv_pending(self):
+        """Wait for some of the stepping workers and move their results to self._ready."""
+        workers = {self.remotes[worker]: worker for worker in self._pending}
+        # if none answers within the timeout, _recv restarts the ones still hung after another one
+        for remote in wait(list(workers), self.step_timeout) or list(workers):
+            worker = workers[remote]
+            cmd = self._pending.pop(worker)
+            results = self._recv(worker, cmd)
+            if cmd == 'reset':
+                results = [(ob, 0.0, False, {}) for ob in results]
+            env_slice = self.slices[worker]
+            self._ready.extend(zip(range(env_slice.start, env_slice.stop), results))
+
+    def reset(self):
+        assert not self._pending and not self._ready, 'Trying to reset while environments are stepping'
+        return SubprocVecEnv.reset(self)
+
+    def step_async(self, actions):
+        assert not self._pending and not self._ready, 'Trying to step all environments while some are stepping'
+        SubprocVecEnv.step_async(self, actions)
+
+    def close_extras(self):
+        for worker in list(self._pending):
+            try:
+                self.remotes[worker].recv()
+            except _PIPE_ERRORS:
+                pass
+            del self._pending[worker]
+        SubprocVecEnv.close_extras(self)
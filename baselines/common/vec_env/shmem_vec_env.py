@@ -2,132 +2,347 @@
 An interface for asynchronous vectorized environments.
 """
 
-import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import time
+import weakref
 import numpy as np
-from .vec_env import VecEnv, CloudpickleWrapper, clear_mpi_env_vars
+from .vec_env import VecEnv, CloudpickleWrapper, clear_mpi_env_vars, limit_worker_threads, pin_process, get_context
 import ctypes
 from baselines import logger
 
-from .util import dict_to_obs, obs_space_info, obs_to_dict
+from .util import dict_to_obs, obs_space_info, obs_to_dict, split_envs
 
-_NP_TO_CT = {np.float32: ctypes.c_float,
-             np.int32: ctypes.c_int32,
-             np.int8: ctypes.c_int8,
-             np.uint8: ctypes.c_char,
-             np.bool: ctypes.c_bool}
+# commands to the workers, written to ShmemVecEnv.cmds before releasing the worker's semaphore
+_CMD_STEP = 0  # step with the actions in the shared action buffer
+_CMD_PIPE = 1  # read the command from the pipe
+
+# errors raised when using the pipe of a worker that has died
+_PIPE_ERRORS = (EOFError, ConnectionError)
+# seconds between two checks that a worker is still alive while waiting for its step
+_POLL_INTERVAL = 1.0
 
 
 class ShmemVecEnv(VecEnv):
     """
     Optimized version of SubprocVecEnv that uses shared variables to communicate observations.
+
+    Steps go through shared memory as well: the actions, rewards and dones
+    live in shared arrays, the parent and the workers signal each other with
+    semaphores, and only non-empty info dicts are pickled through the pipes.
+    Other commands (reset, render, close) and actions that do not fit the
+    action space (e.g. joint actions) go through the pipes.
     """
 
-    def __init__(self, env_fns, spaces=None, context='spawn'):
+    def __init__(self, env_fns, spaces=None, context='spawn', copy_obs=True, num_workers=None, cpu_sets=None,
+                 worker_threads=None, preload=None, max_restarts=0, step_timeout=None):
         """
-        If you don't specify observation_space, we'll have to create a dummy
-        environment to get it.
+        If you don't specify spaces, they are read from the first worker
+        once it has created its envs.
+
+        The observations of all envs for a key live in one shared block of
+        shape (num_envs, *shape), each worker writing to its row. With
+        copy_obs=False, reset and step_wait return views of these blocks
+        instead of copies; the views are overwritten by the next step, so the
+        caller must copy whatever it keeps past the next call to step_async.
+
+        num_workers sets the number of subprocesses, each stepping a
+        contiguous group of the envs for a single message (by default, one
+        subprocess per env).
+
+        cpu_sets is a list of sets of CPUs, the i-th subprocess being pinned
+        to cpu_sets[i % len(cpu_sets)] (see util.cpu_layout), and
+        worker_threads caps the BLAS/OpenMP threads of each subprocess.
+
+        context='forkserver' forks the workers from a server process that has
+        imported the modules in preload (see vec_env.get_context), instead of
+        starting a new interpreter for every worker. The time taken to start
+        the workers is logged and kept in self.startup_time.
+
+        A worker that dies, or does not answer within step_timeout seconds,
+        is restarted up to max_restarts times (see SubprocVecEnv), its envs
+        returning done=True with info['worker_restarted'] = True.
         """
-        ctx = mp.get_context(context)
+        start_time = time.time()
+        self.ctx = ctx = get_context(context, preload)
+        self.slices = split_envs(len(env_fns), num_workers)
+        self.env_fns = [CloudpickleWrapper(list(env_fns[env_slice])) for env_slice in self.slices]
+        self.cpu_sets = cpu_sets
+        self.worker_threads = worker_threads
+        self.max_restarts = max_restarts
+        self.step_timeout = step_timeout
+        self.restarts = [0] * len(self.slices)
+        # the control variables are inherited by the workers, the observation and action
+        # buffers depend on the spaces and are attached by the workers once these are known
+        self.rew_buf = ctx.Array(ctypes.c_double, len(env_fns))
+        self.done_buf = ctx.Array(ctypes.c_bool, len(env_fns))
+        self.rew_view = _view(self.rew_buf, len(env_fns), (), np.float64)
+        self.done_view = _view(self.done_buf, len(env_fns), (), np.bool_)
+        self.cmds = ctx.Array(ctypes.c_int32, len(self.slices))
+        self.has_infos = ctx.Array(ctypes.c_bool, len(self.slices))
+        self.cmd_sems = [None] * len(self.slices)
+        self.result_sems = [None] * len(self.slices)
+        self.parent_pipes = [None] * len(self.slices)
+        self.procs = [None] * len(self.slices)
+        for worker in range(len(self.slices)):
+            self._start_worker(worker)
+
         if spaces:
             observation_space, action_space = spaces
         else:
-            logger.log('Creating dummy env object to get spaces')
-            with logger.scoped_configure(format_strs=[]):
-                dummy = env_fns[0]()
-                observation_space, action_space = dummy.observation_space, dummy.action_space
-                dummy.close()
-                del dummy
+            self._send(0, 'get_spaces')
+            observation_space, action_space = self.parent_pipes[0].recv()
         VecEnv.__init__(self, len(env_fns), observation_space, action_space)
         self.obs_keys, self.obs_shapes, self.obs_dtypes = obs_space_info(observation_space)
-        self.obs_bufs = [
-            {k: ctx.Array(_NP_TO_CT[self.obs_dtypes[k].type], int(np.prod(self.obs_shapes[k]))) for k in self.obs_keys}
-            for _ in env_fns]
-        self.parent_pipes = []
-        self.procs = []
-        with clear_mpi_env_vars():
-            for env_fn, obs_buf in zip(env_fns, self.obs_bufs):
-                wrapped_fn = CloudpickleWrapper(env_fn)
-                parent_pipe, child_pipe = ctx.Pipe()
-                proc = ctx.Process(target=_subproc_worker,
-                            args=(child_pipe, parent_pipe, wrapped_fn, obs_buf, self.obs_shapes, self.obs_dtypes, self.obs_keys))
-                proc.daemon = True
-                self.procs.append(proc)
-                self.parent_pipes.append(parent_pipe)
-                proc.start()
-                child_pipe.close()
+        specs = {('obs', k): ((len(env_fns),) + tuple(self.obs_shapes[k]), self.obs_dtypes[k].str) for k in self.obs_keys}
+        act_dtype = np.dtype(action_space.dtype) if action_space.dtype is not None else None
+        if action_space.shape is not None and act_dtype is not None and act_dtype != object:
+            specs[('act', None)] = ((len(env_fns),) + tuple(action_space.shape), act_dtype.str)
+        # files in a memory-backed file system when there is one
+        shmem_dir = tempfile.mkdtemp(prefix='shmem_vec_env', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        # the files stay mapped after they are removed, but restarted workers need to attach them again
+        self._remove_shmem_dir = weakref.finalize(self, shutil.rmtree, shmem_dir, True)
+        self.shmem_attach = (shmem_dir, specs)
+        try:
+            views = _attach(shmem_dir, specs, mode='w+')
+            for worker in range(len(self.slices)):
+                self._send(worker, 'attach', self.shmem_attach)
+            for pipe in self.parent_pipes:
+                pipe.recv()
+        finally:
+            if not max_restarts:
+                self._remove_shmem_dir()
+        self.obs_views = {k: views[('obs', k)] for k in self.obs_keys}
+        self.act_view = views.get(('act', None))
+
+        self.copy_obs = copy_obs
         self.waiting_step = False
+        self.step_in_shmem = False
         self.viewer = None
+        self.startup_time = time.time() - start_time
+        logger.log('ShmemVecEnv: started {} envs in {} workers in {:.1f}s'.format(
+            self.num_envs, len(self.slices), self.startup_time))
 
     def reset(self):
         if self.waiting_step:
             logger.warn('Called reset() while waiting for the step to complete')
             self.step_wait()
-        for pipe in self.parent_pipes:
-            pipe.send(('reset', None))
-        return self._decode_obses([pipe.recv() for pipe in self.parent_pipes])
+        self._send_all('reset')
+        return self._decode_obses(_flatten_list([self._recv(worker, 'reset') for worker in range(len(self.slices))]))
 
     def step_async(self, actions):
-        assert len(actions) == len(self.parent_pipes)
-        for pipe, act in zip(self.parent_pipes, actions):
-            pipe.send(('step', act))
+        assert len(actions) == self.num_envs
+        self.step_in_shmem = self.act_view is not None and np.shape(actions) == self.act_view.shape
+        if self.step_in_shmem:
+            np.copyto(self.act_view, actions, casting='unsafe')
+            for worker, sem in enumerate(self.cmd_sems):
+                self.cmds[worker] = _CMD_STEP
+                sem.release()
+        else:
+            for worker, env_slice in enumerate(self.slices):
+                self._send(worker, 'step', actions[env_slice])
+        self.waiting_step = True
 
     def step_wait(self):
-        outs = [pipe.recv() for pipe in self.parent_pipes]
-        obs, rews, dones, infos = zip(*outs)
-        return self._decode_obses(obs), np.array(rews), np.array(dones), infos
+        self.waiting_step = False
+        if not self.step_in_shmem:
+            outs = _flatten_list([self._recv(worker) for worker in range(len(self.slices))])
+            obs, rews, dones, infos = zip(*outs)
+            return self._decode_obses(obs), np.array(rews), np.array(dones), infos
+        infos = [{} for _ in range(self.num_envs)]
+        for worker, env_slice in enumerate(self.slices):
+            reason = self._wait_step(worker)
+            if reason is not None:
+                self._restart_worker(worker, reason)
+                self.rew_view[env_slice] = 0.0
+                self.done_view[env_slice] = True
+                infos[env_slice] = [{'worker_restarted': True} for _ in range(env_slice.start, env_slice.stop)]
+            elif self.has_infos[worker]:
+                for env_idx, info in self.parent_pipes[worker].recv():
+                    infos[env_idx] = info
+        return self._decode_obses(None), self.rew_view.copy(), self.done_view.copy(), tuple(infos)
 
     def close_extras(self):
         if self.waiting_step:
             self.step_wait()
+        self._send_all('close')
         for pipe in self.parent_pipes:
-            pipe.send(('close', None))
-        for pipe in self.parent_pipes:
-            pipe.recv()
+            try:
+                pipe.recv()
+            except _PIPE_ERRORS:
+                pass
             pipe.close()
         for proc in self.procs:
             proc.join()
+        self._remove_shmem_dir()
 
     def get_images(self, mode='human'):
-        for pipe in self.parent_pipes:
-            pipe.send(('render', None))
-        return [pipe.recv() for pipe in self.parent_pipes]
+        self._send_all('render')
+        return _flatten_list([pipe.recv() for pipe in self.parent_pipes])
 
-    def _decode_obses(self, obs):
-        result = {}
-        for k in self.obs_keys:
+    def _start_worker(self, worker):
+        # a restarted worker gets new semaphores, those of the dead one may have been left with a count
+        self.cmd_sems[worker] = self.ctx.Semaphore(0)
+        self.result_sems[worker] = self.ctx.Semaphore(0)
+        parent_pipe, child_pipe = self.ctx.Pipe()
+        shared = (self.rew_buf, self.done_buf, self.cmds, self.has_infos,
+                  self.cmd_sems[worker], self.result_sems[worker])
+        proc = self.ctx.Process(target=_subproc_worker,
+                    args=(child_pipe, parent_pipe, self.env_fns[worker], worker, shared, self.slices[worker].start,
+                          len(self.rew_view)))
+        proc.daemon = True
+        with clear_mpi_env_vars(), limit_worker_threads(self.worker_threads):
+            proc.start()
+        pin_process(proc.pid, self.cpu_sets and self.cpu_sets[worker % len(self.cpu_sets)])
+        child_pipe.close()
+        self.parent_pipes[worker], self.procs[worker] = parent_pipe, proc
+
+    def _send(self, worker, cmd, data=None):
+        self.cmds[worker] = _CMD_PIPE
+        self.cmd_sems[worker].release()
+        try:
+            self.parent_pipes[worker].send((cmd, data))
+        except _PIPE_ERRORS:
+            pass  # the worker has died, which the following _recv handles
+
+    def _send_all(self, cmd):
+        for worker in range(len(self.slices)):
+            self._send(worker, cmd)
+
+    def _recv(self, worker, cmd='step'):
+        """
+        Receive the answer of a worker to cmd ('step' or 'reset') through its
+        pipe, restarting the worker if it has died or timed out.
+        """
+        pipe = self.parent_pipes[worker]
+        try:
+            if self.step_timeout is None or pipe.poll(self.step_timeout):
+                return pipe.recv()
+            reason = 'timed out after {}s'.format(self.step_timeout)
+        except _PIPE_ERRORS:
+            reason = 'died'
+        outs = self._restart_worker(worker, reason)
+        if cmd == 'reset':
+            return outs
+        return [(None, 0.0, True, {'worker_restarted': True}) for _ in outs]
+
+    def _wait_step(self, worker):
+        """
+        Wait for a worker to step through shared memory. Returns None once it
+        has, or why it never will. A healthy worker is waited for with a
+        single blocking acquire, only slow ones are checked for liveness.
+        """
+        deadline = self.step_timeout and time.time() + self.step_timeout
+        poll_interval = min(_POLL_INTERVAL, self.step_timeout or _POLL_INTERVAL)
+        while not self.result_sems[worker].acquire(timeout=poll_interval):
+            if not self.procs[worker].is_alive():
+                return 'died'
+            if deadline and time.time() > deadline:
+                return 'timed out after {}s'.format(self.step_timeout)
+        return None
+
+    def _restart_worker(self, worker, reason):
+        """
+        Replace a worker by a new one with new envs, which are reset.
+        """
+        proc = self.procs[worker]
+        if proc.is_alive():
+            proc.kill()
+        proc.join()
+        message = 'ShmemVecEnv worker {} {} (exit code {})'.format(worker, reason, proc.exitcode)
+        if sum(self.restarts) >= self.max_restarts:
+            self.waiting_step = False  # close() must not wait for the step of the other workers
+            raise RuntimeError(message)
+        self.restarts[worker] += 1
+        logger.warn('{}, restarting it ({} restarts so far)'.format(message, sum(self.restarts)))
+        self.parent_pipes[worker].close()
+        self._start_worker(worker)
+        # creating the envs may take longer than step_timeout
+        self._send(worker, 'attach', self.shmem_attach)
+        self.parent_pipes[worker].recv()
+        self._send(worker, 'reset')
+        return self._recv(worker, 'reset')
 
-            bufs = [b[k] for b in self.obs_bufs]
-            o = [np.frombuffer(b.get_obj(), dtype=self.obs_dtypes[k]).reshape(self.obs_shapes[k]) for b in bufs]
-            result[k] = np.array(o)
+    def _decode_obses(self, obs):
+        if self.copy_obs:
+            result = {k: self.obs_views[k].copy() for k in self.obs_keys}
+        else:
+            result = dict(self.obs_views)
         return dict_to_obs(result)
 
 
-def _subproc_worker(pipe, parent_pipe, env_fn_wrapper, obs_bufs, obs_shapes, obs_dtypes, keys):
+def _flatten_list(l):
+    return [x for sublist in l for x in sublist]
+
+
+def _view(buf, num_envs, shape, dtype):
+    return np.frombuffer(buf.get_obj(), dtype=dtype).reshape((num_envs,) + tuple(shape))
+
+
+def _attach(shmem_dir, specs, mode='r+'):
+    return {name: np.memmap(os.path.join(shmem_dir, '{}_{}.dat'.format(*name)), dtype=np.dtype(dtype), mode=mode,
+                            shape=tuple(shape))
+            for name, (shape, dtype) in specs.items()}
+
+
+def _subproc_worker(pipe, parent_pipe, env_fn_wrappers, worker, shared, first_env_idx, num_envs):
     """
-    Control a single environment instance using IPC and
-    shared memory.
+    Control a group of environment instances using IPC and
+    shared memory. The observations of the i-th env are
+    written to row first_env_idx + i of the shared buffers.
     """
-    def _write_obs(maybe_dict_obs):
+    rew_buf, done_buf, cmds, has_infos, cmd_sem, result_sem = shared
+    rew_view = _view(rew_buf, num_envs, (), np.float64)
+    done_view = _view(done_buf, num_envs, (), np.bool_)
+    obs_views, act_view = None, None
+
+    def _write_obs(env_idx, maybe_dict_obs):
         flatdict = obs_to_dict(maybe_dict_obs)
-        for k in keys:
-            dst = obs_bufs[k].get_obj()
-            dst_np = np.frombuffer(dst, dtype=obs_dtypes[k]).reshape(obs_shapes[k])  # pylint: disable=W0212
-            np.copyto(dst_np, flatdict[k])
+        for k, view in obs_views.items():
+            np.copyto(view[first_env_idx + env_idx], flatdict[k])
+
+    def _step_env(env_idx, env, action):
+        obs, reward, done, info = env.step(action)
+        if done:
+            obs = env.reset()
+        return _write_obs(env_idx, obs), reward, done, info
 
-    env = env_fn_wrapper.x()
+    def _step_shmem():
+        infos = []
+        for i, env in enumerate(envs):
+            _, reward, done, info = _step_env(i, env, act_view[first_env_idx + i].copy())
+            rew_view[first_env_idx + i] = reward
+            done_view[first_env_idx + i] = done
+            if info:
+                infos.append((first_env_idx + i, info))
+        has_infos[worker] = bool(infos)
+        if infos:
+            pipe.send(infos)
+        result_sem.release()
+
+    envs = [env_fn() for env_fn in env_fn_wrappers.x]
     parent_pipe.close()
     try:
         while True:
+            cmd_sem.acquire()
+            if cmds[worker] == _CMD_STEP:
+                _step_shmem()
+                continue
             cmd, data = pipe.recv()
             if cmd == 'reset':
-                pipe.send(_write_obs(env.reset()))
+                pipe.send([_write_obs(i, env.reset()) for i, env in enumerate(envs)])
             elif cmd == 'step':
-                obs, reward, done, info = env.step(data)
-                if done:
-                    obs = env.reset()
-                pipe.send((_write_obs(obs), reward, done, info))
+                pipe.send([_step_env(i, env, action) for i, (env, action) in enumerate(zip(envs, data))])
             elif cmd == 'render':
-                pipe.send(env.render(mode='rgb_array'))
+                pipe.send([env.render(mode='rgb_array') for env in envs])
+            elif cmd == 'get_spaces':
+                pipe.send((envs[0].observation_space, envs[0].action_space))
+            elif cmd == 'attach':
+                views = _attach(*data)
+                obs_views = {k: view for (kind, k), view in views.items() if kind == 'obs'}
+                act_view = views.get(('act', None))
+                pipe.send(None)
             elif cmd == 'close':
                 pipe.send(None)
                 break
@@ -136,4 +351,5 @@ def _subproc_worker(pipe, parent_pipe, env_fn_wrapper, obs_bufs, obs_shapes, obs
     except KeyboardInterrupt:
         print('ShmemVecEnv worker: got KeyboardInterrupt')
     finally:
-        env.close()
+        for env in envs:
+            env.close()
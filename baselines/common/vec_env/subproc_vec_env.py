@@ -1,36 +1,44 @@
-import multiprocessing as mp
+import time
 
 import numpy as np
-from .vec_env import VecEnv, CloudpickleWrapper, clear_mpi_env_vars
+from baselines import logger
+from .vec_env import VecEnv, CloudpickleWrapper, clear_mpi_env_vars, limit_worker_threads, pin_process, get_context
+from .util import split_envs
 
+# errors raised when using the pipe of a worker that has died
+_PIPE_ERRORS = (EOFError, ConnectionError)
+
+
+def worker(remote, parent_remote, env_fn_wrappers):
+    def step_env(env, action):
+        ob, reward, done, info = env.step(action)
+        if done:
+            ob = env.reset()
+        return ob, reward, done, info
 
-def worker(remote, parent_remote, env_fn_wrapper):
     parent_remote.close()
-    env = env_fn_wrapper.x()
+    envs = [env_fn_wrapper() for env_fn_wrapper in env_fn_wrappers.x]
     try:
         while True:
             cmd, data = remote.recv()
             if cmd == 'step':
-                ob, reward, done, info = env.step(data)
-                if done:
-                    ob = env.reset()
-                remote.send((ob, reward, done, info))
+                remote.send([step_env(env, action) for env, action in zip(envs, data)])
             elif cmd == 'reset':
-                ob = env.reset()
-                remote.send(ob)
+                remote.send([env.reset() for env in envs])
             elif cmd == 'render':
-                remote.send(env.render(mode='rgb_array'))
+                remote.send([env.render(mode='rgb_array') for env in envs])
             elif cmd == 'close':
                 remote.close()
                 break
             elif cmd == 'get_spaces_spec':
-                remote.send((env.observation_space, env.action_space, env.spec))
+                remote.send((envs[0].observation_space, envs[0].action_space, envs[0].spec))
             else:
                 raise NotImplementedError
     except KeyboardInterrupt:
         print('SubprocVecEnv worker: got KeyboardInterrupt')
     finally:
-        env.close()
+        for env in envs:
+            env.close()
 
 
 class SubprocVecEnv(VecEnv):
@@ -38,57 +46,82 @@ class SubprocVecEnv(VecEnv):
     VecEnv that runs multiple environments in parallel in subproceses and communicates with them via pipes.
     Recommended to use when num_envs > 1 and step() can be a bottleneck.
     """
-    def __init__(self, env_fns, spaces=None, context='spawn'):
+    def __init__(self, env_fns, spaces=None, context='spawn', num_workers=None, cpu_sets=None, worker_threads=None,
+                 preload=None, max_restarts=0, step_timeout=None):
         """
         Arguments:
 
         env_fns: iterable of callables -  functions that create environments to run in subprocesses. Need to be cloud-pickleable
+        num_workers: number of subprocesses. Each one runs a contiguous group of the environments in series, and
+                     steps them all for a single message, which saves pipe round trips with cheap environments.
+                     Defaults to one subprocess per environment.
+        cpu_sets: list of sets of CPUs, the i-th subprocess is pinned to cpu_sets[i % len(cpu_sets)] (see vec_env.util.cpu_layout)
+        worker_threads: maximum number of BLAS/OpenMP threads in each subprocess
+        context: multiprocessing context used to start the subprocesses. With 'forkserver', they are forked from a
+                 server process that has imported the modules in preload (see vec_env.get_context).
+        max_restarts: number of times a subprocess that dies (or times out) is restarted from env_fns. The
+                      environments of a restarted subprocess are reset, and the step returns done=True for
+                      them with info['worker_restarted'] = True. Once max_restarts is used up, a RuntimeError
+                      is raised instead. The restarts of each subprocess are counted in self.restarts.
+        step_timeout: number of seconds after which a subprocess that has not answered is considered hung,
+                      and killed. Defaults to waiting forever.
         """
+        start_time = time.time()
         self.waiting = False
         self.closed = False
+        env_fns = list(env_fns)
         self.nenvs = len(env_fns)
-        ctx = mp.get_context(context)
-        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(self.nenvs)])
-        self.ps = [ctx.Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
-                   for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
-        for p in self.ps:
-            p.daemon = True  # if the main process crashes, we should not cause things to hang
-            with clear_mpi_env_vars():
-                p.start()
-        for remote in self.work_remotes:
-            remote.close()
-
-        self.remotes[0].send(('get_spaces_spec', None))
-        observation_space, action_space, self.spec = self.remotes[0].recv()
+        self.slices = split_envs(self.nenvs, num_workers)
+        self.env_fns = [CloudpickleWrapper(env_fns[env_slice]) for env_slice in self.slices]
+        self.ctx = get_context(context, preload)
+        self.cpu_sets = cpu_sets
+        self.worker_threads = worker_threads
+        self.max_restarts = max_restarts
+        self.step_timeout = step_timeout
+        self.restarts = [0] * len(self.slices)
+        self.remotes, self.ps = [None] * len(self.slices), [None] * len(self.slices)
+        for i in range(len(self.slices)):
+            self._start_worker(i)
+
+        # waiting for every worker to answer also measures the time taken to create all the envs
+        for remote in self.remotes:
+            remote.send(('get_spaces_spec', None))
+        observation_space, action_space, self.spec = [remote.recv() for remote in self.remotes][0]
         self.viewer = None
         VecEnv.__init__(self, len(env_fns), observation_space, action_space)
+        self.startup_time = time.time() - start_time
+        logger.log('SubprocVecEnv: started {} envs in {} workers in {:.1f}s'.format(
+            self.nenvs, len(self.slices), self.startup_time))
 
     def step_async(self, actions):
         self._assert_not_closed()
-        for remote, action in zip(self.remotes, actions):
-            remote.send(('step', action))
+        for i, env_slice in enumerate(self.slices):
+            self._send(i, ('step', actions[env_slice]))
         self.waiting = True
 
     def step_wait(self):
         self._assert_not_closed()
-        results = [remote.recv() for remote in self.remotes]
+        results = _flatten_list([self._recv(i) for i in range(len(self.slices))])
         self.waiting = False
         obs, rews, dones, infos = zip(*results)
         return _flatten_obs(obs), np.stack(rews), np.stack(dones), infos
 
     def reset(self):
         self._assert_not_closed()
-        for remote in self.remotes:
-            remote.send(('reset', None))
-        return _flatten_obs([remote.recv() for remote in self.remotes])
+        for i in range(len(self.slices)):
+            self._send(i, ('reset', None))
+        return _flatten_obs(_flatten_list([self._recv(i, 'reset') for i in range(len(self.slices))]))
 
     def close_extras(self):
         self.closed = True
         if self.waiting:
             for remote in self.remotes:
-                remote.recv()
-        for remote in self.remotes:
-            remote.send(('close', None))
+                try:
+                    remote.recv()
+                except _PIPE_ERRORS:
+                    pass
+        for i in range(len(self.slices)):
+            self._send(i, ('close', None))
         for p in self.ps:
             p.join()
 
@@ -96,9 +129,64 @@ class SubprocVecEnv(VecEnv):
         self._assert_not_closed()
         for pipe in self.remotes:
             pipe.send(('render', None))
-        imgs = [pipe.recv() for pipe in self.remotes]
+        imgs = _flatten_list([pipe.recv() for pipe in self.remotes])
         return imgs
 
+    def _start_worker(self, i):
+        remote, work_remote = self.ctx.Pipe()
+        p = self.ctx.Process(target=worker, args=(work_remote, remote, self.env_fns[i]))
+        p.daemon = True  # if the main process crashes, we should not cause things to hang
+        with clear_mpi_env_vars(), limit_worker_threads(self.worker_threads):
+            p.start()
+        pin_process(p.pid, self.cpu_sets and self.cpu_sets[i % len(self.cpu_sets)])
+        work_remote.close()
+        self.remotes[i], self.ps[i] = remote, p
+
+    def _send(self, i, message):
+        try:
+            self.remotes[i].send(message)
+        except _PIPE_ERRORS:
+            pass  # the worker has died, which the following _recv handles
+
+    def _recv(self, i, cmd='step'):
+        """
+        Receive the answer of worker i to cmd ('step' or 'reset'). If the worker
+        has died or timed out, restart it and return the synthetic answer.
+        """
+        remote = self.remotes[i]
+        try:
+            if self.step_timeout is None or remote.poll(self.step_timeout):
+                return remote.recv()
+            reason = 'timed out after {}s'.format(self.step_timeout)
+        except _PIPE_ERRORS:
+            reason = 'died'
+        obs = self._restart_worker(i, reason)
+        if cmd == 'reset':
+            return obs
+        return [(ob, 0.0, True, {'worker_restarted': True}) for ob in obs]
+
+    def _restart_worker(self, i, reason):
+        """
+        Replace worker i by a new one with new environments, and return their first observations.
+        """
+        p = self.ps[i]
+        if p.is_alive():
+            p.kill()
+        p.join()
+        message = 'SubprocVecEnv worker {} {} (exit code {})'.format(i, reason, p.exitcode)
+        if sum(self.restarts) >= self.max_restarts:
+            self.waiting = False  # close() must not wait for the answers of the other workers
+            raise RuntimeError(message)
+        self.restarts[i] += 1
+        logger.warn('{}, restarting it ({} restarts so far)'.format(message, sum(self.restarts)))
+        self.remotes[i].close()
+        self._start_worker(i)
+        # creating the envs may take longer than step_timeout
+        self.remotes[i].send(('get_spaces_spec', None))
+        self.remotes[i].recv()
+        self._send(i, ('reset', None))
+        return self._recv(i, 'reset')
+
     def _assert_not_closed(self):
         assert not self.closed, "Trying to operate on a SubprocVecEnv after calling close()"
 
@@ -106,6 +194,10 @@ class SubprocVecEnv(VecEnv):
         if not self.closed:
             self.close()
 
+def _flatten_list(l):
+    return [x for sublist in l for x in sublist]
+
+
 def _flatten_obs(obs):
     assert isinstance(obs, (list, tuple))
     assert len(obs) > 0
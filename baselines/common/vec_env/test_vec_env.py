@@ -2,12 +2,19 @@
 Tests for asynchronous vectorized environments.
 """
 
+import os
+
 import gym
 import numpy as np
 import pytest
 from .dummy_vec_env import DummyVecEnv
 from .shmem_vec_env import ShmemVecEnv
 from .subproc_vec_env import SubprocVecEnv
+from .async_vec_env import AsyncSubprocVecEnv
+from .vec_frame_stack import VecFrameStack
+from .vec_normalize import VecNormalize
+from .vec_monitor import VecMonitor
+from .util import cpu_layout
 from baselines.common.tests.test_with_mpi import with_mpi
 
 
@@ -67,6 +74,277 @@ def test_vec_env(klass, dtype):  # pylint: disable=R0914
     assert_venvs_equal(env1, env2, num_steps=num_steps)
 
 
+@pytest.mark.parametrize('klass', (ShmemVecEnv, SubprocVecEnv))
+def test_vec_env_num_workers(klass):
+    """
+    Test that running several envs per subprocess gives
+    the same results as DummyVecEnv.
+    """
+    shape = (3, 8)
+    fns = [lambda seed=seed: SimpleEnv(seed, shape, 'float32') for seed in range(5)]
+    assert_venvs_equal(DummyVecEnv(fns), klass(fns, num_workers=2), num_steps=20)
+
+
+@pytest.mark.parametrize('num_workers', (None, 2))
+def test_async_subproc_vec_env(num_workers):
+    """
+    Test that stepping envs in partial batches gives every
+    env the same trajectory as stepping it on its own.
+    """
+    shape = (3, 8)
+    num_envs = 4
+    fns = [lambda seed=seed: SimpleEnv(seed, shape, 'float32') for seed in range(num_envs)]
+    expected = [fn() for fn in fns]
+    venv = AsyncSubprocVecEnv(fns, batch_size=2, num_workers=num_workers)
+    try:
+        venv.async_reset()
+        num_steps = np.zeros(num_envs, dtype=int)
+        for _ in range(20):
+            obs, rews, dones, _, env_ids = venv.recv()
+            assert len(env_ids) == 2
+            for ob, rew, done, env_id in zip(obs, rews, dones, env_ids):
+                env = expected[env_id]
+                if num_steps[env_id] == 0:
+                    exp_ob, exp_rew, exp_done = env.reset(), 0.0, False
+                else:
+                    exp_ob, exp_rew, exp_done, _ = env.step(np.full(shape, num_steps[env_id], dtype='float32'))
+                    if exp_done:
+                        exp_ob = env.reset()
+                assert np.allclose(ob, exp_ob) and rew == exp_rew and done == exp_done
+            num_steps[env_ids] += 1
+            venv.send([np.full(shape, n, dtype='float32') for n in num_steps[env_ids]], env_ids)
+    finally:
+        venv.close()
+
+
+@pytest.mark.parametrize('klass', (ShmemVecEnv, SubprocVecEnv))
+def test_vec_env_forkserver(klass):
+    """
+    Test that the envs can be started from a fork server,
+    with the spaces read from the first worker.
+    """
+    shape = (3, 8)
+    fns = [lambda seed=seed: SimpleEnv(seed, shape, 'uint8') for seed in range(3)]
+    env = klass(fns, context='forkserver')
+    assert env.startup_time > 0
+    assert_venvs_equal(DummyVecEnv(fns), env, num_steps=20)
+
+
+@pytest.mark.parametrize('klass', (ShmemVecEnv, SubprocVecEnv))
+def test_vec_env_worker_restart(klass):
+    """
+    Test that a worker whose env crashes is restarted, its
+    envs returning done=True, and that the other workers
+    keep stepping normally.
+    """
+    shape = (3, 8)
+    fns = [lambda: CrashingEnv(0, shape, 'float32', crash_step=2)] + \
+          [lambda seed=seed: SimpleEnv(seed, shape, 'float32') for seed in range(1, 3)]
+    env = klass(fns, max_restarts=1)
+    try:
+        obs = env.reset()
+        actions = np.zeros((3,) + shape, dtype='float32')
+        env.step(actions)
+        obs, _, dones, infos = env.step(actions)
+        assert dones[0] and infos[0]['worker_restarted']
+        assert env.restarts == [1, 0, 0]
+        assert np.allclose(obs[0], CrashingEnv(0, shape, 'float32').reset())
+        assert 'worker_restarted' not in infos[1]
+        env.step(actions)
+        with pytest.raises(RuntimeError):
+            env.step(actions)
+    finally:
+        env.close()
+
+
+@pytest.mark.parametrize('copy_obs', (True, False))
+def test_vec_frame_stack(copy_obs):
+    """
+    Test that VecFrameStack stacks the frames in order and
+    clears the stack of the envs that are done.
+    """
+    shape = (3, 8)
+    nstack = 3
+    fns = [lambda seed=seed: SimpleEnv(seed, shape, 'float32') for seed in range(3)]
+    venv = DummyVecEnv(fns)
+    env = VecFrameStack(DummyVecEnv(fns), nstack, copy_obs=copy_obs)
+    try:
+        obs = venv.reset()
+        expected = np.zeros((3,) + shape[:-1] + (shape[-1] * nstack,), dtype='float32')
+        expected[..., -shape[-1]:] = obs
+        assert np.array_equal(env.reset(), expected)
+        previous = None
+        for step in range(10):
+            actions = np.full((3,) + shape, step, dtype='float32')
+            obs, _, dones, _ = venv.step(actions)
+            expected = np.roll(expected, shift=-shape[-1], axis=-1)
+            expected[dones] = 0
+            expected[..., -shape[-1]:] = obs
+            stacked, _, _, _ = env.step(actions)
+            assert np.array_equal(stacked, expected)
+            # the observations of the step, not a copy of them
+            assert env.stackedobs is stacked
+            # a new array every step, or the same one overwritten
+            assert previous is None or (stacked is previous) != copy_obs
+            previous = stacked
+        out = np.empty_like(expected)
+        assert env.stacked_obs(out) is out and np.array_equal(out, expected)
+    finally:
+        venv.close()
+        env.close()
+
+
+def test_vec_normalize_save_load(tmpdir):
+    """
+    Test that frozen VecNormalize statistics are not updated,
+    and that saved statistics normalize like the original ones.
+    """
+    shape = (3, 8)
+    fns = [lambda seed=seed: SimpleEnv(seed, shape, 'float32') for seed in range(3)]
+    env = VecNormalize(DummyVecEnv(fns), update_every=2, update_envs=2)
+    actions = np.ones((3,) + shape, dtype='float32')
+    env.reset()
+    for _ in range(5):
+        env.step(actions)
+    assert env.ob_rms.mean.dtype == np.float32
+    assert env.ob_rms.count == pytest.approx(6 + 1e-4)
+    path = str(tmpdir.join('stats'))
+    env.save(path)
+    env.training = False
+    mean, count = env.ob_rms.mean.copy(), env.ob_rms.count
+    obs, _, _, _ = env.step(actions)
+    assert np.array_equal(env.ob_rms.mean, mean) and env.ob_rms.count == count
+
+    env2 = VecNormalize(DummyVecEnv(fns), training=False)
+    env2.load(path)
+    env2.reset()
+    for _ in range(5):
+        env2.step(actions)
+    obs2, _, _, _ = env2.step(actions)
+    assert np.allclose(obs, obs2)
+
+
+def test_vec_monitor(tmpdir):
+    """
+    Test that VecMonitor reports the finished episodes in
+    the infos and writes them all to its results file.
+    """
+    shape = (3, 8)
+    fns = [lambda seed=seed: SimpleEnv(seed, shape, 'float32') for seed in range(3)]
+    path = str(tmpdir.join('vec'))
+    env = VecMonitor(DummyVecEnv(fns), filename=path, keep_buf=100)
+    env.reset()
+    actions = np.zeros((3,) + shape, dtype='float32')
+    for _ in range(6):
+        _, _, dones, infos = env.step(actions)
+        for done, info in zip(dones, infos):
+            assert ('episode' in info) == done
+            assert info['foo'].startswith('bar')
+    # the episodes last 1, 2 and 3 steps
+    assert env.epcount == 6 + 3 + 2
+    assert list(env.eplen_buf).count(3) == 2
+    env.close()
+    with open(path + '.monitor.csv') as f:
+        assert len(f.readlines()) == 2 + env.epcount
+
+
+def test_cpu_layout():
+    """
+    Test that the CPUs are split between MPI ranks, then
+    between the learner and the workers of each rank.
+    """
+    learner_cpus, worker_cpus = cpu_layout(4, local_rank=1, local_size=2, cpus=range(16))
+    assert learner_cpus == {8, 9, 10, 11}
+    assert worker_cpus == [{12}, {13}, {14}, {15}]
+    learner_cpus, worker_cpus = cpu_layout(5, cpus=range(4))
+    assert learner_cpus == {0}
+    assert worker_cpus == [{1}, {2}, {3}, {1}, {2}]
+
+
+def test_shmem_vec_env_views():
+    """
+    Test that ShmemVecEnv can return views of its shared
+    observation buffers instead of copies.
+    """
+    shape = (3, 8)
+    fns = [lambda seed=seed: SimpleEnv(seed, shape, 'uint8') for seed in range(3)]
+    env = ShmemVecEnv(fns, copy_obs=False)
+    obs = env.reset()
+    assert obs.base is not None
+    assert_venvs_equal(DummyVecEnv(fns), env, num_steps=20)
+
+
+@pytest.mark.parametrize('num_workers', (None, 2))
+def test_shmem_vec_env_infos(num_workers):
+    """
+    Test that ShmemVecEnv only sends the non-empty infos
+    through the pipes, and returns the same infos as DummyVecEnv.
+    """
+    shape = (3, 8)
+    fns = [lambda seed=seed: SparseInfoEnv(seed, shape, 'float32') for seed in range(4)]
+    assert_venvs_equal(DummyVecEnv(fns), ShmemVecEnv(fns, num_workers=num_workers), num_steps=20)
+    env = ShmemVecEnv(fns, num_workers=num_workers)
+    try:
+        env.reset()
+        for step in range(1, 6):
+            _, _, dones, infos = env.step(np.zeros((4,) + shape, dtype='float32'))
+            assert env.step_in_shmem
+            # env i is done every i + 1 steps and only has an info then
+            assert list(dones) == [step % (i + 1) == 0 for i in range(4)]
+            assert [bool(info) for info in infos] == list(dones)
+            assert [env.has_infos[worker] for worker in range(len(env.slices))] == \
+                [bool(dones[env_slice].any()) for env_slice in env.slices]
+            assert not any(pipe.poll() for pipe in env.parent_pipes)
+    finally:
+        env.close()
+
+
+def test_shmem_vec_env_pipe_actions():
+    """
+    Test that ShmemVecEnv steps through the pipes, with the same
+    results as DummyVecEnv, when the actions do not fit the shared
+    action buffer (e.g. joint actions).
+    """
+    shape = (3, 8)
+    fns = [lambda seed=seed: JointActionEnv(seed, shape, 'float32') for seed in range(3)]
+    env1, env2 = DummyVecEnv(fns), ShmemVecEnv(fns, num_workers=2)
+    try:
+        assert np.allclose(env1.reset(), env2.reset())
+        for step in range(10):
+            actions = [(step, env_idx) for env_idx in range(3)]
+            outs1 = env1.step(actions)
+            env2.step_async(actions)
+            assert not env2.step_in_shmem
+            outs2 = env2.step_wait()
+            for out1, out2 in zip(outs1[:3], outs2[:3]):
+                assert np.allclose(out1, out2)
+            assert list(outs1[3]) == list(outs2[3])
+    finally:
+        env1.close()
+        env2.close()
+
+
+def test_shmem_vec_env_dtypes():
+    """
+    Test that ShmemVecEnv returns rewards and dones of the same
+    dtypes as SubprocVecEnv, through shared memory and the pipes.
+    """
+    shape = (3, 8)
+    fns = [lambda seed=seed: JointActionEnv(seed, shape, 'float32') for seed in range(2)]
+    subproc_env, shmem_env = SubprocVecEnv(fns), ShmemVecEnv(fns)
+    try:
+        for actions in [np.zeros((2,) + shape, dtype='float32'), [(1, 2), (3, 4)]]:
+            subproc_env.reset()
+            shmem_env.reset()
+            _, rews1, dones1, _ = subproc_env.step(actions)
+            _, rews2, dones2, _ = shmem_env.step(actions)
+            assert rews1.dtype == rews2.dtype and rews1.shape == rews2.shape == (2,)
+            assert dones1.dtype == dones2.dtype and dones1.shape == dones2.shape == (2,)
+    finally:
+        subproc_env.close()
+        shmem_env.close()
+
+
 class SimpleEnv(gym.Env):
     """
     An environment with a pre-determined observation space
@@ -102,6 +380,44 @@ class SimpleEnv(gym.Env):
         raise NotImplementedError
 
 
+class CrashingEnv(SimpleEnv):
+    """
+    A SimpleEnv whose process dies at a given step.
+    """
+
+    def __init__(self, seed, shape, dtype, crash_step=None):
+        SimpleEnv.__init__(self, seed, shape, dtype)
+        self._max_steps = 100
+        self._crash_step = crash_step
+        self._total_steps = 0
+
+    def step(self, action):
+        self._total_steps += 1
+        if self._total_steps == self._crash_step:
+            os._exit(1)
+        return SimpleEnv.step(self, action)
+
+
+class SparseInfoEnv(SimpleEnv):
+    """
+    A SimpleEnv that only has an info at the end of its episodes.
+    """
+
+    def step(self, action):
+        obs, reward, done, info = SimpleEnv.step(self, action)
+        return obs, reward, done, info if done else {}
+
+
+class JointActionEnv(SimpleEnv):
+    """
+    A SimpleEnv stepped with a pair of numbers, like the joint
+    actions of two agents, which do not fit its action space.
+    """
+
+    def step(self, action):
+        return SimpleEnv.step(self, np.full(self._start_obs.shape, sum(action), dtype=self._dtype))
+
+
 
 @with_mpi()
 def test_mpi_with_subprocvecenv():
@@ -2,6 +2,7 @@
 Helpers for dealing with vectorized environments.
 """
 
+import os
 from collections import OrderedDict
 
 import gym
@@ -57,3 +58,42 @@ def obs_to_dict(obs):
     if isinstance(obs, dict):
         return obs
     return {None: obs}
+
+
+def split_envs(num_envs, num_workers=None):
+    """
+    Split num_envs environments into num_workers contiguous
+    groups of (nearly) equal size, one per worker process.
+    Returns a list of slices. By default, every env gets
+    its own worker.
+    """
+    num_workers = num_envs if num_workers is None else num_workers
+    assert 1 <= num_workers <= num_envs, 'need between 1 and num_envs workers'
+    sizes = [num_envs // num_workers + (i < num_envs % num_workers) for i in range(num_workers)]
+    starts = np.cumsum([0] + sizes)
+    return [slice(start, end) for start, end in zip(starts[:-1], starts[1:])]
+
+
+def cpu_layout(num_workers, local_rank=0, local_size=1, cpus=None):
+    """
+    Assign CPUs to the learner process and to num_workers env workers.
+
+    The CPUs (by default, those the calling process may run on) are split
+    evenly between the local_size processes on this machine (e.g. the MPI
+    ranks, see mpi_util.get_local_rank_size), and the share of local_rank is
+    split between its learner and its workers: every worker gets a CPU of
+    its own and the learner gets the rest, or at least one CPU, in which case
+    the workers share the other CPUs round-robin.
+
+    Returns (learner_cpus, worker_cpus), where worker_cpus is a list with
+    one set of CPUs per worker.
+    """
+    if cpus is None:
+        cpus = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else range(os.cpu_count())
+    cpus = sorted(cpus)
+    share = np.array_split(cpus, local_size)[local_rank % local_size].tolist()
+    if len(share) < 2:
+        return set(share), [set(share)] * num_workers
+    num_learner = max(1, len(share) - num_workers)
+    learner_cpus, worker_pool = share[:num_learner], share[num_learner:]
+    return set(learner_cpus), [{worker_pool[i % len(worker_pool)]} for i in range(num_workers)]
@@ -1,4 +1,5 @@
 import contextlib
+import multiprocessing as mp
 import os
 from abc import ABC, abstractmethod
 
@@ -217,3 +218,54 @@ def clear_mpi_env_vars():
         yield
     finally:
         os.environ.update(removed_environment)
+
+
+_THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS']
+
+
+@contextlib.contextmanager
+def limit_worker_threads(num_threads):
+    """
+    Cap the BLAS/OpenMP thread pools of the processes started within this context, by setting the
+    environment variables the libraries read when they are loaded. Does nothing if num_threads is None.
+    """
+    saved_environment = {k: os.environ.get(k) for k in _THREAD_ENV_VARS}
+    if num_threads is not None:
+        os.environ.update({k: str(num_threads) for k in _THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for k, v in saved_environment.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def pin_process(pid, cpus):
+    """
+    Restrict the process pid (0 for the calling process) to the given set of CPUs.
+    Does nothing if cpus is None or on platforms without os.sched_setaffinity.
+    """
+    if cpus is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(pid, cpus)
+
+
+# modules imported by the fork server, they are then already loaded in every worker it forks
+DEFAULT_FORKSERVER_PRELOAD = ['numpy', 'gym', 'cloudpickle', 'baselines.common.vec_env.subproc_vec_env',
+                              'baselines.common.vec_env.shmem_vec_env']
+
+
+def get_context(context, preload=None):
+    """
+    Get the multiprocessing context used to start the workers of a VecEnv.
+    For 'forkserver', the server imports the modules in preload in addition to
+    DEFAULT_FORKSERVER_PRELOAD (e.g. the package of the env) before forking the
+    workers, so they start without re-importing them. None of these modules
+    import tensorflow, so neither do the workers.
+    The preloaded modules can only be set before the fork server is first started.
+    """
+    ctx = mp.get_context(context)
+    if context == 'forkserver':
+        ctx.set_forkserver_preload(DEFAULT_FORKSERVER_PRELOAD + list(preload or []))
+    return ctx
@@ -4,27 +4,58 @@ from gym import spaces
 
 
 class VecFrameStack(VecEnvWrapper):
-    def __init__(self, venv, nstack):
+    """
+    Stack the last nstack observations of each env along the last axis.
+
+    The frames are kept in a ring of nstack buffers, the newest frame
+    overwriting the oldest one, and are only put in order (oldest first)
+    once per step, into the stacked observations returned by step and
+    reset, which stackedobs returns as well.
+
+    With copy_obs=True, these are new arrays every step. With copy_obs=False,
+    they are a single preallocated array, overwritten by the next step, so the
+    caller must copy whatever it keeps past the next call to step_async.
+    stacked_obs(out) writes the stacked observations into a caller-provided
+    buffer instead.
+    """
+    def __init__(self, venv, nstack, copy_obs=True):
         self.venv = venv
         self.nstack = nstack
+        self.copy_obs = copy_obs
         wos = venv.observation_space  # wrapped ob space
         low = np.repeat(wos.low, self.nstack, axis=-1)
         high = np.repeat(wos.high, self.nstack, axis=-1)
-        self.stackedobs = np.zeros((venv.num_envs,) + low.shape, low.dtype)
+        self.frames = np.zeros((nstack, venv.num_envs) + wos.shape, low.dtype)
+        self.newest = nstack - 1  # index in self.frames of the last observation
         observation_space = spaces.Box(low=low, high=high, dtype=venv.observation_space.dtype)
         VecEnvWrapper.__init__(self, venv, observation_space=observation_space)
+        self.stackedobs = np.zeros((venv.num_envs,) + low.shape, low.dtype)
+
+    def stacked_obs(self, out=None):
+        """
+        Return the stacked observations of shape (num_envs, ..., C * nstack),
+        written into out if it is given.
+        """
+        order = [(self.newest + 1 + i) % self.nstack for i in range(self.nstack)]
+        if out is None:
+            out = np.empty((self.num_envs,) + self.observation_space.shape, self.frames.dtype)
+        return np.concatenate([self.frames[i] for i in order], axis=-1, out=out)
 
     def step_wait(self):
         obs, rews, news, infos = self.venv.step_wait()
-        self.stackedobs = np.roll(self.stackedobs, shift=-1, axis=-1)
-        for (i, new) in enumerate(news):
-            if new:
-                self.stackedobs[i] = 0
-        self.stackedobs[..., -obs.shape[-1]:] = obs
-        return self.stackedobs, rews, news, infos
+        self.newest = (self.newest + 1) % self.nstack
+        done_mask = np.asarray(news, dtype=bool)
+        if done_mask.any():
+            self.frames[:, done_mask] = 0
+        self.frames[self.newest] = obs
+        return self._update_stackedobs(), rews, news, infos
 
     def reset(self):
         obs = self.venv.reset()
-        self.stackedobs[...] = 0
-        self.stackedobs[..., -obs.shape[-1]:] = obs
+        self.frames[...] = 0
+        self.frames[self.newest] = obs
+        return self._update_stackedobs()
+
+    def _update_stackedobs(self):
+        self.stackedobs = self.stacked_obs(None if self.copy_obs else self.stackedobs)
         return self.stackedobs
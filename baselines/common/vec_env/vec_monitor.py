@@ -5,14 +5,19 @@ import time
 from collections import deque
 
 class VecMonitor(VecEnvWrapper):
-    def __init__(self, venv, filename=None, keep_buf=0):
+    def __init__(self, venv, filename=None, keep_buf=0, flush_rows=1, flush_secs=10.):
+        """
+        The episodes are written to filename as they end. Larger flush_rows buffer
+        the rows, see ResultsWriter.
+        """
         VecEnvWrapper.__init__(self, venv)
         self.eprets = None
         self.eplens = None
         self.epcount = 0
         self.tstart = time.time()
         if filename:
-            self.results_writer = ResultsWriter(filename, header={'t_start': self.tstart})
+            self.results_writer = ResultsWriter(filename, header={'t_start': self.tstart},
+                                                flush_rows=flush_rows, flush_secs=flush_secs)
         else:
             self.results_writer = None
         self.keep_buf = keep_buf
@@ -30,20 +35,27 @@ class VecMonitor(VecEnvWrapper):
         obs, rews, dones, infos = self.venv.step_wait()
         self.eprets += rews
         self.eplens += 1
-        newinfos = []
-        for (i, (done, ret, eplen, info)) in enumerate(zip(dones, self.eprets, self.eplens, infos)):
-            info = info.copy()
-            if done:
-                epinfo = {'r': ret, 'l': eplen, 't': round(time.time() - self.tstart, 6)}
-                info['episode'] = epinfo
-                if self.keep_buf:
-                    self.epret_buf.append(ret)
-                    self.eplen_buf.append(eplen)
-                self.epcount += 1
-                self.eprets[i] = 0
-                self.eplens[i] = 0
-                if self.results_writer:
-                    self.results_writer.write_row(epinfo)
-            newinfos.append(info)
+        newinfos = list(infos)
+        done_ids = np.flatnonzero(dones)
+        if len(done_ids) == 0:
+            return obs, rews, dones, newinfos
 
+        t = round(time.time() - self.tstart, 6)
+        rets, lens = self.eprets[done_ids], self.eplens[done_ids]
+        epinfos = [{'r': ret, 'l': eplen, 't': t} for ret, eplen in zip(rets, lens)]
+        for i, epinfo in zip(done_ids, epinfos):
+            newinfos[i] = dict(infos[i], episode=epinfo)
+        if self.keep_buf:
+            self.epret_buf.extend(rets)
+            self.eplen_buf.extend(lens)
+        self.epcount += len(done_ids)
+        self.eprets[done_ids] = 0
+        self.eplens[done_ids] = 0
+        if self.results_writer:
+            self.results_writer.write_rows(epinfos)
         return obs, rews, dones, newinfos
+
+    def close(self):
+        if self.results_writer:
+            self.results_writer.close()
+        return self.venv.close()
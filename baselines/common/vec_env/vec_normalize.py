@@ -9,35 +9,78 @@ class VecNormalize(VecEnvWrapper):
     and returns from an environment.
     """
 
-    def __init__(self, venv, ob=True, ret=True, clipob=10., cliprew=10., gamma=0.99, epsilon=1e-8):
+    def __init__(self, venv, ob=True, ret=True, clipob=10., cliprew=10., gamma=0.99, epsilon=1e-8,
+                 dtype='float32', update_every=1, update_envs=None, training=True):
+        """
+        The observation statistics are computed, and the observations normalized, in dtype.
+        They are updated every update_every steps, from the observations of update_envs of
+        the envs (a different group at each update, all of them by default).
+
+        With training=False, the statistics are frozen, e.g. for evaluation. save and load
+        them so that evaluation and deployment use the normalization of training.
+        """
         VecEnvWrapper.__init__(self, venv)
-        self.ob_rms = RunningMeanStd(shape=self.observation_space.shape) if ob else None
+        self.ob_rms = RunningMeanStd(shape=self.observation_space.shape, dtype=dtype) if ob else None
         self.ret_rms = RunningMeanStd(shape=()) if ret else None
         self.clipob = clipob
         self.cliprew = cliprew
         self.ret = np.zeros(self.num_envs)
         self.gamma = gamma
         self.epsilon = epsilon
+        self.update_every = update_every
+        self.update_envs = update_envs or self.num_envs
+        self.training = training
+        self.num_steps = 0
+        self.first_update_env = 0
 
     def step_wait(self):
         obs, rews, news, infos = self.venv.step_wait()
         self.ret = self.ret * self.gamma + rews
         obs = self._obfilt(obs)
         if self.ret_rms:
-            self.ret_rms.update(self.ret)
+            if self.training:
+                self.ret_rms.update(self.ret)
             rews = np.clip(rews / np.sqrt(self.ret_rms.var + self.epsilon), -self.cliprew, self.cliprew)
         self.ret[news] = 0.
         return obs, rews, news, infos
 
     def _obfilt(self, obs):
         if self.ob_rms:
-            self.ob_rms.update(obs)
-            obs = np.clip((obs - self.ob_rms.mean) / np.sqrt(self.ob_rms.var + self.epsilon), -self.clipob, self.clipob)
-            return obs
+            if self.training and self.num_steps % self.update_every == 0:
+                self._update_ob_rms(obs)
+            self.num_steps += 1
+            # a copy in the dtype of the statistics, normalized in place
+            obs = np.array(obs, dtype=self.ob_rms.mean.dtype)
+            obs -= self.ob_rms.mean
+            obs /= np.sqrt(self.ob_rms.var + self.epsilon)
+            return np.clip(obs, -self.clipob, self.clipob, out=obs)
         else:
             return obs
 
+    def _update_ob_rms(self, obs):
+        if self.update_envs < self.num_envs:
+            env_ids = (self.first_update_env + np.arange(self.update_envs)) % self.num_envs
+            self.first_update_env = (self.first_update_env + self.update_envs) % self.num_envs
+            obs = obs[env_ids]
+        self.ob_rms.update(obs)
+
     def reset(self):
         self.ret = np.zeros(self.num_envs)
         obs = self.venv.reset()
         return self._obfilt(obs)
+
+    def save(self, path):
+        """Save the normalization statistics to path, as an .npz file."""
+        stats = {}
+        for name, rms in [('ob_rms', self.ob_rms), ('ret_rms', self.ret_rms)]:
+            if rms:
+                stats.update({name + '_mean': rms.mean, name + '_var': rms.var, name + '_count': rms.count})
+        with open(path, 'wb') as f:
+            np.savez(f, **stats)
+
+    def load(self, path):
+        """Replace the normalization statistics by the ones saved to path by save."""
+        with np.load(path) as stats:
+            for name, rms in [('ob_rms', self.ob_rms), ('ret_rms', self.ret_rms)]:
+                if rms:
+                    rms.set_moments(stats[name + '_mean'], stats[name + '_var'], stats[name + '_count'])
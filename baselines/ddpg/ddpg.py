@@ -8,6 +8,7 @@ from baselines.ddpg.models import Actor, Critic
 from baselines.ddpg.memory import Memory
 from baselines.ddpg.noise import AdaptiveParamNoiseSpec, NormalActionNoise, OrnsteinUhlenbeckActionNoise
 from baselines.common import set_global_seeds
+from baselines.common.prefetch import PrefetchSampler
 import baselines.common.tf_util as U
 
 from baselines import logger
@@ -18,6 +19,10 @@ try:
 except ImportError:
     MPI = None
 
+def _memory_dtype(space):
+    # integer spaces (e.g. uint8 images) keep their dtype, floating-point ones (float64 in most gym envs) take float32
+    return space.dtype if np.issubdtype(space.dtype, np.integer) else np.float32
+
 def learn(network, env,
           seed=None,
           total_timesteps=None,
@@ -39,6 +44,9 @@ def learn(network, env,
           nb_train_steps=50, # per epoch cycle and MPI worker,
           nb_eval_steps=100,
           batch_size=64, # per MPI worker
+          prefetch_batches=0, # batches sampled ahead of time in a background thread
+          memory_dir=None, # if set, the replay memory is kept in memory-mapped files in this directory
+          memory_obs_dtype=None, # dtype of the observations in the replay memory, defaults to float32, or to that of integer (e.g. uint8) observation spaces
           tau=0.01,
           eval_env=None,
           param_noise_adaption_interval=50,
@@ -60,7 +68,11 @@ def learn(network, env,
     nb_actions = env.action_space.shape[-1]
     assert (np.abs(env.action_space.low) == env.action_space.high).all()  # we assume symmetric actions.
 
-    memory = Memory(limit=int(1e6), action_shape=env.action_space.shape, observation_shape=env.observation_space.shape)
+    memory = Memory(limit=int(1e6), action_shape=env.action_space.shape, observation_shape=env.observation_space.shape,
+                    storage_dir=memory_dir, observation_dtype=memory_obs_dtype or _memory_dtype(env.observation_space),
+                    action_dtype=_memory_dtype(env.action_space))
+    if prefetch_batches > 0:
+        memory = PrefetchSampler(memory, batch_size, num_batches=prefetch_batches)
     critic = Critic(network=network, **network_kwargs)
     actor = Actor(nb_actions, network=network, **network_kwargs)
 
@@ -152,7 +164,7 @@ def learn(network, env,
                 # Book-keeping.
                 epoch_actions.append(action)
                 epoch_qs.append(q)
-                agent.store_transition(obs, action, r, new_obs, done) #the batched data will be unrolled in memory.py's append.
+                agent.store_transition(obs, action, r, new_obs, done) #the batched data is added at once by memory.py's append_batch.
 
                 obs = new_obs
 
@@ -269,5 +281,7 @@ def learn(network, env,
                 with open(os.path.join(logdir, 'eval_env_state.pkl'), 'wb') as f:
                     pickle.dump(eval_env.get_state(), f)
 
+    if prefetch_batches > 0:
+        memory.close()
 
     return agent
@@ -1,12 +1,21 @@
+import json
+import os
+
 import numpy as np
 
+from baselines.common.buffer_io import save_arrays, load_arrays
+
 
 class RingBuffer(object):
-    def __init__(self, maxlen, shape, dtype='float32'):
+    def __init__(self, maxlen, shape, dtype='float32', filename=None, mode='w+'):
         self.maxlen = maxlen
         self.start = 0
         self.length = 0
-        self.data = np.zeros((maxlen,) + shape).astype(dtype)
+        if filename is None:
+            self.data = np.zeros((maxlen,) + shape, dtype=dtype)
+        else:
+            # with mode='r+' the file is reopened, its start and length are restored by Memory
+            self.data = np.memmap(filename, dtype=dtype, mode=mode, shape=(maxlen,) + shape)
 
     def __len__(self):
         return self.length
@@ -31,27 +40,95 @@ class RingBuffer(object):
             raise RuntimeError()
         self.data[(self.start + self.length - 1) % self.maxlen] = v
 
-
-def array_min2d(x):
-    x = np.array(x)
+    def extend(self, vs):
+        # append a batch of entries with at most two slice assignments, one on each side of the wrap point
+        vs = np.asarray(vs).reshape((-1,) + self.data.shape[1:])[-self.maxlen:]
+        n = len(vs)
+        end = (self.start + self.length) % self.maxlen
+        first = min(n, self.maxlen - end)
+        self.data[end:end + first] = vs[:first]
+        self.data[:n - first] = vs[first:]
+        overflow = max(0, self.length + n - self.maxlen)
+        self.start = (self.start + overflow) % self.maxlen
+        self.length = min(self.maxlen, self.length + n)
+
+
+def array_min2d(x, dtype=None):
+    x = np.asarray(x, dtype=dtype)
     if x.ndim >= 2:
         return x
     return x.reshape(-1, 1)
 
 
 class Memory(object):
-    def __init__(self, limit, action_shape, observation_shape):
+    def __init__(self, limit, action_shape, observation_shape, storage_dir=None,
+                 observation_dtype='float32', action_dtype='float32'):
+        """Replay memory of DDPG.
+
+        Observations and actions are stored with the given dtypes, e.g. those
+        of the spaces (uint8 for images), or float16 to halve the memory taken
+        by float observations. Terminals are stored as bools. Everything is
+        cast to float32 when sampled.
+
+        If storage_dir is given, the ring buffers are np.memmap files in that
+        directory, which lets the memory grow larger than the available RAM.
+        A memory previously stored there is reopened, e.g. when restarting
+        after a crash, provided it was created with the same limit, shapes
+        and dtypes.
+        """
         self.limit = limit
-
-        self.observations0 = RingBuffer(limit, shape=observation_shape)
-        self.actions = RingBuffer(limit, shape=action_shape)
-        self.rewards = RingBuffer(limit, shape=(1,))
-        self.terminals1 = RingBuffer(limit, shape=(1,))
-        self.observations1 = RingBuffer(limit, shape=observation_shape)
+        self.storage_dir = storage_dir
+        self.counters = None
+        specs = {
+            'observations0': (observation_shape, observation_dtype),
+            'actions': (action_shape, action_dtype),
+            'rewards': ((1,), 'float32'),
+            'terminals1': ((1,), 'bool'),
+            'observations1': (observation_shape, observation_dtype),
+        }
+        reopen = False
+        if storage_dir is not None:
+            os.makedirs(storage_dir, exist_ok=True)
+            meta = {'limit': limit,
+                    'arrays': {name: [list(shape), np.dtype(dtype).str] for name, (shape, dtype) in specs.items()}}
+            meta_path = os.path.join(storage_dir, 'meta.json')
+            reopen = os.path.exists(meta_path)
+            if reopen:
+                with open(meta_path) as f:
+                    saved_meta = json.load(f)
+                assert saved_meta == meta, "the memory in {} was created with different settings: {} instead of {}".format(
+                    storage_dir, saved_meta, meta)
+
+        for name, (shape, dtype) in specs.items():
+            setattr(self, name, self._ring_buffer(name, tuple(shape), dtype, mode='r+' if reopen else 'w+'))
+
+        if storage_dir is not None:
+            # start and length of the ring buffers, updated on every append
+            path = os.path.join(storage_dir, 'counters.dat')
+            if reopen:
+                self.counters = np.memmap(path, dtype=np.int64, mode='r+', shape=(2,))
+                for ring_buffer in self._ring_buffers():
+                    ring_buffer.start, ring_buffer.length = (int(x) for x in self.counters)
+            else:
+                self.counters = np.memmap(path, dtype=np.int64, mode='w+', shape=(2,))
+                # written last, so that a memory is only reopened once all its files exist
+                with open(meta_path + '.tmp', 'w') as f:
+                    json.dump(meta, f)
+                os.replace(meta_path + '.tmp', meta_path)
+
+    def _ring_buffer(self, name, shape, dtype, mode='w+'):
+        filename = None if self.storage_dir is None else os.path.join(self.storage_dir, name + '.dat')
+        return RingBuffer(self.limit, shape=shape, dtype=dtype, filename=filename, mode=mode)
+
+    def _ring_buffers(self):
+        return [self.observations0, self.actions, self.rewards, self.terminals1, self.observations1]
 
     def sample(self, batch_size):
         # Draw such that we always have a proceeding element.
         batch_idxs = np.random.randint(self.nb_entries - 2, size=batch_size)
+        if self.storage_dir is not None:
+            # read the memory-mapped files front to back
+            batch_idxs.sort()
 
         obs0_batch = self.observations0.get_batch(batch_idxs)
         obs1_batch = self.observations1.get_batch(batch_idxs)
@@ -60,11 +137,11 @@ class Memory(object):
         terminal1_batch = self.terminals1.get_batch(batch_idxs)
 
         result = {
-            'obs0': array_min2d(obs0_batch),
-            'obs1': array_min2d(obs1_batch),
-            'rewards': array_min2d(reward_batch),
-            'actions': array_min2d(action_batch),
-            'terminals1': array_min2d(terminal1_batch),
+            'obs0': array_min2d(obs0_batch, 'float32'),
+            'obs1': array_min2d(obs1_batch, 'float32'),
+            'rewards': array_min2d(reward_batch, 'float32'),
+            'actions': array_min2d(action_batch, 'float32'),
+            'terminals1': array_min2d(terminal1_batch, 'float32'),
         }
         return result
 
@@ -77,6 +154,38 @@ class Memory(object):
         self.rewards.append(reward)
         self.observations1.append(obs1)
         self.terminals1.append(terminal1)
+        if self.counters is not None:
+            self.counters[:] = (self.observations0.start, self.observations0.length)
+
+    def append_batch(self, obs0, action, reward, obs1, terminal1, training=True):
+        """Append a batch of transitions, e.g. one from every environment of a VecEnv."""
+        if not training:
+            return
+
+        self.observations0.extend(obs0)
+        self.actions.extend(action)
+        self.rewards.extend(reward)
+        self.observations1.extend(obs1)
+        self.terminals1.extend(terminal1)
+        if self.counters is not None:
+            self.counters[:] = (self.observations0.start, self.observations0.length)
+
+    def save(self, path, compress=False):
+        """Save the memory to a file, see baselines.common.buffer_io."""
+        names = ['observations0', 'actions', 'rewards', 'terminals1', 'observations1']
+        # the ring buffers hold their entries at the front until they are full
+        arrays = [(name, getattr(self, name).data[:self.nb_entries]) for name in names]
+        meta = {'limit': self.limit, 'start': self.observations0.start, 'length': self.observations0.length}
+        save_arrays(path, arrays, meta, compress=compress)
+
+    def load(self, path):
+        """Replace the content of the memory by the one saved to path by save."""
+        meta, _ = load_arrays(path, lambda name, shape, dtype: getattr(self, name).data[:shape[0]])
+        assert meta['limit'] == self.limit, "the memory was saved with a different limit"
+        for ring_buffer in self._ring_buffers():
+            ring_buffer.start, ring_buffer.length = meta['start'], meta['length']
+        if self.counters is not None:
+            self.counters[:] = (meta['start'], meta['length'])
 
     @property
     def nb_entries(self):
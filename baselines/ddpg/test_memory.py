@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from baselines.ddpg.memory import Memory
+
+
+def _append(memory, n):
+    for i in range(n):
+        memory.append(np.full(3, i), np.full(2, -i), float(i), np.full(3, i + 1), i % 5 == 0)
+
+
+def test_memory_storage_dir(tmpdir):
+    memory = Memory(limit=10, action_shape=(2,), observation_shape=(3,), storage_dir=str(tmpdir))
+    _append(memory, 25)
+    assert memory.nb_entries == 10
+    batch = memory.sample(batch_size=16)
+    np.testing.assert_array_equal(batch['obs0'][:, 0], batch['rewards'][:, 0])
+    np.testing.assert_array_equal(batch['obs1'], batch['obs0'] + 1)
+    assert batch['rewards'].min() >= 15
+
+    # reopening, e.g. after a crash, restores the stored transitions
+    del memory
+    memory = Memory(limit=10, action_shape=(2,), observation_shape=(3,), storage_dir=str(tmpdir))
+    assert memory.nb_entries == 10
+    np.testing.assert_array_equal(memory.rewards.get_batch(np.arange(10))[:, 0], np.arange(15, 25))
+
+    # but not with another limit, shape or dtype
+    for kwargs in [{'limit': 20}, {'observation_shape': (4,)}, {'observation_dtype': 'float16'}]:
+        kwargs = dict({'limit': 10, 'action_shape': (2,), 'observation_shape': (3,)}, **kwargs)
+        with pytest.raises(AssertionError, match='different settings'):
+            Memory(storage_dir=str(tmpdir), **kwargs)
+
+
+def test_memory_save_load(tmpdir):
+    path = str(tmpdir.join('memory'))
+    memory = Memory(limit=10, action_shape=(2,), observation_shape=(3,))
+    _append(memory, 25)
+    memory.save(path, compress=True)
+
+    restored = Memory(limit=10, action_shape=(2,), observation_shape=(3,))
+    restored.load(path)
+    assert restored.nb_entries == 10
+    _append(memory, 3)
+    _append(restored, 3)
+    for name in ['observations0', 'actions', 'rewards', 'terminals1', 'observations1']:
+        np.testing.assert_array_equal(getattr(memory, name).get_batch(np.arange(10)),
+                                      getattr(restored, name).get_batch(np.arange(10)))
+
+
+def test_append_batch_matches_append():
+    memory = Memory(limit=10, action_shape=(2,), observation_shape=(3,))
+    batched = Memory(limit=10, action_shape=(2,), observation_shape=(3,))
+    i = 0
+    # batches that fit, wrap around the end of the ring buffers, and exceed the limit
+    for nenvs in [3, 4, 6, 1, 13, 5]:
+        obs0 = np.arange(i, i + nenvs)[:, None] * np.ones(3)
+        action = -obs0[:, :2]
+        reward = np.arange(i, i + nenvs, dtype=np.float32)
+        terminal1 = reward % 5 == 0
+        for b in range(nenvs):
+            memory.append(obs0[b], action[b], reward[b], obs0[b] + 1, terminal1[b])
+        batched.append_batch(obs0, action, reward, obs0 + 1, terminal1)
+        i += nenvs
+        assert memory.nb_entries == batched.nb_entries
+        for name in ['observations0', 'actions', 'rewards', 'terminals1', 'observations1']:
+            np.testing.assert_array_equal(getattr(memory, name).get_batch(np.arange(memory.nb_entries)),
+                                          getattr(batched, name).get_batch(np.arange(batched.nb_entries)))
+
+
+def test_memory_dtypes():
+    memory = Memory(limit=10, action_shape=(2,), observation_shape=(4, 4, 3), observation_dtype='uint8')
+    for i in range(12):
+        obs = np.full((4, 4, 3), 200 + i, dtype=np.uint8)
+        memory.append(obs, np.ones(2), 1.0, obs, i % 2 == 0)
+    assert memory.observations0.data.dtype == np.uint8
+    assert memory.terminals1.data.dtype == bool
+    batch = memory.sample(batch_size=8)
+    for name in ['obs0', 'obs1', 'rewards', 'actions', 'terminals1']:
+        assert batch[name].dtype == np.float32
+    assert batch['obs0'].min() >= 202
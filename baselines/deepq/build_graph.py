@@ -74,6 +74,10 @@ The functions in this file can are used to create the following functions:
     weight: np.array
         imporance weights for every element of the batch (gradient is multiplied
         by the importance weight) dtype must be float32 and shape must be (batch_size,)
+    discount: np.array
+        optional discount applied to max_a' Q(s', a') for every element of the batch,
+        e.g. gamma ** n for n-step returns (default: gamma).
+        dtype must be float32 and shape must be (batch_size,)
 
     Returns
     -------
@@ -341,7 +345,7 @@ def build_train(make_obs_ph, q_func, num_actions, optimizer, grad_norm_clipping=
     grad_norm_clipping: float or None
         clip gradient norms to this value. If None no clipping is performed.
     gamma: float
-        discount rate.
+        discount rate. Used when train is not given a per-sample discount.
     double_q: bool
         if true will use Double Q Learning (https://arxiv.org/abs/1509.06461).
         In general it is a good idea to keep it enabled.
@@ -360,7 +364,7 @@ def build_train(make_obs_ph, q_func, num_actions, optimizer, grad_norm_clipping=
     act: (tf.Variable, bool, float) -> tf.Variable
         function to select and action given observation.
 `       See the top of the file for details.
-    train: (object, np.array, np.array, object, np.array, np.array) -> np.array
+    train: (object, np.array, np.array, object, np.array, np.array, np.array) -> np.array
         optimize the error in Bellman's equation.
 `       See the top of the file for details.
     update_target: () -> ()
@@ -383,6 +387,7 @@ def build_train(make_obs_ph, q_func, num_actions, optimizer, grad_norm_clipping=
         obs_tp1_input = make_obs_ph("obs_tp1")
         done_mask_ph = tf.placeholder(tf.float32, [None], name="done")
         importance_weights_ph = tf.placeholder(tf.float32, [None], name="weight")
+        discount_ph = tf.placeholder(tf.float32, [None], name="discount")
 
         # q network evaluation
         q_t = q_func(obs_t_input.get(), num_actions, scope="q_func", reuse=True)  # reuse parameters from act
@@ -405,7 +410,7 @@ def build_train(make_obs_ph, q_func, num_actions, optimizer, grad_norm_clipping=
         q_tp1_best_masked = (1.0 - done_mask_ph) * q_tp1_best
 
         # compute RHS of bellman equation
-        q_t_selected_target = rew_t_ph + gamma * q_tp1_best_masked
+        q_t_selected_target = rew_t_ph + discount_ph * q_tp1_best_masked
 
         # compute the error (potentially clipped)
         td_error = q_t_selected - tf.stop_gradient(q_t_selected_target)
@@ -437,10 +442,12 @@ def build_train(make_obs_ph, q_func, num_actions, optimizer, grad_norm_clipping=
                 rew_t_ph,
                 obs_tp1_input,
                 done_mask_ph,
-                importance_weights_ph
+                importance_weights_ph,
+                discount_ph
             ],
             outputs=td_error,
-            updates=[optimize_expr]
+            updates=[optimize_expr],
+            givens={discount_ph: [gamma]}
         )
         update_target = U.function([], [], updates=[update_target_expr])
 
@@ -11,6 +11,7 @@ from baselines.common.tf_util import load_variables, save_variables
 from baselines import logger
 from baselines.common.schedules import LinearSchedule
 from baselines.common import set_global_seeds
+from baselines.common.prefetch import PrefetchSampler
 
 from baselines import deepq
 from baselines.deepq.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
@@ -98,15 +99,20 @@ def learn(env,
           lr=5e-4,
           total_timesteps=100000,
           buffer_size=50000,
+          replay_storage='list',
+          replay_storage_dir=None,
           exploration_fraction=0.1,
           exploration_final_eps=0.02,
           train_freq=1,
           batch_size=32,
+          prefetch_batches=0,
           print_freq=100,
           checkpoint_freq=10000,
           checkpoint_path=None,
+          checkpoint_replay_buffer=False,
           learning_starts=1000,
           gamma=1.0,
+          n_step=1,
           target_network_update_freq=500,
           prioritized_replay=False,
           prioritized_replay_alpha=0.6,
@@ -136,6 +142,13 @@ def learn(env,
         number of env steps to optimizer for
     buffer_size: int
         size of the replay buffer
+    replay_storage: str
+        storage used by the replay buffer, 'list', 'array' or 'frames' (see ReplayBuffer.__init__).
+        'array' preallocates numpy arrays and samples batches without python loops. 'frames' additionally
+        stores every frame of observations stacked by atari_wrappers.FrameStack only once.
+    replay_storage_dir: str
+        if not None, the 'array' and 'frames' replay storages are kept in memory-mapped files in this directory,
+        and a replay buffer found there is reopened.
     exploration_fraction: float
         fraction of entire training period over which the exploration rate is annealed
     exploration_final_eps: float
@@ -145,6 +158,9 @@ def learn(env,
         set to None to disable printing
     batch_size: int
         size of a batched sampled from replay buffer for training
+    prefetch_batches: int
+        if positive, up to this many batches are sampled from the replay buffer ahead of time
+        in a background thread (see baselines.common.prefetch.PrefetchSampler)
     print_freq: int
         how often to print out training progress
         set to None to disable printing
@@ -152,10 +168,19 @@ def learn(env,
         how often to save the model. This is so that the best version is restored
         at the end of the training. If you do not wish to restore the best version at
         the end of the training set this variable to None.
+    checkpoint_path: str
+        directory to save the checkpoints to. The latest model saved there is loaded
+        when training starts, e.g. to resume after the job was preempted.
+    checkpoint_replay_buffer: bool
+        if True, the replay buffer is saved to checkpoint_path along with the model,
+        and loaded when training resumes, in which case learning starts right away.
     learning_starts: int
         how many steps of the model to collect transitions for before learning starts
     gamma: float
         discount factor
+    n_step: int
+        number of steps of the TD targets. Values above 1 use n-step returns computed by the replay buffer,
+        which requires replay_storage to be 'array' or 'frames'.
     target_network_update_freq: int
         update the target network every `target_network_update_freq` steps.
     prioritized_replay: True
@@ -219,15 +244,19 @@ def learn(env,
 
     # Create the replay buffer
     if prioritized_replay:
-        replay_buffer = PrioritizedReplayBuffer(buffer_size, alpha=prioritized_replay_alpha)
+        replay_buffer = PrioritizedReplayBuffer(buffer_size, alpha=prioritized_replay_alpha, storage=replay_storage,
+                                                n_step=n_step, gamma=gamma, storage_dir=replay_storage_dir)
         if prioritized_replay_beta_iters is None:
             prioritized_replay_beta_iters = total_timesteps
         beta_schedule = LinearSchedule(prioritized_replay_beta_iters,
                                        initial_p=prioritized_replay_beta0,
                                        final_p=1.0)
     else:
-        replay_buffer = ReplayBuffer(buffer_size)
+        replay_buffer = ReplayBuffer(buffer_size, storage=replay_storage, n_step=n_step, gamma=gamma,
+                                     storage_dir=replay_storage_dir)
         beta_schedule = None
+    if prefetch_batches > 0:
+        replay_buffer = PrefetchSampler(replay_buffer, batch_size, num_batches=prefetch_batches)
     # Create the schedule for exploration starting from 1.
     exploration = LinearSchedule(schedule_timesteps=int(exploration_fraction * total_timesteps),
                                  initial_p=1.0,
@@ -247,11 +276,17 @@ def learn(env,
 
         model_file = os.path.join(td, "model")
         model_saved = False
+        replay_buffer_file = os.path.join(td, "replay_buffer")
+        checkpoint_replay_buffer = checkpoint_replay_buffer and checkpoint_path is not None
 
         if tf.train.latest_checkpoint(td) is not None:
             load_variables(model_file)
             logger.log('Loaded model from {}'.format(model_file))
             model_saved = True
+            if checkpoint_replay_buffer and os.path.exists(replay_buffer_file):
+                replay_buffer.load(replay_buffer_file)
+                logger.log('Loaded {} transitions from {}'.format(len(replay_buffer), replay_buffer_file))
+                learning_starts = 0
         elif load_path is not None:
             load_variables(load_path)
             logger.log('Loaded model from {}'.format(load_path))
@@ -294,11 +329,13 @@ def learn(env,
                 # Minimize the error in Bellman's equation on a batch sampled from replay buffer.
                 if prioritized_replay:
                     experience = replay_buffer.sample(batch_size, beta=beta_schedule.value(t))
-                    (obses_t, actions, rewards, obses_tp1, dones, weights, batch_idxes) = experience
+                    experience, (weights, batch_idxes) = experience[:-2], experience[-2:]
                 else:
-                    obses_t, actions, rewards, obses_tp1, dones = replay_buffer.sample(batch_size)
-                    weights, batch_idxes = np.ones_like(rewards), None
-                td_errors = train(obses_t, actions, rewards, obses_tp1, dones, weights)
+                    experience = replay_buffer.sample(batch_size)
+                    weights, batch_idxes = np.ones_like(experience[2]), None
+                # with n-step returns, experience also holds the discount of every sample
+                obses_t, actions, rewards, obses_tp1, dones = experience[:5]
+                td_errors = train(obses_t, actions, rewards, obses_tp1, dones, weights, *experience[5:])
                 if prioritized_replay:
                     new_priorities = np.abs(td_errors) + prioritized_replay_eps
                     replay_buffer.update_priorities(batch_idxes, new_priorities)
@@ -323,6 +360,8 @@ def learn(env,
                         logger.log("Saving model due to mean reward increase: {} -> {}".format(
                                    saved_mean_reward, mean_100ep_reward))
                     save_variables(model_file)
+                    if checkpoint_replay_buffer:
+                        replay_buffer.save(replay_buffer_file)
                     model_saved = True
                     saved_mean_reward = mean_100ep_reward
         if model_saved:
@@ -330,4 +369,7 @@ def learn(env,
                 logger.log("Restored model with mean reward: {}".format(saved_mean_reward))
             load_variables(model_file)
 
+    if prefetch_batches > 0:
+        replay_buffer.close()
+
     return act
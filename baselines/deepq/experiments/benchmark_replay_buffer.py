@@ -0,0 +1,45 @@
+import argparse
+import time
+
+import numpy as np
+
+from baselines.deepq.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+
+
+def benchmark(buffer, num_transitions, batch_size, num_batches, obs_shape):
+    tstart = time.time()
+    for i in range(num_transitions):
+        # fresh arrays every step, like observations coming out of an env
+        obs = np.full(obs_shape, i % 256, dtype=np.uint8)
+        buffer.add(obs, i % 6, 1.0, obs + 1, float(i % 100 == 0))
+    add_time = time.time() - tstart
+
+    sample_args = {'beta': 0.4} if isinstance(buffer, PrioritizedReplayBuffer) else {}
+    tstart = time.time()
+    for _ in range(num_batches):
+        buffer.sample(batch_size, **sample_args)
+    sample_time = time.time() - tstart
+    return add_time, sample_time
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--size', type=int, default=int(1e5))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--num-batches', type=int, default=1000)
+    parser.add_argument('--obs-shape', type=int, nargs='+', default=[84, 84, 4])
+    parser.add_argument('--prioritized', action='store_true')
+    args = parser.parse_args()
+
+    for storage in ['list', 'array', 'frames']:
+        if args.prioritized:
+            buffer = PrioritizedReplayBuffer(args.size, alpha=0.6, storage=storage)
+        else:
+            buffer = ReplayBuffer(args.size, storage=storage)
+        add_time, sample_time = benchmark(buffer, args.size, args.batch_size, args.num_batches, tuple(args.obs_shape))
+        print('{:>6} storage: add {:8.1f} us/transition, sample {:8.1f} us/batch'.format(
+            storage, 1e6 * add_time / args.size, 1e6 * sample_time / args.num_batches))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,18 @@
-import numpy as np
+import json
+import os
 import random
 
+import numpy as np
+
+from baselines.common.buffer_io import save_arrays, load_arrays
 from baselines.common.segment_tree import SumSegmentTree, MinSegmentTree
 
 
 class ReplayBuffer(object):
-    def __init__(self, size):
+    _ARRAY_COLUMNS = ('obs_t', 'action', 'reward', 'obs_tp1', 'done')
+    _FRAMES_COLUMNS = ('action', 'reward', 'done')
+
+    def __init__(self, size, storage='list', frame_stack=4, n_step=1, gamma=1.0, storage_dir=None):
         """Create Replay buffer.
 
         Parameters
@@ -13,32 +20,247 @@ class ReplayBuffer(object):
         size: int
             Max number of transitions to store in the buffer. When the buffer
             overflows the old memories are dropped.
+        storage: str
+            how transitions are stored. 'list' keeps a python list of
+            transition tuples. 'array' keeps one preallocated numpy array
+            per transition element, with shape and dtype taken from the
+            first transition added, and samples batches with fancy indexing.
+            'frames' is like 'array', but for observations stacked by
+            baselines.common.atari_wrappers.FrameStack: every frame is stored
+            once and the stacks are rebuilt at sample time (see _add_frames).
+        frame_stack: int
+            number of frames stacked along the last axis of an observation.
+            Only used when storage is 'frames'.
+        n_step: int
+            number of transitions to accumulate rewards over. When larger
+            than 1, sample returns n-step discounted rewards, the observation
+            n steps later and the discount to apply to its value (see
+            _n_step_returns). Requires 'array' or 'frames' storage and
+            transitions added in the order they were collected from a single
+            environment.
+        gamma: float
+            discount factor of the n-step rewards.
+        storage_dir: str or None
+            if given, the 'array' and 'frames' storages keep their arrays
+            in np.memmap files in this directory instead of in memory, so
+            the buffer can be larger than the available memory. A buffer
+            previously stored in the directory is reopened, e.g. when
+            restarting after a crash.
         """
+        assert storage in ('list', 'array', 'frames'), "storage must be 'list', 'array' or 'frames'"
+        assert n_step == 1 or storage != 'list', "n-step returns require 'array' or 'frames' storage"
+        assert storage_dir is None or storage != 'list', "storage_dir requires 'array' or 'frames' storage"
         self._storage = []
         self._maxsize = size
         self._next_idx = 0
+        self._storage_type = storage
+        self._columns = None
+        self._num_in_buffer = 0
+        self._n_step = n_step
+        self._gamma = gamma
+
+        self._frame_stack = frame_stack
+        self._frames = None
+        self._num_added = 0
+        self._current_episode_start = 0
+        self._episode_done = True
+
+        self._storage_dir = storage_dir
+        self._array_specs = {}
+        self._counters = None
+        if storage_dir is not None:
+            os.makedirs(storage_dir, exist_ok=True)
+            if os.path.exists(os.path.join(storage_dir, 'meta.json')):
+                self._reopen()
 
     def __len__(self):
-        return len(self._storage)
+        if self._storage_type == 'list':
+            return len(self._storage)
+        return self._num_in_buffer
 
     def add(self, obs_t, action, reward, obs_tp1, done):
         data = (obs_t, action, reward, obs_tp1, done)
 
-        if self._next_idx >= len(self._storage):
-            self._storage.append(data)
+        if self._storage_type == 'list':
+            if self._next_idx >= len(self._storage):
+                self._storage.append(data)
+            else:
+                self._storage[self._next_idx] = data
         else:
-            self._storage[self._next_idx] = data
+            if self._storage_type == 'array':
+                self._add_columns(data)
+            else:
+                self._add_frames(data)
+            self._num_in_buffer = min(self._num_in_buffer + 1, self._maxsize)
         self._next_idx = (self._next_idx + 1) % self._maxsize
+        if self._counters is not None:
+            self._counters[:] = (self._next_idx, self._num_in_buffer, self._num_added,
+                                 self._current_episode_start, self._episode_done)
+
+    def _allocate(self, name, shape, dtype):
+        if self._storage_dir is None:
+            return np.empty(shape, dtype=dtype)
+        self._array_specs[name] = (shape, np.dtype(dtype).str)
+        return np.memmap(os.path.join(self._storage_dir, name + '.dat'), dtype=dtype, mode='w+', shape=shape)
+
+    def _allocate_column(self, name, example):
+        return self._allocate(name, (self._maxsize,) + example.shape, example.dtype)
+
+    def _write_meta(self):
+        # the counters are updated in place on every add, the shapes of the arrays are written once
+        self._counters = np.memmap(os.path.join(self._storage_dir, 'counters.dat'), dtype=np.int64, mode='w+', shape=(5,))
+        meta = {
+            'storage': self._storage_type,
+            'size': self._maxsize,
+            'frame_stack': self._frame_stack,
+            'arrays': self._array_specs,
+        }
+        path = os.path.join(self._storage_dir, 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    def _reopen(self):
+        with open(os.path.join(self._storage_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        assert (meta['storage'], meta['size'], meta['frame_stack']) == (self._storage_type, self._maxsize, self._frame_stack), \
+            "the buffer in {} was created with different settings".format(self._storage_dir)
+        self._array_specs = meta['arrays']
+        arrays = {name: np.memmap(os.path.join(self._storage_dir, name + '.dat'), dtype=dtype, mode='r+', shape=tuple(shape))
+                  for name, (shape, dtype) in self._array_specs.items()}
+        if self._storage_type == 'array':
+            self._columns = tuple(arrays[name] for name in self._ARRAY_COLUMNS)
+        else:
+            self._columns = tuple(arrays[name] for name in self._FRAMES_COLUMNS)
+            self._frames = arrays['frames']
+            self._episode_starts = arrays['episode_starts']
+        self._counters = np.memmap(os.path.join(self._storage_dir, 'counters.dat'), dtype=np.int64, mode='r+', shape=(5,))
+        self._next_idx, self._num_in_buffer, self._num_added, self._current_episode_start, _ = (int(x) for x in self._counters)
+        # transitions added from now on come from a new episode
+        self._episode_done = True
+
+    def _add_columns(self, data):
+        if self._columns is None:
+            self._columns = tuple(self._allocate_column(name, np.asarray(x)) for name, x in zip(self._ARRAY_COLUMNS, data))
+            if self._storage_dir is not None:
+                self._write_meta()
+        for column, x in zip(self._columns, data):
+            column[self._next_idx] = x
+
+    def _add_frames(self, data):
+        """Store only the newest frame of obs_t and obs_tp1.
+
+        Transitions must be added in the order they were collected from a
+        single environment wrapped in FrameStack, so that the frames older
+        than the newest one can be found in the previous transitions. An
+        episode starts at the first transition and after every transition
+        with done=True; the frames before the start of an episode are
+        replaced by its first frame, as FrameStack.reset does.
+
+        Frame number n (the newest frame of obs_t of the n-th transition ever
+        added) lives at n % len(self._frames). The frame buffer holds
+        frame_stack more frames than there are transitions, so the full
+        stacks of all transitions in the buffer are always available. The
+        newest frame of obs_tp1 of a transition that ended an episode is
+        overwritten by the first frame of the next episode; its obs_tp1 is
+        masked out of the TD target by done anyway.
+        """
+        obs_t, action, reward, obs_tp1, done = data
+        obs_t, obs_tp1 = np.asarray(obs_t), np.asarray(obs_tp1)
+        frame_channels = obs_t.shape[-1] // self._frame_stack
+        if self._frames is None:
+            frame = obs_t[..., -frame_channels:]
+            self._frames = self._allocate('frames', (self._maxsize + self._frame_stack,) + frame.shape, frame.dtype)
+            self._columns = tuple(self._allocate_column(name, np.asarray(x))
+                                  for name, x in zip(self._FRAMES_COLUMNS, (action, reward, done)))
+            self._episode_starts = self._allocate('episode_starts', (self._maxsize,), np.int64)
+            if self._storage_dir is not None:
+                self._write_meta()
+
+        n = self._num_added
+        if self._episode_done:
+            self._current_episode_start = n
+        num_frames = len(self._frames)
+        self._frames[n % num_frames] = obs_t[..., -frame_channels:]
+        self._frames[(n + 1) % num_frames] = obs_tp1[..., -frame_channels:]
+        for column, x in zip(self._columns, (action, reward, done)):
+            column[self._next_idx] = x
+        self._episode_starts[self._next_idx] = self._current_episode_start
+        self._episode_done = bool(done)
+        self._num_added += 1
+
+    def _stack_frames(self, frame_ids):
+        # (batch_size, frame_stack, ..., channels) -> (batch_size, ..., frame_stack * channels)
+        frames = np.moveaxis(self._frames[frame_ids % len(self._frames)], 1, -2)
+        return frames.reshape(frames.shape[:-2] + (-1,))
+
+    def _encode_frames(self, idxes):
+        actions, rewards, dones = self._columns
+        episode_starts = self._episode_starts[idxes, None]
+        newest = self._num_added - 1
+        transition_ids = newest - (newest - idxes) % self._maxsize
+        frame_ids = transition_ids[:, None] + np.arange(1 - self._frame_stack, 1)
+        obses_t = self._stack_frames(np.maximum(frame_ids, episode_starts))
+        if self._n_step > 1:
+            last, returns, last_dones, discounts = self._n_step_returns(idxes, rewards, dones)
+            obses_tpn = self._stack_frames(np.maximum(frame_ids + last[:, None] + 1, episode_starts))
+            return obses_t, actions[idxes], returns, obses_tpn, last_dones, discounts
+        obses_tp1 = self._stack_frames(np.maximum(frame_ids + 1, episode_starts))
+        return obses_t, actions[idxes], rewards[idxes], obses_tp1, dones[idxes]
+
+    def _n_step_returns(self, idxes, rewards, dones):
+        """Accumulate the discounted rewards of up to n_step consecutive
+        transitions starting at each of idxes.
+
+        The accumulation stops after a transition with done=True and at the
+        newest transition in the buffer, so fewer than n_step transitions
+        may be used. Returns the offset from idxes of the last transition
+        used, the discounted sum of rewards, the done flag of the last
+        transition used and gamma ** (number of transitions used), the
+        discount to apply to the value of obs_tp1 of the last transition.
+        """
+        offsets = np.arange(self._n_step)
+        step_idxes = (idxes[:, None] + offsets) % self._maxsize
+        oldest_idx = self._next_idx if len(self) == self._maxsize else 0
+        num_newer = len(self) - 1 - (idxes - oldest_idx) % self._maxsize
+        step_dones = dones[step_idxes] != 0
+        ended_before = np.cumsum(step_dones, axis=1) - step_dones > 0
+        used = (offsets <= num_newer[:, None]) & ~ended_before
+        num_steps = used.sum(axis=1)
+        # unused entries may point past the newest transition, at uninitialized storage
+        returns = np.where(used, rewards[step_idxes] * self._gamma ** offsets, 0).sum(axis=1)
+        last = num_steps - 1
+        last_dones = dones[step_idxes[np.arange(len(idxes)), last]]
+        return last, returns, last_dones, self._gamma ** num_steps
+
+    def _encode_arrays(self, idxes):
+        if self._storage_type == 'frames':
+            return self._encode_frames(idxes)
+        if self._n_step > 1:
+            obses_t, actions, rewards, obses_tp1, dones = self._columns
+            last, returns, last_dones, discounts = self._n_step_returns(idxes, rewards, dones)
+            obses_tpn = obses_tp1[(idxes + last) % self._maxsize]
+            return obses_t[idxes], actions[idxes], returns, obses_tpn, last_dones, discounts
+        return tuple(column[idxes] for column in self._columns)
 
     def _encode_sample(self, idxes):
+        if self._storage_type != 'list':
+            idxes = np.asarray(idxes)
+            if self._storage_dir is None:
+                return self._encode_arrays(idxes)
+            # read the memory-mapped files front to back, then restore the order of idxes
+            order = np.argsort(idxes)
+            inverse = np.empty_like(order)
+            inverse[order] = np.arange(len(order))
+            return tuple(x[inverse] for x in self._encode_arrays(idxes[order]))
         obses_t, actions, rewards, obses_tp1, dones = [], [], [], [], []
         for i in idxes:
             data = self._storage[i]
             obs_t, action, reward, obs_tp1, done = data
-            obses_t.append(np.array(obs_t, copy=False))
-            actions.append(np.array(action, copy=False))
+            obses_t.append(np.asarray(obs_t))
+            actions.append(np.asarray(action))
             rewards.append(reward)
-            obses_tp1.append(np.array(obs_tp1, copy=False))
+            obses_tp1.append(np.asarray(obs_tp1))
             dones.append(done)
         return np.array(obses_t), np.array(actions), np.array(rewards), np.array(obses_tp1), np.array(dones)
 
@@ -63,13 +285,116 @@ class ReplayBuffer(object):
         done_mask: np.array
             done_mask[i] = 1 if executing act_batch[i] resulted in
             the end of an episode and 0 otherwise.
+        discount_batch: np.array
+            only returned when n_step > 1, in which case rew_batch holds
+            the n-step discounted rewards, next_obs_batch the observations
+            n steps later and done_mask whether the episode ended within
+            those steps. discount_batch[i] is the discount to apply to the
+            value of next_obs_batch[i], gamma ** n unless the episode ended
+            or the buffer ran out of transitions earlier.
         """
-        idxes = [random.randint(0, len(self._storage) - 1) for _ in range(batch_size)]
+        if self._storage_type == 'list':
+            idxes = [random.randint(0, len(self._storage) - 1) for _ in range(batch_size)]
+        else:
+            idxes = np.random.randint(0, len(self), size=batch_size)
         return self._encode_sample(idxes)
 
+    def save(self, path, compress=False):
+        """Save the content of the buffer to a file, see baselines.common.buffer_io.
+
+        Parameters
+        ----------
+        path: str
+            file to save to
+        compress: bool
+            whether to gzip the file. Smaller, but much slower to save.
+        """
+        arrays, meta = self._snapshot()
+        save_arrays(path, arrays, meta, compress=compress)
+
+    def load(self, path):
+        """Replace the content of the buffer by the one saved to path by save.
+
+        The buffer must have been created with the same size and storage.
+        The state of the random number generators at the time of saving is
+        restored as well, so that training resumes as if not interrupted.
+        """
+        full = {}
+
+        def allocate(name, shape, dtype):
+            if self._storage_type == 'list' or name not in self._ARRAY_COLUMNS + ('frames', 'episode_starts'):
+                return np.empty(shape, dtype=dtype)
+            size = self._maxsize + self._frame_stack if name == 'frames' else self._maxsize
+            full[name] = self._allocate(name, (size,) + shape[1:], dtype)
+            return full[name][:shape[0]]
+
+        meta, arrays = load_arrays(path, allocate)
+        self._restore(meta, arrays, full)
+
+    def _snapshot(self):
+        meta = {
+            'storage': self._storage_type,
+            'size': self._maxsize,
+            'frame_stack': self._frame_stack,
+            'next_idx': self._next_idx,
+            'num_in_buffer': self._num_in_buffer,
+            'num_added': self._num_added,
+            'current_episode_start': self._current_episode_start,
+            'episode_done': self._episode_done,
+        }
+        if self._storage_type == 'list':
+            arrays = [(name, _ListColumn(self._storage, i)) for i, name in enumerate(self._ARRAY_COLUMNS)] if self._storage else []
+        elif self._columns is None:
+            arrays = []
+        elif self._storage_type == 'array':
+            arrays = [(name, column[:len(self)]) for name, column in zip(self._ARRAY_COLUMNS, self._columns)]
+        else:
+            # frame n lives at n % len(self._frames), the newest one is number self._num_added
+            arrays = [(name, column[:len(self)]) for name, column in zip(self._FRAMES_COLUMNS, self._columns)]
+            arrays.append(('frames', self._frames[:min(self._num_added + 1, len(self._frames))]))
+            arrays.append(('episode_starts', self._episode_starts[:len(self)]))
+        return arrays, meta
+
+    def _restore(self, meta, arrays, full):
+        assert (meta['storage'], meta['size'], meta['frame_stack']) == (self._storage_type, self._maxsize, self._frame_stack), \
+            "the buffer was saved with different settings"
+        if self._storage_type == 'list':
+            self._storage = list(zip(*(arrays[name] for name in self._ARRAY_COLUMNS))) if arrays else []
+        elif not full:
+            self._columns = self._frames = None
+        elif self._storage_type == 'array':
+            self._columns = tuple(full[name] for name in self._ARRAY_COLUMNS)
+        else:
+            self._columns = tuple(full[name] for name in self._FRAMES_COLUMNS)
+            self._frames = full['frames']
+            self._episode_starts = full['episode_starts']
+        self._next_idx = meta['next_idx']
+        self._num_in_buffer = meta['num_in_buffer']
+        self._num_added = meta['num_added']
+        self._current_episode_start = meta['current_episode_start']
+        self._episode_done = meta['episode_done']
+        if self._storage_dir is not None and full:
+            self._write_meta()
+            self._counters[:] = (self._next_idx, self._num_in_buffer, self._num_added,
+                                 self._current_episode_start, self._episode_done)
+
+
+class _ListColumn(object):
+    """One element of the transitions of a list storage, as an array-like for save_arrays."""
+
+    def __init__(self, storage, i):
+        self._storage = storage
+        self._i = i
+        first = np.asarray(storage[0][i])
+        self.shape = (len(storage),) + first.shape
+        self.dtype = first.dtype
+
+    def __getitem__(self, s):
+        return np.array([np.asarray(data[self._i]) for data in self._storage[s]], dtype=self.dtype)
+
 
 class PrioritizedReplayBuffer(ReplayBuffer):
-    def __init__(self, size, alpha):
+    def __init__(self, size, alpha, storage='list', frame_stack=4, n_step=1, gamma=1.0, storage_dir=None):
         """Create Prioritized Replay buffer.
 
         Parameters
@@ -80,12 +405,24 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         alpha: float
             how much prioritization is used
             (0 - no prioritization, 1 - full prioritization)
+        storage: str
+            'list', 'array' or 'frames', see ReplayBuffer.__init__
+        frame_stack: int
+            see ReplayBuffer.__init__
+        n_step: int
+            see ReplayBuffer.__init__
+        gamma: float
+            see ReplayBuffer.__init__
+        storage_dir: str or None
+            see ReplayBuffer.__init__. The priorities are kept in memory,
+            transitions of a reopened buffer start with the max priority.
 
         See Also
         --------
         ReplayBuffer.__init__
         """
-        super(PrioritizedReplayBuffer, self).__init__(size)
+        super(PrioritizedReplayBuffer, self).__init__(size, storage=storage, frame_stack=frame_stack,
+                                                      n_step=n_step, gamma=gamma, storage_dir=storage_dir)
         assert alpha >= 0
         self._alpha = alpha
 
@@ -96,6 +433,9 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         self._it_sum = SumSegmentTree(it_capacity)
         self._it_min = MinSegmentTree(it_capacity)
         self._max_priority = 1.0
+        if len(self) > 0:
+            self._it_sum[np.arange(len(self))] = self._max_priority ** self._alpha
+            self._it_min[np.arange(len(self))] = self._max_priority ** self._alpha
 
     def add(self, *args, **kwargs):
         """See ReplayBuffer.store_effect"""
@@ -105,14 +445,10 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         self._it_min[idx] = self._max_priority ** self._alpha
 
     def _sample_proportional(self, batch_size):
-        res = []
-        p_total = self._it_sum.sum(0, len(self._storage) - 1)
+        p_total = self._it_sum.sum(0, len(self) - 1)
         every_range_len = p_total / batch_size
-        for i in range(batch_size):
-            mass = random.random() * every_range_len + i * every_range_len
-            idx = self._it_sum.find_prefixsum_idx(mass)
-            res.append(idx)
-        return res
+        mass = (np.random.random(batch_size) + np.arange(batch_size)) * every_range_len
+        return self._it_sum.find_prefixsum_idx(mass)
 
     def sample(self, batch_size, beta):
         """Sample a batch of experiences.
@@ -143,6 +479,8 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         done_mask: np.array
             done_mask[i] = 1 if executing act_batch[i] resulted in
             the end of an episode and 0 otherwise.
+        discount_batch: np.array
+            only returned when n_step > 1, see ReplayBuffer.sample
         weights: np.array
             Array of shape (batch_size,) and dtype np.float32
             denoting importance weight of each sampled transition
@@ -154,19 +492,16 @@ class PrioritizedReplayBuffer(ReplayBuffer):
 
         idxes = self._sample_proportional(batch_size)
 
-        weights = []
-        p_min = self._it_min.min() / self._it_sum.sum()
-        max_weight = (p_min * len(self._storage)) ** (-beta)
+        p_total = self._it_sum.sum()
+        p_min = self._it_min.min() / p_total
+        max_weight = (p_min * len(self)) ** (-beta)
 
-        for idx in idxes:
-            p_sample = self._it_sum[idx] / self._it_sum.sum()
-            weight = (p_sample * len(self._storage)) ** (-beta)
-            weights.append(weight / max_weight)
-        weights = np.array(weights)
+        p_samples = self._it_sum[idxes] / p_total
+        weights = ((p_samples * len(self)) ** (-beta) / max_weight).astype(np.float32)
         encoded_sample = self._encode_sample(idxes)
         return tuple(list(encoded_sample) + [weights, idxes])
 
-    def update_priorities(self, idxes, priorities):
+    def update_priorities(self, idxes, priorities, num_added=0):
         """Update priorities of sampled transitions.
 
         sets priority of transition at index idxes[i] in buffer
@@ -174,18 +509,48 @@ class PrioritizedReplayBuffer(ReplayBuffer):
 
         Parameters
         ----------
-        idxes: [int]
+        idxes: [int] or np.array
             List of idxes of sampled transitions
-        priorities: [float]
+        priorities: [float] or np.array
             List of updated priorities corresponding to
             transitions at the sampled idxes denoted by
             variable `idxes`.
+        num_added: int
+            number of transitions added to the buffer since `idxes` were
+            sampled. The priorities of transitions that were overwritten
+            by them are not updated.
         """
-        assert len(idxes) == len(priorities)
-        for idx, priority in zip(idxes, priorities):
-            assert priority > 0
-            assert 0 <= idx < len(self._storage)
-            self._it_sum[idx] = priority ** self._alpha
-            self._it_min[idx] = priority ** self._alpha
-
-            self._max_priority = max(self._max_priority, priority)
+        idxes = np.asarray(idxes)
+        priorities = np.asarray(priorities)
+        assert idxes.shape == priorities.shape
+        assert np.all(priorities > 0)
+        assert np.all(0 <= idxes) and np.all(idxes < len(self))
+        if num_added > 0:
+            # the last num_added transitions were written just before self._next_idx
+            not_overwritten = (self._next_idx - 1 - idxes) % self._maxsize >= num_added
+            idxes, priorities = idxes[not_overwritten], priorities[not_overwritten]
+        if idxes.size == 0:
+            return
+        priorities_alpha = priorities ** self._alpha
+        self._it_sum[idxes] = priorities_alpha
+        self._it_min[idxes] = priorities_alpha
+
+        self._max_priority = max(self._max_priority, priorities.max())
+
+    def _snapshot(self):
+        arrays, meta = super()._snapshot()
+        # the leaves of the sum tree hold priority ** alpha
+        arrays.append(('priorities', self._it_sum[np.arange(len(self))]))
+        meta['alpha'] = self._alpha
+        meta['max_priority'] = self._max_priority
+        return arrays, meta
+
+    def _restore(self, meta, arrays, full):
+        assert meta['alpha'] == self._alpha, "the buffer was saved with a different alpha"
+        super()._restore(meta, arrays, full)
+        self._it_sum = SumSegmentTree(self._it_sum._capacity)
+        self._it_min = MinSegmentTree(self._it_min._capacity)
+        if len(self) > 0:
+            self._it_sum[np.arange(len(self))] = arrays['priorities']
+            self._it_min[np.arange(len(self))] = arrays['priorities']
+        self._max_priority = meta['max_priority']
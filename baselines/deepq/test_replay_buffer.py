@@ -0,0 +1,177 @@
+import numpy as np
+
+from baselines.deepq.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+
+
+def _fill(buf, n, obs_shape=(3, 2)):
+    for i in range(n):
+        obs = np.full(obs_shape, i, dtype=np.uint8)
+        buf.add(obs, i % 4, float(i), obs + 1, float(i % 7 == 0))
+
+
+def test_array_storage_matches_list_storage():
+    list_buf = ReplayBuffer(10)
+    array_buf = ReplayBuffer(10, storage='array')
+    _fill(list_buf, 25)
+    _fill(array_buf, 25)
+    assert len(list_buf) == len(array_buf) == 10
+
+    idxes = np.arange(10)
+    for expected, actual in zip(list_buf._encode_sample(idxes), array_buf._encode_sample(idxes)):
+        assert expected.shape == actual.shape
+        assert expected.dtype == actual.dtype
+        np.testing.assert_array_equal(expected, actual)
+
+
+def test_array_storage_sample():
+    buf = ReplayBuffer(100, storage='array')
+    _fill(buf, 30)
+    obses_t, actions, rewards, obses_tp1, dones = buf.sample(16)
+    assert obses_t.shape == (16, 3, 2) and obses_t.dtype == np.uint8
+    assert actions.shape == rewards.shape == dones.shape == (16,)
+    np.testing.assert_array_equal(obses_t[:, 0, 0], rewards)
+    np.testing.assert_array_equal(obses_tp1, obses_t + 1)
+    assert rewards.max() < 30
+
+
+def test_prioritized_array_storage():
+    buf = PrioritizedReplayBuffer(8, alpha=0.6, storage='array')
+    _fill(buf, 12)
+    experience = buf.sample(4, beta=0.4)
+    assert len(experience) == 7
+    buf.update_priorities(experience[-1], np.ones(4) * 2.0)
+
+
+def test_prioritized_weights_and_update_priorities():
+    alpha, beta = 0.6, 0.4
+    buf = PrioritizedReplayBuffer(8, alpha=alpha, storage='array')
+    _fill(buf, 8)
+    priorities = np.arange(1.0, 9.0)
+    buf.update_priorities(np.arange(8), priorities)
+    assert buf._max_priority == 8.0
+    assert np.isclose(buf._it_sum.sum(), np.sum(priorities ** alpha))
+    assert np.isclose(buf._it_min.min(), 1.0)
+
+    *_, weights, idxes = buf.sample(64, beta=beta)
+    assert weights.dtype == np.float32 and weights.shape == (64,)
+    p_samples = priorities[idxes] ** alpha / np.sum(priorities ** alpha)
+    p_min = 1.0 / np.sum(priorities ** alpha)
+    np.testing.assert_allclose(weights, (p_samples / p_min) ** (-beta), rtol=1e-5)
+
+
+def test_frames_storage_matches_list_storage():
+    frame_stack = 4
+    list_buf = ReplayBuffer(20)
+    frames_buf = ReplayBuffer(20, storage='frames', frame_stack=frame_stack)
+
+    # mimic atari_wrappers.FrameStack on 2x2x2 frames, with episodes of varying length
+    frame_id = 0
+    for episode_length in [3, 1, 7, 2, 12, 5, 9]:
+        frame_id += 1
+        frames = [np.full((2, 2, 2), frame_id, dtype=np.uint8)] * frame_stack
+        for t in range(episode_length):
+            frame_id += 1
+            next_frames = frames[1:] + [np.full((2, 2, 2), frame_id, dtype=np.uint8)]
+            done = float(t == episode_length - 1)
+            for buf in [list_buf, frames_buf]:
+                buf.add(np.concatenate(frames, axis=-1), t, float(frame_id), np.concatenate(next_frames, axis=-1), done)
+            frames = next_frames
+    assert len(list_buf) == len(frames_buf) == 20
+
+    idxes = np.arange(20)
+    expected = list_buf._encode_sample(idxes)
+    actual = frames_buf._encode_sample(idxes)
+    for i in [0, 1, 2, 4]:
+        np.testing.assert_array_equal(expected[i], actual[i])
+    # obs_tp1 of a transition that ended an episode is not kept
+    not_done = expected[4] == 0
+    np.testing.assert_array_equal(expected[3][not_done], actual[3][not_done])
+
+
+def test_n_step_returns():
+    gamma = 0.5
+    buf = ReplayBuffer(8, storage='array', n_step=3, gamma=gamma)
+    # rewards are 1, 2, 3, ...; episodes end after the 3rd and 4th transitions
+    for i in range(10):
+        buf.add(np.array([i]), 0, float(i + 1), np.array([i + 1]), float(i in [2, 3]))
+    # slots hold transitions 8, 9, 2, 3, ..., 7
+    obses_t, _, returns, obses_tpn, dones, discounts = buf._encode_sample(np.arange(8))
+    np.testing.assert_array_equal(obses_t[:, 0], [8, 9, 2, 3, 4, 5, 6, 7])
+    expected = {
+        8: (9 + 0.5 * 10, 10, 0, gamma ** 2),  # stops at the newest transition
+        9: (10, 10, 0, gamma),
+        2: (3, 3, 1, gamma),  # stops at the end of the episode
+        3: (4, 4, 1, gamma),
+        4: (5 + 0.5 * 6 + 0.25 * 7, 7, 0, gamma ** 3),
+        7: (8 + 0.5 * 9 + 0.25 * 10, 10, 0, gamma ** 3),
+    }
+    for i, transition in enumerate(obses_t[:, 0]):
+        if transition in expected:
+            ret, obs_tpn, done, discount = expected[transition]
+            assert np.isclose(returns[i], ret)
+            assert obses_tpn[i, 0] == obs_tpn
+            assert dones[i] == done
+            assert np.isclose(discounts[i], discount)
+
+
+def test_n_step_frames_storage():
+    buf = ReplayBuffer(10, storage='frames', frame_stack=2, n_step=3, gamma=0.9)
+    frames = [np.zeros((1, 1), dtype=np.uint8)] * 2
+    for i in range(6):
+        next_frames = frames[1:] + [np.full((1, 1), i + 1, dtype=np.uint8)]
+        buf.add(np.concatenate(frames, axis=-1), 0, 1.0, np.concatenate(next_frames, axis=-1), 0.0)
+        frames = next_frames
+    _, _, returns, obses_tpn, dones, discounts = buf._encode_sample(np.array([0, 4]))
+    np.testing.assert_array_equal(obses_tpn[:, 0], [[2, 3], [5, 6]])
+    np.testing.assert_allclose(returns, [1 + 0.9 + 0.81, 1.9])
+    np.testing.assert_allclose(discounts, [0.9 ** 3, 0.9 ** 2])
+
+
+def test_update_priorities_skips_overwritten():
+    buf = PrioritizedReplayBuffer(4, alpha=1.0, storage='array')
+    _fill(buf, 4)
+    # two transitions added after sampling overwrite slots 0 and 1
+    _fill(buf, 2)
+    buf.update_priorities(np.arange(4), np.full(4, 3.0), num_added=2)
+    np.testing.assert_allclose(buf._it_sum[np.arange(4)], [1.0, 1.0, 3.0, 3.0])
+
+
+def test_storage_dir_reopen(tmpdir):
+    for storage in ['array', 'frames']:
+        storage_dir = str(tmpdir.join(storage))
+        buf = ReplayBuffer(10, storage=storage, frame_stack=2, storage_dir=storage_dir)
+        _fill(buf, 15, obs_shape=(2, 2))
+        expected = buf._encode_sample(np.arange(10))
+        del buf
+
+        buf = PrioritizedReplayBuffer(10, alpha=0.6, storage=storage, frame_stack=2, storage_dir=storage_dir)
+        assert len(buf) == 10
+        for x, y in zip(expected, buf._encode_sample(np.arange(10))):
+            np.testing.assert_array_equal(x, y)
+        # sampling reads the files in order but keeps the order of idxes
+        idxes = np.array([7, 2, 9, 0])
+        for x, y in zip(expected, buf._encode_sample(idxes)):
+            np.testing.assert_array_equal(x[idxes], y)
+        assert len(buf.sample(4, beta=0.4)) == 7
+
+
+def test_save_load(tmpdir):
+    for storage in ['list', 'array', 'frames']:
+        for compress in [False, True]:
+            path = str(tmpdir.join('{}_{}'.format(storage, compress)))
+            buf = PrioritizedReplayBuffer(10, alpha=0.6, storage=storage, frame_stack=2)
+            _fill(buf, 15, obs_shape=(2, 2))
+            buf.update_priorities(np.arange(10), np.arange(1.0, 11.0))
+            buf.save(path, compress=compress)
+            expected = buf.sample(6, beta=0.4)
+
+            restored = PrioritizedReplayBuffer(10, alpha=0.6, storage=storage, frame_stack=2)
+            restored.load(path)
+            assert len(restored) == 10
+            # the random state is restored along with the content
+            for x, y in zip(expected, restored.sample(6, beta=0.4)):
+                np.testing.assert_array_equal(x, y)
+            _fill(buf, 3, obs_shape=(2, 2))
+            _fill(restored, 3, obs_shape=(2, 2))
+            for x, y in zip(buf._encode_sample(np.arange(10)), restored._encode_sample(np.arange(10))):
+                np.testing.assert_array_equal(x, y)
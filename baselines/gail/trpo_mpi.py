@@ -18,6 +18,7 @@ from baselines.common import colorize
 from baselines.common.mpi_adam import MpiAdam
 from baselines.common.cg import cg
 from baselines.gail.statistics import stats
+from baselines.common.gae import gae
 
 
 def traj_segment_generator(pi, env, reward_giver, horizon, stochastic):
@@ -98,17 +99,8 @@ def traj_segment_generator(pi, env, reward_giver, horizon, stochastic):
 
 
 def add_vtarg_and_adv(seg, gamma, lam):
-    new = np.append(seg["new"], 0)  # last element is only used for last vtarg, but we already zeroed it if last new = 1
-    vpred = np.append(seg["vpred"], seg["nextvpred"])
-    T = len(seg["rew"])
-    seg["adv"] = gaelam = np.empty(T, 'float32')
-    rew = seg["rew"]
-    lastgaelam = 0
-    for t in reversed(range(T)):
-        nonterminal = 1-new[t+1]
-        delta = rew[t] + gamma * vpred[t+1] * nonterminal - vpred[t]
-        gaelam[t] = lastgaelam = delta + gamma * lam * nonterminal * lastgaelam
-    seg["tdlamret"] = seg["adv"] + seg["vpred"]
+    # the last vtarg bootstraps off nextvpred, which we already zeroed if the last new = 1
+    seg["adv"], seg["tdlamret"] = gae(seg["rew"], seg["vpred"], seg["new"], seg["nextvpred"], 0, gamma, lam)
 
 
 def learn(env, policy_func, reward_giver, expert_dataset, rank,
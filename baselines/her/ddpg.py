@@ -10,6 +10,7 @@ from baselines.her.util import (
 from baselines.her.normalizer import Normalizer
 from baselines.her.replay_buffer import ReplayBuffer
 from baselines.common.mpi_adam import MpiAdam
+from baselines.common.prefetch import PrefetchSampler
 from baselines.common import tf_util
 
 
@@ -25,7 +26,7 @@ class DDPG(object):
                  Q_lr, pi_lr, norm_eps, norm_clip, max_u, action_l2, clip_obs, scope, T,
                  rollout_batch_size, subtract_goals, relative_goals, clip_pos_returns, clip_return,
                  bc_loss, q_filter, num_demo, demo_batch_size, prm_loss_weight, aux_loss_weight,
-                 sample_transitions, gamma, reuse=False, **kwargs):
+                 sample_transitions, gamma, reuse=False, prefetch_batches=0, **kwargs):
         """Implementation of DDPG that is used in combination with Hindsight Experience Replay (HER).
             Added functionality to use demonstrations for training to Overcome exploration problem.
 
@@ -55,6 +56,8 @@ class DDPG(object):
             sample_transitions (function) function that samples from the replay buffer
             gamma (float): gamma used for Q learning updates
             reuse (boolean): whether or not the networks should be reused
+            prefetch_batches (int): number of batches sampled from the replay buffer ahead of time in a
+                background thread, 0 to sample synchronously
             bc_loss: whether or not the behavior cloning loss should be used as an auxilliary loss
             q_filter: whether or not a filter on the q value update should be used when training with demonstartions
             num_demo: Number of episodes in to be used in the demonstration buffer
@@ -102,6 +105,9 @@ class DDPG(object):
 
         buffer_size = (self.buffer_size // self.rollout_batch_size) * self.rollout_batch_size
         self.buffer = ReplayBuffer(buffer_shapes, buffer_size, self.T, self.sample_transitions)
+        if self.prefetch_batches > 0:
+            sample_size = self.batch_size - self.demo_batch_size if self.bc_loss else self.batch_size
+            self.buffer = PrefetchSampler(self.buffer, sample_size, num_batches=self.prefetch_batches)
 
         global DEMO_BUFFER
         DEMO_BUFFER = ReplayBuffer(buffer_shapes, buffer_size, self.T, self.sample_transitions) #initialize the demo buffer; in the same way as the primary data buffer
@@ -2,6 +2,8 @@ import threading
 
 import numpy as np
 
+from baselines.common.buffer_io import save_arrays, load_arrays
+
 
 class ReplayBuffer:
     def __init__(self, buffer_shapes, size_in_transitions, T, sample_transitions):
@@ -86,6 +88,24 @@ class ReplayBuffer:
         with self.lock:
             self.current_size = 0
 
+    def save(self, path, compress=False):
+        """Saves the stored episodes to a file, see baselines.common.buffer_io.
+        """
+        with self.lock:
+            arrays = [(key, buffer[:self.current_size]) for key, buffer in self.buffers.items()]
+            meta = {'size': self.size, 'T': self.T, 'current_size': self.current_size,
+                    'n_transitions_stored': self.n_transitions_stored}
+            save_arrays(path, arrays, meta, compress=compress)
+
+    def load(self, path):
+        """Replaces the stored episodes by the ones saved to path by save.
+        """
+        with self.lock:
+            meta, _ = load_arrays(path, lambda key, shape, dtype: self.buffers[key][:shape[0]])
+            assert (meta['size'], meta['T']) == (self.size, self.T), "the buffer was saved with a different size"
+            self.current_size = meta['current_size']
+            self.n_transitions_stored = meta['n_transitions_stored']
+
     def _get_storage_idx(self, inc=None):
         inc = inc or 1   # size increment
         assert inc <= self.size, "Batch committed to replay is too large!"
@@ -0,0 +1,38 @@
+import numpy as np
+
+from baselines.her.her_sampler import make_sample_her_transitions
+from baselines.her.replay_buffer import ReplayBuffer
+
+
+def _make_buffer(T=5, size_in_episodes=4):
+    buffer_shapes = {'o': (T + 1, 3), 'ag': (T + 1, 2), 'g': (T, 2), 'u': (T, 2)}
+    sample_transitions = make_sample_her_transitions('future', 4, lambda ag_2, g, info: -np.abs(ag_2 - g).sum(axis=-1))
+    return ReplayBuffer(buffer_shapes, size_in_episodes * T, T, sample_transitions)
+
+
+def _store_episodes(buffer, num_episodes, start=0):
+    for i in range(start, start + num_episodes):
+        episode = {key: np.full((1,) + shape, i, dtype=np.float64) + np.random.randn(1, *shape)
+                   for key, shape in buffer.buffer_shapes.items()}
+        buffer.store_episode(episode)
+
+
+def test_replay_buffer_save_load(tmpdir):
+    path = str(tmpdir.join('buffer'))
+    buffer = _make_buffer()
+    # more episodes than fit, so that some are stored at random places
+    _store_episodes(buffer, 6)
+    buffer.save(path, compress=True)
+    expected_batch = buffer.sample(8)
+
+    restored = _make_buffer()
+    restored.load(path)
+    assert restored.get_current_episode_size() == buffer.get_current_episode_size() == 4
+    assert restored.get_transitions_stored() == buffer.get_transitions_stored()
+    for key in buffer.buffers:
+        np.testing.assert_array_equal(buffer.buffers[key], restored.buffers[key])
+    # the random state of the sampler is restored as well
+    batch = restored.sample(8)
+    assert sorted(batch) == sorted(expected_batch)
+    for key in batch:
+        np.testing.assert_array_equal(expected_batch[key], batch[key])
@@ -25,7 +25,7 @@ class Model(object):
     - Save load the model
     """
     def __init__(self, *, policy, ob_space, ac_space, nbatch_act, nbatch_train,
-                nsteps, ent_coef, vf_coef, max_grad_norm, scope, microbatch_size=None):
+                nsteps, ent_coef, vf_coef, max_grad_norm, scope, microbatch_size=None, nbatch_pair=None):
         
         self.sess = sess = get_session()
         self.scope = scope
@@ -36,6 +36,9 @@ class Model(object):
                 # act_model that is used for sampling
                 act_model = policy(nbatch_act, 1, sess)
 
+                # pair_model samples the actions of both agents of a two-player env in one pass
+                pair_model = policy(nbatch_pair, 1, sess) if nbatch_pair else None
+
                 # Train model for training
                 if microbatch_size is None:
                     train_model = policy(nbatch_train, nsteps, sess)
@@ -119,6 +122,7 @@ class Model(object):
 
         self.train_model = train_model
         self.act_model = act_model
+        self.pair_model = pair_model
         self.step = act_model.step
         self.value = act_model.value
         self.initial_state = act_model.initial_state
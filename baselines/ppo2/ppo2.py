@@ -5,6 +5,7 @@ import os.path as osp
 from collections import deque
 from baselines.common import explained_variance, set_global_seeds
 from baselines.common.policies import build_policy
+from baselines.common.vec_env import AsyncSubprocVecEnv
 try:
     from mpi4py import MPI
 except ImportError:
@@ -21,7 +22,7 @@ def constfn(val):
 def learn(*, network, env, total_timesteps, early_stopping = False, eval_env = None, seed=None, nsteps=2048, ent_coef=0.0, lr=3e-4,
             vf_coef=0.5,  max_grad_norm=0.5, gamma=0.99, lam=0.95,
             log_interval=10, nminibatches=4, noptepochs=4, cliprange=0.2,
-            save_interval=0, load_path=None, model_fn=None, scope='', **network_kwargs):
+            save_interval=0, load_path=None, model_fn=None, scope='', double_buffer=False, **network_kwargs):
     '''
     Learn policy using PPO algorithm (https://arxiv.org/abs/1707.06347)
 
@@ -70,6 +71,10 @@ def learn(*, network, env, total_timesteps, early_stopping = False, eval_env = N
 
     load_path: str                    path to load the model from
 
+    double_buffer: bool               compute the actions of one half of the envs while the other half steps (see
+                                      AbstractEnvRunner._rollout_double_buffered). Needs an AsyncSubprocVecEnv and a
+                                      feed-forward policy.
+
     **network_kwargs:                 keyword arguments to the policy / network builder. See baselines.common/policies.py/build_policy and arguments to a particular type of network
                                       For instance, 'mlp' network architecture has arguments num_hidden and num_layers.
 
@@ -111,14 +116,20 @@ def learn(*, network, env, total_timesteps, early_stopping = False, eval_env = N
         from baselines.ppo2.model import Model
         model_fn = Model
 
-    model = model_fn(policy=policy, ob_space=ob_space, ac_space=ac_space, nbatch_act=nenvs, nbatch_train=nbatch_train,
+    # with an AsyncSubprocVecEnv, the act model is run on the batches of envs returned by recv,
+    # or on half of the envs at a time with double_buffer
+    nbatch_act = None if isinstance(env, AsyncSubprocVecEnv) else nenvs
+    # in Overcooked, the trained agent and its self-play partner act in one pass
+    overcooked = 'env_name' in env.__dict__.keys() and env.env_name == "Overcooked-v0"
+    model_kwargs = {'nbatch_pair': 2 * nenvs} if overcooked and not env.joint_action_model else {}
+    model = model_fn(policy=policy, ob_space=ob_space, ac_space=ac_space, nbatch_act=nbatch_act, nbatch_train=nbatch_train,
                     nsteps=nsteps, ent_coef=ent_coef, vf_coef=vf_coef,
-                    max_grad_norm=max_grad_norm, scope=scope)
+                    max_grad_norm=max_grad_norm, scope=scope, **model_kwargs)
 
     if load_path is not None:
         model.load(load_path)
     # Instantiate the runner object
-    runner = Runner(env=env, model=model, nsteps=nsteps, gamma=gamma, lam=lam)
+    runner = Runner(env=env, model=model, nsteps=nsteps, gamma=gamma, lam=lam, double_buffer=double_buffer)
     if eval_env is not None:
         eval_runner = Runner(env = eval_env, model = model, nsteps = nsteps, gamma = gamma, lam= lam)
 
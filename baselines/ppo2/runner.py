@@ -1,5 +1,6 @@
 import numpy as np
-from baselines.common.runners import AbstractEnvRunner
+from baselines.common.runners import AbstractEnvRunner, RolloutStorage, space_spec
+from baselines.common.gae import gae
 
 class Runner(AbstractEnvRunner):
     """
@@ -10,16 +11,33 @@ class Runner(AbstractEnvRunner):
     run():
     - Make a mini batch
     """
-    def __init__(self, *, env, model, nsteps, gamma, lam):
-        super().__init__(env=env, model=model, nsteps=nsteps)
+    def __init__(self, *, env, model, nsteps, gamma, lam, double_buffer=False):
+        super().__init__(env=env, model=model, nsteps=nsteps, double_buffer=double_buffer)
         # Lambda used in GAE (General Advantage Estimation)
         self.lam = lam
         # Discount rate
         self.gamma = gamma
+        # The mb of experiences are written in place, env-major so that the trainer gets views
+        self.storage = RolloutStorage(self.nenv, nsteps, {
+            'obs': (self.obs.shape[1:], self.obs.dtype),
+            'actions': space_spec(env.action_space),
+            'rewards': ((), np.float32),
+            'values': ((), np.float32),
+            'neglogpacs': ((), np.float32),
+            'dones': ((), bool),
+            'returns': ((), np.float32),
+            'advs': ((), np.float32),
+        })
 
     def run(self):
-        # Here, we init the lists that will contain the mb of experiences
-        mb_obs, mb_rewards, mb_actions, mb_values, mb_dones, mb_neglogpacs = [],[],[],[],[],[]
+        if self.double_buffer:
+            epinfos = self._rollout_double_buffered(self.storage)
+            return self._finish_rollout(self.states, epinfos)
+        if self.async_env:
+            epinfos = self._rollout_async(self.storage)
+            return self._finish_rollout(self.states, epinfos)
+
+        storage = self.storage
         mb_states = self.states
         epinfos = []
         # For n in range number of steps
@@ -27,67 +45,41 @@ class Runner(AbstractEnvRunner):
         import time
         tot_time = time.time()
         int_time = 0
-        num_envs = len(self.curr_state)
+        num_envs = self.nenv
+        overcooked = 'env_name' in self.env.__dict__.keys() and self.env.env_name == "Overcooked-v0"
 
-        if self.env.trajectory_sp:
+        if overcooked and self.env.trajectory_sp:
             # Selecting which environments should run fully in self play
             sp_envs_bools = np.random.random(num_envs) < self.env.self_play_randomization
             print("SP envs: {}/{}".format(sum(sp_envs_bools), num_envs))
 
         other_agent_simulation_time = 0
-        for _ in range(self.nsteps):
+        for t in range(self.nsteps):
 
             # Given observations, get action value and neglopacs
             # We already have self.obs because Runner superclass run self.obs[:] = env.reset() on init
-            overcooked = 'env_name' in self.env.__dict__.keys() and self.env.env_name == "Overcooked-v0"
             if overcooked:
-                actions, values, self.states, neglogpacs = self.model.step(self.obs0, S=self.states, M=self.dones)
-
                 if not self.env.joint_action_model:
-                    import time
-                    current_simulation_time = time.time()
-                
                     p_self_play = self.env.self_play_randomization
 
                     # Randomize at either the trajectory level or the individual timestep level
                     if self.env.trajectory_sp:
-
-                        if sum(sp_envs_bools) != num_envs: # Compute BC actions if some num of envs not running in BC
-                            # Get actions through the action method of the agent
-                            from hr_coordination.mdp.overcooked_mdp import Action
-                            other_agent_actions_bc = self.env.other_agent.action(self.curr_state, self.other_agent_idx)
-                            other_agent_actions_bc = [Action.ACTION_TO_INDEX[a] for a in other_agent_actions_bc]
-
-                        if sum(sp_envs_bools) != 0: # Compute SP actions if some num of envs is supposed to run in SP
-                            other_agent_actions_sp, _, _, _ = self.model.step(self.obs1, S=self.states, M=self.dones)
-
-                        other_agent_actions = []
-                        for i in range(num_envs):
-                            if sp_envs_bools[i]:
-                                sp_action = other_agent_actions_sp[i]
-                                other_agent_actions.append(sp_action)
-                            else:
-                                bc_action = other_agent_actions_bc[i]
-                                other_agent_actions.append(bc_action)
-                    
+                        self_play_bools = sp_envs_bools
+                    elif p_self_play > 0:
+                        self_play_bools = np.random.random(num_envs) < p_self_play
                     else:
-                        other_agent_actions = np.zeros_like(self.curr_state)
-
-                        if p_self_play < 1:
-                            # Get actions through the action method of the agent
-                            from hr_coordination.mdp.overcooked_mdp import Action
-                            other_agent_actions = self.env.other_agent.action(self.curr_state, self.other_agent_idx)
-                            other_agent_actions = [Action.ACTION_TO_INDEX[a] for a in other_agent_actions]
+                        self_play_bools = np.zeros(num_envs, dtype=bool)
 
-                        # Naive non-parallelized way of getting actions for other
-                        if p_self_play > 0:
-                            self_play_actions, _, _, _ = self.model.step(self.obs1, S=self.states, M=self.dones)
-                            self_play_bools = np.random.random(num_envs) < p_self_play
+                    # One forward pass for both agents if some envs run in self play
+                    if self_play_bools.any():
+                        actions, values, self.states, neglogpacs, self_play_actions = self._step_both_agents()
+                    else:
+                        actions, values, self.states, neglogpacs = self.model.step(self.obs0, S=self.states, M=self.dones)
+                        self_play_actions = 0
 
-                            for i in range(num_envs):
-                                is_self_play_action = self_play_bools[i]
-                                if is_self_play_action:
-                                    other_agent_actions[i] = self_play_actions[i]
+                    current_simulation_time = time.time()
+                    other_agent_actions = self._mix_other_agent_actions(self_play_bools, self_play_actions)
+                    other_agent_simulation_time += time.time() - current_simulation_time
 
                     # NOTE: This has been discontinued as now using .other_agent_true takes about the same amount of time
                     # elif self.env.other_agent_bc:
@@ -96,22 +88,18 @@ class Runner(AbstractEnvRunner):
                     #     player_featurizes_states = [s[idx] for s, idx in zip(featurized_states, self.other_agent_idx)]
                     #     other_agent_actions = self.env.other_agent.direct_policy(player_featurizes_states, sampled=True, no_wait=True)
 
-                    other_agent_simulation_time += time.time() - current_simulation_time
+                    joint_action = list(zip(actions, other_agent_actions))
 
-                    joint_action = [(actions[i], other_agent_actions[i]) for i in range(len(actions))]
-                    
                 else:
+                    actions, values, self.states, neglogpacs = self.model.step(self.obs0, S=self.states, M=self.dones)
                     joint_action = actions
 
-                mb_obs.append(self.obs0.copy())
+                storage.put(t, obs=self.obs0)
             else:
                 actions, values, self.states, neglogpacs = self.model.step(self.obs, S=self.states, M=self.dones)
-                mb_obs.append(self.obs.copy())
+                storage.put(t, obs=self.obs)
 
-            mb_actions.append(actions)
-            mb_values.append(values)
-            mb_neglogpacs.append(neglogpacs)
-            mb_dones.append(self.dones)
+            storage.put(t, actions=actions, values=values, neglogpacs=neglogpacs, dones=self.dones)
 
             # Take actions in env and look the results
             # Infos contains a ton of useful informations
@@ -149,36 +137,64 @@ class Runner(AbstractEnvRunner):
             for info in infos:
                 maybeepinfo = info.get('episode')
                 if maybeepinfo: epinfos.append(maybeepinfo)
-            mb_rewards.append(rewards)
+            storage.put(t, rewards=rewards)
 
         print("Other agent actions took", other_agent_simulation_time, "seconds")
         tot_time = time.time() - tot_time
         print("Total simulation time for {} steps: {} \t Other agent action time: {} \t {} steps/s".format(self.nsteps, tot_time, int_time, self.nsteps / tot_time))
-        
-        #batch of steps to batch of rollouts
-        mb_obs = np.asarray(mb_obs, dtype=self.obs.dtype)
-        mb_rewards = np.asarray(mb_rewards, dtype=np.float32)
-        mb_actions = np.asarray(mb_actions)
-        mb_values = np.asarray(mb_values, dtype=np.float32)
-        mb_neglogpacs = np.asarray(mb_neglogpacs, dtype=np.float32)
-        mb_dones = np.asarray(mb_dones, dtype=np.bool)
+        return self._finish_rollout(mb_states, epinfos)
+
+    def _step_both_agents(self):
+        """
+        Run the policy on the observations of both Overcooked agents in one pass.
+
+        Returns the actions, values, states and neglogpacs of the agent being
+        trained, and the self-play actions of the other agent.
+        """
+        nenv = self.nenv
+        pair_model = getattr(self.model, 'pair_model', None)
+        if pair_model is None:
+            actions, values, states, neglogpacs = self.model.step(self.obs0, S=self.states, M=self.dones)
+            self_play_actions, _, _, _ = self.model.step(self.obs1, S=self.states, M=self.dones)
+            return actions, values, states, neglogpacs, self_play_actions
+        # the other agent acts from the states of the trained one, which it does not update
+        states = None if self.states is None else np.concatenate([self.states, self.states])
+        both_actions, values, states, neglogpacs = pair_model.step(
+            np.concatenate([self.obs0, self.obs1]), S=states, M=np.concatenate([self.dones, self.dones]))
+        states = None if states is None else states[:nenv]
+        return both_actions[:nenv], values[:nenv], states, neglogpacs[:nenv], both_actions[nenv:]
+
+    def _other_agent_actions(self):
+        """
+        The action indices of the other agent of the env (e.g. a BC agent) in all the envs.
+
+        Agents with an action_indices(states, agent_idxs) method return them for the whole
+        batch, otherwise the actions of their action method are converted to indices.
+        """
+        other_agent = self.env.other_agent
+        if hasattr(other_agent, 'action_indices'):
+            return np.asarray(other_agent.action_indices(self.curr_state, self.other_agent_idx))
+        from hr_coordination.mdp.overcooked_mdp import Action
+        other_agent_actions = other_agent.action(self.curr_state, self.other_agent_idx)
+        return np.array([Action.ACTION_TO_INDEX[a] for a in other_agent_actions])
+
+    def _mix_other_agent_actions(self, self_play_bools, self_play_actions):
+        """
+        The actions of the other agent: its self-play actions in the envs of
+        self_play_bools, the actions of the env's other agent elsewhere.
+        """
+        if self_play_bools.all():
+            return self_play_actions
+        return np.where(self_play_bools, self_play_actions, self._other_agent_actions())
+
+    def _finish_rollout(self, mb_states, epinfos):
+        storage = self.storage
         last_values = self.model.value(self.obs, S=self.states, M=self.dones)
 
-        # discount/bootstrap off value fn
-        mb_returns = np.zeros_like(mb_rewards)
-        mb_advs = np.zeros_like(mb_rewards)
-        lastgaelam = 0
-        for t in reversed(range(self.nsteps)):
-            if t == self.nsteps - 1:
-                nextnonterminal = 1.0 - self.dones
-                nextvalues = last_values
-            else:
-                nextnonterminal = 1.0 - mb_dones[t+1]
-                nextvalues = mb_values[t+1]
-            delta = mb_rewards[t] + self.gamma * nextvalues * nextnonterminal - mb_values[t]
-            mb_advs[t] = lastgaelam = delta + self.gamma * self.lam * nextnonterminal * lastgaelam
-        mb_returns = mb_advs + mb_values
-        return (*map(sf01, (mb_obs, mb_returns, mb_dones, mb_actions, mb_values, mb_neglogpacs)),
+        # discount/bootstrap off value fn, time-major views of the env-major storage
+        gae(storage.rewards.T, storage.values.T, storage.dones.T, last_values, self.dones, self.gamma, self.lam,
+            advs=storage.advs.T, returns=storage.returns.T)
+        return (*map(storage.flat, ('obs', 'returns', 'dones', 'actions', 'values', 'neglogpacs')),
             mb_states, epinfos)
 # obs, returns, masks, actions, values, neglogpacs, states = runner.run()
 def sf01(arr):
@@ -0,0 +1,87 @@
+import gym
+import numpy as np
+import pytest
+
+from baselines.ppo2.runner import Runner
+
+
+class StubModel(object):
+    """A deterministic model with the step method of the ppo2 act models, for batches of nbatch."""
+    def __init__(self, nbatch, initial_state=None):
+        self.nbatch = nbatch
+        self.initial_state = initial_state
+
+    def step(self, obs, S=None, M=None):
+        assert len(obs) == len(M) == self.nbatch
+        actions = obs.sum(axis=1).astype(np.int64) % 6
+        states = None if S is None else S + obs[:, :1]
+        return actions, obs.mean(axis=1), states, obs[:, 0]
+
+
+class StubAgent(object):
+    """An other agent with the batched action_indices interface."""
+    def action_indices(self, states, agent_idxs):
+        return (states + agent_idxs) % 6
+
+
+class StubOvercookedEnv(object):
+    """
+    A vec env with the observations of the Overcooked envs: for every env, the
+    observations of both agents, and the state with the index of the other agent.
+    """
+    def __init__(self, nenv, ob_size=5):
+        self.env_name = "Overcooked-v0"
+        self.num_envs = nenv
+        self.observation_space = gym.spaces.Box(low=0, high=10, shape=(ob_size,), dtype=np.float32)
+        self.action_space = gym.spaces.Discrete(6)
+        self.other_agent = StubAgent()
+        self.joint_action_model = False
+        self.trajectory_sp = False
+        self.self_play_randomization = 0.
+        self.rng = np.random.RandomState(0)
+
+    def reset(self):
+        nenv, ob_shape = self.num_envs, self.observation_space.shape
+        both_obs_and_state_and_other_idx = np.empty((nenv, 2, 2), dtype=object)
+        for i in range(nenv):
+            for agent in range(2):
+                both_obs_and_state_and_other_idx[i, 0, agent] = self.rng.randint(0, 10, size=ob_shape).astype(np.float32)
+            both_obs_and_state_and_other_idx[i, 1] = i, i % 2
+        return both_obs_and_state_and_other_idx
+
+
+def make_runner(nenv, pair_model, recurrent):
+    initial_state = np.random.RandomState(1).randn(nenv, 3) if recurrent else None
+    model = StubModel(nenv, initial_state)
+    if pair_model:
+        model.pair_model = StubModel(2 * nenv)
+    return Runner(env=StubOvercookedEnv(nenv), model=model, nsteps=4, gamma=0.99, lam=0.95)
+
+
+@pytest.mark.parametrize('pair_model', (True, False))
+@pytest.mark.parametrize('recurrent', (True, False))
+def test_step_both_agents(pair_model, recurrent):
+    """
+    Test that the fused pass over both Overcooked agents, and the mixing
+    of self-play and other agent actions, give the same results as
+    separate passes and a per-env loop.
+    """
+    nenv = 6
+    runner = make_runner(nenv, pair_model, recurrent)
+    model = StubModel(nenv)
+    expected = model.step(runner.obs0, S=runner.states, M=runner.dones)
+    expected_self_play, _, _, _ = model.step(runner.obs1, S=runner.states, M=runner.dones)
+
+    actions, values, states, neglogpacs, self_play_actions = runner._step_both_agents()
+    for expected_arr, arr in zip(expected, (actions, values, states, neglogpacs)):
+        if expected_arr is None:
+            assert arr is None
+        else:
+            np.testing.assert_array_equal(expected_arr, arr)
+    np.testing.assert_array_equal(expected_self_play, self_play_actions)
+
+    bc_actions = StubAgent().action_indices(runner.curr_state, runner.other_agent_idx)
+    for self_play_bools in [np.ones(nenv, dtype=bool), np.arange(nenv) % 3 == 0]:
+        mixed = runner._mix_other_agent_actions(self_play_bools, self_play_actions)
+        expected_mixed = [expected_self_play[i] if self_play_bools[i] else bc_actions[i] for i in range(nenv)]
+        np.testing.assert_array_equal(expected_mixed, mixed)
@@ -62,6 +62,11 @@ def train(args, extra_args):
     alg_kwargs.update(extra_args)
 
     env = build_env(args)
+    vec_normalize = get_vec_normalize(env)
+    if vec_normalize is not None and alg_kwargs.get('load_path') is not None:
+        stats_path = osp.expanduser(alg_kwargs['load_path']) + '.vecnormalize'
+        if osp.exists(stats_path):
+            vec_normalize.load(stats_path)
     if args.save_video_interval != 0:
         env = VecVideoRecorder(env, osp.join(logger.get_dir(), "videos"), record_video_trigger=lambda x: x % args.save_video_interval == 0, video_length=args.save_video_length)
 
@@ -99,7 +104,10 @@ def build_env(args):
             env = make_env(env_id, env_type, seed=seed)
         else:
             frame_stack_size = 4
-            env = make_vec_env(env_id, env_type, nenv, seed, gamestate=args.gamestate, reward_scale=args.reward_scale)
+            env = make_vec_env(env_id, env_type, nenv, seed, gamestate=args.gamestate, reward_scale=args.reward_scale,
+                               num_workers=args.num_env_workers, pin_workers=args.pin_env_workers,
+                               worker_threads=args.env_worker_threads, context=args.env_context,
+                               max_restarts=args.max_env_restarts, step_timeout=args.env_step_timeout)
             env = VecFrameStack(env, frame_stack_size)
 
     else:
@@ -110,7 +118,10 @@ def build_env(args):
         get_session(config=config)
 
         flatten_dict_observations = alg not in {'her'}
-        env = make_vec_env(env_id, env_type, args.num_env or 1, seed, reward_scale=args.reward_scale, flatten_dict_observations=flatten_dict_observations)
+        env = make_vec_env(env_id, env_type, args.num_env or 1, seed, reward_scale=args.reward_scale, flatten_dict_observations=flatten_dict_observations,
+                           num_workers=args.num_env_workers, pin_workers=args.pin_env_workers,
+                           worker_threads=args.env_worker_threads, context=args.env_context,
+                           max_restarts=args.max_env_restarts, step_timeout=args.env_step_timeout)
 
         if env_type == 'mujoco':
             env = VecNormalize(env)
@@ -118,6 +129,15 @@ def build_env(args):
     return env
 
 
+def get_vec_normalize(env):
+    """The VecNormalize wrapper of env, found through the chain of wrappers (e.g. VecVideoRecorder), or None."""
+    while isinstance(env, VecEnv):
+        if isinstance(env, VecNormalize):
+            return env
+        env = getattr(env, 'venv', None)
+    return None
+
+
 def get_env_type(args):
     env_id = args.env
 
@@ -212,9 +232,15 @@ def main(args):
     if args.save_path is not None and rank == 0:
         save_path = osp.expanduser(args.save_path)
         model.save(save_path)
+        vec_normalize = get_vec_normalize(env)
+        if vec_normalize is not None:
+            vec_normalize.save(save_path + '.vecnormalize')
 
     if args.play:
         logger.log("Running trained model")
+        vec_normalize = get_vec_normalize(env)
+        if vec_normalize is not None:
+            vec_normalize.training = False
         obs = env.reset()
 
         state = model.initial_state if hasattr(model, 'initial_state') else None